@@ -0,0 +1,122 @@
+"""Проверка асинхронной базы: нажатия разных пользователей идут одновременно.
+
+Каждый пользователь открывает день в своём календаре; год смен
+пользователя ещё не в памяти и читается с "медленного диска" (sleep в
+потоке базы). Сравнивается прежняя схема - sqlite3 прямо в обработчике,
+в цикле событий - и AsyncDatabase как в bot.py по умолчанию (без пула
+чтения, DB_READ_POOL_SIZE=0) и с пулом чтения на WAL. Считаются чтения
+базы, шедшие одновременно, и самая долгая остановка цикла событий: с
+AsyncDatabase цикл не должен стоять во время чтения в обеих настройках,
+а чтения пересекаться - только с пулом: без него они идут по очереди в
+потоке записи.
+
+Запуск: python -m benchmarks.async_database
+"""
+
+import asyncio
+import os
+import tempfile
+import threading
+import time
+
+from benchmarks.common import ticker
+from benchmarks.fake_bot import FakeBot, callback_update
+from database.async_database import AsyncDatabase
+from database.database import Database
+from my_calendar.callback_codec import encode_callback
+from my_calendar.telegram_calendar import Calendar
+
+USERS = 50
+READ_POOL = 4
+DISK = 0.05  # Задержка чтения года с диска, с
+
+
+class SlowDatabase(Database):
+    """База с медленным чтением; считает чтения, идущие одновременно"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reading = 0
+        self.max_reading = 0
+        self._counter_lock = threading.Lock()
+
+    def get_year_bitmaps(self, user_ids, year):
+        with self._counter_lock:
+            self.reading += 1
+            self.max_reading = max(self.max_reading, self.reading)
+        try:
+            time.sleep(DISK)
+            return super().get_year_bitmaps(user_ids, year)
+        finally:
+            with self._counter_lock:
+                self.reading -= 1
+
+
+class BlockingDatabase(AsyncDatabase):
+    """Прежняя схема: методы Database выполняются прямо в цикле событий"""
+
+    async def run(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    async def _read(self, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+
+async def run(name, wrapper, **options):
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_db = SlowDatabase(os.path.join(tmp, "calendar.db"), **options)
+        db = wrapper(sync_db)
+        for user_id in range(1, USERS + 1):
+            await db.add_event(user_id, "2024-10-17", user_id % 2 == 0)
+        calendar_instance = Calendar(db)
+        bot = FakeBot(latency=0.005)
+        data = encode_callback("day", 2024, 10, 17)
+
+        stop = asyncio.Event()
+        gaps = []
+        ticks = asyncio.create_task(ticker(stop, gaps))
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                calendar_instance.calendar_callback(
+                    callback_update(user_id, user_id, data, bot), None
+                )
+                for user_id in range(1, USERS + 1)
+            )
+        )
+        # Экран дня рисуется и отправляется правкой в фоне
+        await calendar_instance.wait_edits()
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await ticks
+        await db.close()
+
+    shown = sum(1 for method, _ in bot.calls if method == "edit_message_text")
+    print(
+        f"{name:>24}: {USERS} нажатий за {elapsed * 1000:6.0f} мс, "
+        f"одновременных чтений до {sync_db.max_reading}, "
+        f"цикл событий стоял до {max(gaps) * 1000:5.1f} мс"
+    )
+    assert shown == USERS
+    return sync_db.max_reading, max(gaps)
+
+
+async def main():
+    print(f"Чтение года с диска {DISK * 1000:.0f} мс")
+    blocking, blocking_gap = await run("sqlite3 в цикле событий", BlockingDatabase)
+    serial, serial_gap = await run("AsyncDatabase без пула", AsyncDatabase)
+    overlap, gap = await run(
+        f"AsyncDatabase, пул {READ_POOL}",
+        AsyncDatabase,
+        journal_mode="WAL",
+        read_pool_size=READ_POOL,
+    )
+    assert blocking == 1 and blocking_gap >= DISK
+    # Настройка bot.py по умолчанию: чтения по очереди, но не в цикле событий
+    assert serial == 1 and serial_gap < DISK, "цикл событий стоял во время чтения"
+    assert overlap > 1, "чтения разных пользователей не пересеклись"
+    assert gap < DISK, "цикл событий стоял во время чтения базы"
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
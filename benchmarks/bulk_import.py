@@ -0,0 +1,207 @@
+"""Бенчмарк загрузки графика из файла против ввода по одной смене.
+
+Генерирует CSV-график 2/2/4 на год для USERS пользователей (колонки
+user_id;дата;смена, как выгружает отдел кадров) и загружает его через
+import_file одной транзакцией. Для сравнения часть тех же смен пишется
+старым путём - add_event с коммитом на каждую смену, как при вводе
+кнопками. Затем тот же файл загружается через AsyncDatabase, пока другой
+пользователь отмечает смены: разбор целиком в потоке записи (как раньше)
+против import_batches, который отдаёт в поток записи готовые пачки.
+Сравнивается самая долгая запись смены за время загрузки. В конце
+проверяет, что .ics из ShiftExport загружается обратно и что названия
+событий вроде "Holiday" или "Выходной день" не считаются сменами, и
+что прерванная загрузка (битая кодировка в конце файла, ошибка записи
+пачки) честно сообщает, сколько смен успело записаться.
+
+Запуск: python -m benchmarks.bulk_import [пользователей, по умолчанию 300]
+"""
+
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from database.async_database import AsyncDatabase
+from database.database import Database, writes
+from my_calendar.export import ShiftExport
+from my_calendar.importer import ImportReport, import_batches, import_file, parse_ics
+from server.metrics import ERRORS
+
+YEAR = 2025
+CYCLE = ["д", "д", "н", "н", "", "", "", ""]
+PER_ROW_SHIFTS = 2000
+# Название события -> смена (None - не смена)
+ICS_SUMMARIES = {
+    "Дневная смена": True,
+    "Ночь": False,
+    "Night shift 🌙": False,
+    "Day": True,
+    "Выходной день": None,
+    "Day off": None,
+    "Holiday": None,
+    "Birthday": None,
+    "Monday meeting": None,
+}
+
+
+def ics_events(summaries):
+    yield "BEGIN:VCALENDAR"
+    for i, summary in enumerate(summaries, 1):
+        yield "BEGIN:VEVENT"
+        yield f"DTSTART;VALUE=DATE:{YEAR}01{i:02d}"
+        yield f"SUMMARY:{summary}"
+        yield "END:VEVENT"
+    yield "END:VCALENDAR"
+
+
+def write_roster(path, users):
+    shifts = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write("user_id;дата;смена\n")
+        for user_id in range(1, users + 1):
+            day = date(YEAR, 1, 1)
+            while day.year == YEAR:
+                shift = CYCLE[(day.toordinal() + user_id) % len(CYCLE)]
+                f.write(f"{user_id};{day.strftime('%d.%m.%Y')};{shift}\n")
+                shifts += bool(shift)
+                day += timedelta(days=1)
+    return shifts
+
+
+class FailingDatabase(Database):
+    """База, в которой вторая пачка загрузки не записывается"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.imports = 0
+
+    @writes
+    def import_events(self, rows):
+        self.imports += 1
+        if self.imports == 2:
+            # Значение, которое sqlite3 не запишет: транзакция пачки откатится
+            rows = [*rows, (1, f"{YEAR}-01-01", object())]
+        return super().import_events(rows)
+
+
+async def interrupted(tmp, roster):
+    """Прерванные загрузки: в отчёте причина и ровно то, что есть в базе"""
+    broken = os.path.join(tmp, "broken.csv")
+    shutil.copy(roster, broken)
+    with open(broken, "ab") as f:
+        f.write(b"1;01.01.2026;\xff\xfe\n")
+    for name, database, path in (
+        ("битая кодировка", Database, broken),
+        ("ошибка записи", FailingDatabase, roster),
+    ):
+        sync_db = database(os.path.join(tmp, f"{name}.db"))
+        db = AsyncDatabase(sync_db)
+        db_errors = ERRORS.value("db")
+        report = await import_batches(db, path, "csv", 1, True)
+        db_errors = ERRORS.value("db") - db_errors
+        stored = sync_db.conn.execute("SELECT count(*) FROM events").fetchone()[0]
+        await db.close()
+        print(f"{name:>16}: в базе {stored} смен, ответ: {report.summary()}")
+        assert report.failed and report.imported == stored > 0
+        assert str(stored) in report.summary()
+        # Ошибка базы видна в метрике bot_errors_total{source="db"}
+        assert db_errors == (database is FailingDatabase)
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    with tempfile.TemporaryDirectory() as tmp:
+        roster = os.path.join(tmp, "roster.csv")
+        shifts = write_roster(roster, users)
+        print(
+            f"График: {users} пользователей, {shifts} смен, "
+            f"{os.path.getsize(roster) / 1024:.0f} КБ"
+        )
+
+        sync_db = Database(os.path.join(tmp, "calendar.db"))
+        start = time.perf_counter()
+        report = import_file(sync_db, roster, "csv", 1, allow_other_users=True)
+        elapsed = time.perf_counter() - start
+        print(
+            f"    файл: {report.imported} смен за {elapsed:.2f} с "
+            f"({report.imported / elapsed:,.0f} смен/с), пропущено {report.skipped}"
+        )
+
+        # Старый путь: отдельная транзакция на каждую смену
+        per_row_db = Database(os.path.join(tmp, "per_row.db"))
+        rows = sync_db.conn.execute(
+            "SELECT user_id, date, is_day FROM events LIMIT ?", (PER_ROW_SHIFTS,)
+        ).fetchall()
+        start = time.perf_counter()
+        for user_id, day, is_day in rows:
+            per_row_db.add_event(user_id, day, is_day)
+        per_row_rate = len(rows) / (time.perf_counter() - start)
+        print(
+            f"по одной: {per_row_rate:,.0f} смен/с, весь график занял бы "
+            f"{shifts / per_row_rate:.1f} с"
+        )
+        per_row_db.close()
+
+        # Загрузка через AsyncDatabase одновременно с записями другого пользователя
+        totals = []
+        for name, load in (
+            (
+                "в потоке записи",
+                lambda db: db.run(import_file, db.db, roster, "csv", 1, True),
+            ),
+            ("пачками", lambda db: import_batches(db, roster, "csv", 1, True)),
+        ):
+            async_db = AsyncDatabase(Database(os.path.join(tmp, f"{name}.db")))
+            task = asyncio.create_task(load(async_db))
+            latencies = []
+            day = date(YEAR + 1, 1, 1)
+            while not task.done():
+                start = time.perf_counter()
+                await async_db.add_event(users + 1, day.isoformat(), True)
+                latencies.append(time.perf_counter() - start)
+                day += timedelta(days=1)
+            report = task.result()
+            totals.append(report.imported)
+            print(
+                f"{name:>16}: {report.imported} смен, другой пользователь записал "
+                f"{len(latencies)} смен, самая долгая запись "
+                f"{max(latencies) * 1000:.0f} мс"
+            )
+            await async_db.close()
+        assert totals == [shifts, shifts]
+
+        # Выгрузка .ics и загрузка её в чистую базу
+        db = AsyncDatabase(sync_db)
+        path = await ShiftExport(db, cache_dir=os.path.join(tmp, "exports")).export(1)
+        restored_db = Database(os.path.join(tmp, "restored.db"))
+        report = import_file(restored_db, path, "ics", 1)
+        same = restored_db.get_year_events([1], YEAR) == sync_db.get_year_events(
+            [1], YEAR
+        )
+        print(
+            f"     ics: загружено {report.imported} смен, "
+            f"совпадает с исходным: {'да' if same else 'нет'}"
+        )
+        restored_db.close()
+        await db.close()
+
+        await interrupted(tmp, roster)
+
+    report = ImportReport()
+    parsed = {
+        day: is_day
+        for _, day, is_day in parse_ics(ics_events(ICS_SUMMARIES), 1, report)
+    }
+    classified = {
+        summary: parsed.get(f"{YEAR}-01-{i:02d}")
+        for i, summary in enumerate(ICS_SUMMARIES, 1)
+    }
+    print(f"Названия событий .ics: {classified}")
+    assert classified == ICS_SUMMARIES
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,219 @@
+"""Бенчмарк callback_data кнопок календаря: размер и разбор.
+
+Размер: callback_data всех кнопок месяца и экрана дня в старом формате
+(day_2024_10_17) и в текущем (8 символов), каждая кнопка не длиннее
+64 байт - предела Telegram. Разбор: старая цепочка startswith/split
+против decode_callback и поиска обработчика в словаре. В конце кнопки
+старого формата и испорченные данные должны отклоняться - и кодеком, и
+обработчиком календаря (ответ "Кнопка устарела", без записи в базу),
+кнопка удаления смены - отвечать по тому, была ли смена, а "Заполнить до
+конца года" - продолжать любой график из PATTERNS, не трогая дни,
+отмеченные вручную в следующих месяцах.
+
+Запуск: python -m benchmarks.callbacks
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from datetime import date
+
+from benchmarks.fake_bot import FakeBot, callback_update
+from database.async_database import AsyncDatabase
+from database.database import Database
+from my_calendar.callback_codec import (
+    ACTIONS,
+    DAY_ACTIONS,
+    VERSION,
+    decode_callback,
+    encode_callback,
+)
+from my_calendar.patterns import PATTERNS
+from my_calendar.telegram_calendar import Calendar
+
+LIMIT = 64
+REPEAT = 50_000
+# Отмеченные вручную дни после октября: смена вместо ночи графика и
+# смена в выходной графика
+HAND_ENTERED = {"2026-11-20": True, "2026-11-22": False}
+
+
+def raw_token(version, action, year, month, day):
+    """Токен в раскладке кодека без проверок encode_callback"""
+    value = version << 28 | action << 24 | year << 9 | month << 5 | day
+    return f"{value:08x}"
+
+
+REJECTED = [
+    "ignore",
+    "day_2024_10_17",
+    "add_night_2024_10_17",
+    "next_2024_10",
+    "",
+    "!!!!!!!!",
+    encode_callback("day", 2024, 10, 17)[:7],
+    encode_callback("day", 2024, 10, 17) + "0",
+    encode_callback("day", 2024, 10, 17).upper(),
+    "0x" + encode_callback("day", 2024, 10, 17)[2:],
+    raw_token(0, 1, 2024, 10, 17),  # другая версия
+    raw_token(VERSION + 1, 1, 2024, 10, 17),
+    raw_token(VERSION, len(ACTIONS), 2024, 10, 17),  # неизвестное действие
+    raw_token(VERSION, 1, 2023, 2, 29),
+    raw_token(VERSION, 3, 2024, 13, 1),
+    raw_token(VERSION, ACTIONS.index("next"), 2024, 10, 5),  # день у месяца
+    raw_token(VERSION, ACTIONS.index("prev"), 0, 10, 0),
+    raw_token(VERSION, 0, 2024, 0, 0),
+]
+
+
+def legacy_data(data):
+    """Та же кнопка в старом формате callback_data"""
+    action, year, month, day = decode_callback(data)
+    if action == "ignore":
+        return action
+    parts = [action, year, month] + ([day] if day else [])
+    return "_".join(str(part) for part in parts)
+
+
+def legacy_parse(data):
+    """Старая цепочка разбора из calendar_callback"""
+    if data.startswith("day"):
+        _, year, month, day = data.split("_")
+        return "day", int(year), int(month), int(day)
+    if data.startswith("add_day") or data.startswith("add_night"):
+        _, is_day, year, month, day = data.split("_")
+        return "add_" + is_day, int(year), int(month), int(day)
+    if data.startswith("clear_events"):
+        _, _, year, month = data.split("_")
+        return "clear_events", int(year), int(month), 0
+    if data.startswith("fill_month") or data.startswith("fill_year"):
+        _, scope, year, month = data.split("_")
+        return "fill_" + scope, int(year), int(month), 0
+    if data.startswith("delete_event"):
+        _, _, year, month, day = data.split("_")
+        return "delete_event", int(year), int(month), int(day)
+    if data.startswith("prev") or data.startswith("next"):
+        action, year, month = data.split("_")
+        return action, int(year), int(month), 0
+    if data.startswith("cancel"):
+        _, year, month = data.split("_")
+        return "cancel", int(year), int(month), 0
+    return "ignore", 0, 0, 0
+
+
+def buttons(markup):
+    return [button.callback_data for row in markup.inline_keyboard for button in row]
+
+
+def measure(parse, payload):
+    handlers = dict.fromkeys(ACTIONS, len)
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        action, *_ = parse(payload)
+        handlers[action]
+    return (time.perf_counter() - start) / REPEAT
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AsyncDatabase(Database(os.path.join(tmp, "calendar.db")))
+        calendar_ = Calendar(db)
+        await db.add_events(1, [("2024-10-01", True), ("2024-10-02", True)])
+        month = buttons(await calendar_.create_calendar(1, 2024, 10))
+        day = buttons(await calendar_.create_day_night_keyboard(1, 2024, 10, 1))
+
+        for name, data in (("месяц", month), ("экран дня", day)):
+            old = [legacy_data(item) for item in data]
+            new_size = sum(len(item.encode()) for item in data)
+            old_size = sum(len(item.encode()) for item in old)
+            assert all(len(item.encode()) <= LIMIT for item in data + old)
+            print(
+                f"{name:>22}: {len(data)} кнопок, callback_data {old_size} -> "
+                f"{new_size} байт, самая длинная {max(map(len, old))} -> "
+                f"{max(map(len, data))}"
+            )
+
+        # Разбор и выбор обработчика по действиям: в старой цепочке цена
+        # зависит от места действия среди startswith
+        print(f"{'действие':>22}  startswith/split  decode_callback")
+        for action in ACTIONS[1:]:
+            year, month, day = (
+                (2024, 10, 17) if action in DAY_ACTIONS else (2024, 10, 0)
+            )
+            data = encode_callback(action, year, month, day)
+            assert legacy_parse(legacy_data(data)) == decode_callback(data)
+            old = measure(legacy_parse, legacy_data(data))
+            new = measure(decode_callback, data)
+            print(f"{action:>22}  {old * 1e6:11.3f} мкс  {new * 1e6:10.3f} мкс")
+
+        accepted = [data for data in REJECTED if decode_callback(data) is not None]
+        bot = FakeBot()
+        for update_id, data in enumerate(REJECTED):
+            update = callback_update(update_id, 1, data, bot)
+            await calendar_.calendar_callback(update, None)
+        answers = {kwargs["text"] for _, kwargs in bot.calls}
+        events = await db.get_events(1, 2024, 10)
+
+        # Первое нажатие удаляет смену, второе её уже не находит
+        delete_bot = FakeBot()
+        await db.add_event(2, "2024-10-01", True)
+        data = encode_callback("delete_event", 2024, 10, 1)
+        for update_id in range(2):
+            update = callback_update(update_id, 2, data, delete_bot)
+            await calendar_.calendar_callback(update, None)
+        await calendar_.wait_edits()
+        deletes = [
+            kwargs["text"]
+            for method, kwargs in delete_bot.calls
+            if method == "answer_callback_query"
+        ]
+
+        # Заполнение года: октябрь 2026 начат по 2/2/4, в ноябре дни вручную
+        fill_bot = FakeBot()
+        await db.add_events(3, list(HAND_ENTERED.items()))
+        await db.add_events(3, [(f"2026-10-0{day}", day < 3) for day in range(1, 5)])
+        data = encode_callback("fill_year", 2026, 10)
+        await calendar_.calendar_callback(callback_update(0, 3, data, fill_bot), None)
+        filled = dict(await db.get_events_range(3, "2026-10-01", "2026-12-31"))
+        expected = {
+            day.isoformat(): is_day
+            for day, is_day in PATTERNS["2/2/4"].project(
+                date(2026, 10, 1), date(2026, 10, 1), date(2026, 12, 31)
+            )
+        }
+        expected.update(HAND_ENTERED)
+
+        # Другие графики: день и ночь с 2 выходными продолжается так же
+        await db.add_events(4, [("2026-10-01", True), ("2026-10-02", False)])
+        data = encode_callback("fill_month", 2026, 10)
+        await calendar_.calendar_callback(callback_update(1, 4, data, fill_bot), None)
+        other = await db.get_events_range(4, "2026-10-01", "2026-10-08")
+        await calendar_.wait_edits()
+        fill_answers = [
+            kwargs["text"]
+            for method, kwargs in fill_bot.calls
+            if method == "answer_callback_query"
+        ]
+        await db.close()
+    print(
+        f"Отклонено {len(REJECTED) - len(accepted)} из {len(REJECTED)} "
+        f"испорченных или старых callback_data, ответы: {answers}, "
+        f"смен в базе после них: {len(events)}"
+    )
+    assert not accepted, accepted
+    assert len(bot.calls) == len(REJECTED) and len(events) == 2
+    print(f"Удаление смены: {deletes}")
+    assert deletes == ["Завод на 1.10.2024 удален.", "Завода на 1.10.2024 не найдено."]
+    print(f"Заполнение: {fill_answers}, смен до конца года {len(filled)}")
+    assert {k: bool(v) for k, v in filled.items()} == expected
+    assert [(day, bool(is_day)) for day, is_day in other] == [
+        ("2026-10-01", True),
+        ("2026-10-02", False),
+        ("2026-10-05", True),
+        ("2026-10-06", False),
+    ]
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""Общее для бенчмарков: смены для заполнения базы, счётчик SQL-запросов,
+замеры времени, перцентили задержек и остановки цикла событий.
+"""
+
+import asyncio
+import statistics
+import time
+from datetime import timedelta
+
+# График 2/2/4: день, день, ночь, ночь, 4 выходных
+CYCLE = [True, True, False, False, None, None, None, None]
+
+
+def rotation(user_ids, first_day, last_day, cycle=CYCLE, offsets=None):
+    """Смены (user_id, YYYY-MM-DD, is_day) по циклу с first_day по last_day.
+
+    Цикл у каждого пользователя сдвинут на offsets[user_id], по умолчанию
+    на user_id, поэтому соседние пользователи работают в разные дни.
+    """
+    for user_id in user_ids:
+        offset = user_id if offsets is None else offsets[user_id]
+        day = first_day
+        while day <= last_day:
+            is_day = cycle[(day.toordinal() + offset) % len(cycle)]
+            if is_day is not None:
+                yield user_id, day.isoformat(), is_day
+            day += timedelta(days=1)
+
+
+def random_shifts(user_ids, first_day, last_day, rnd, density=0.5):
+    """Случайные смены: в каждый день смена с вероятностью density, день или ночь"""
+    for user_id in user_ids:
+        day = first_day
+        while day <= last_day:
+            if rnd.random() < density:
+                yield user_id, day.isoformat(), rnd.random() < 0.5
+            day += timedelta(days=1)
+
+
+def seed(db, rows):
+    """Заполнение Database сменами одной транзакцией: (число смен, секунды)"""
+    with Stopwatch() as timer:
+        count = db.import_events(rows)
+    return count, timer.elapsed
+
+
+class QueryCounter:
+    """Счётчик SQL-запросов через trace callback sqlite3"""
+
+    def __init__(self, conn):
+        self.count = 0
+        conn.set_trace_callback(self._trace)
+
+    def _trace(self, statement):
+        self.count += 1
+
+
+class Stopwatch:
+    """with Stopwatch() as timer: ... - timer.elapsed, секунды блока.
+
+    Внутри блока elapsed - время с его начала.
+    """
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.end = None
+        return self
+
+    def __exit__(self, *exc_info):
+        self.end = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return (self.end or time.perf_counter()) - self.start
+
+
+def per_call(operation, repeat):
+    """Среднее время вызова operation(), с; и результат последнего вызова"""
+    with Stopwatch() as timer:
+        for _ in range(repeat):
+            result = operation()
+    return timer.elapsed / repeat, result
+
+
+async def per_call_async(operation, repeat):
+    """То же для корутинной функции operation"""
+    with Stopwatch() as timer:
+        for _ in range(repeat):
+            result = await operation()
+    return timer.elapsed / repeat, result
+
+
+def percentiles(latencies):
+    """p50, p99 и максимум задержек, с"""
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    return statistics.median(latencies), p99, latencies[-1]
+
+
+async def ticker(stop, gaps, tick=0.001):
+    """Паузы между тиками сверх tick в gaps, пока не stop: сколько цикл событий стоял"""
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(tick)
+        now = time.perf_counter()
+        gaps.append(now - last - tick)
+        last = now
@@ -0,0 +1,170 @@
+"""Бенчмарк правок сообщения календаря при быстрых нажатиях.
+
+Каждый пользователь листает ">>" чаще, чем Telegram успевает ответить на
+правку, затем дважды открывает один и тот же день и возвращается
+"Отменой" к уже показанному месяцу. Сравнивается число запросов к Bot API
+у старой схемы (правка на каждое нажатие, при "not modified" ещё одна
+правка разметки) и у текущей (пропуск одинаковых правок и склейка экранов).
+У текущей правки одного сообщения идут по одной, поэтому за серию нажатий
+длительностью T их не больше T / LATENCY + 2: по одной на каждую задержку
+Bot API, пока идут нажатия, и последний экран после них.
+В конце проверяется, что в каждом сообщении показан последний месяц, и
+что при остановке в порядке bot.py (очереди обновлений, затем wait_edits,
+затем закрытие базы) правки, ещё бывшие в пути, доходят до пользователей.
+
+Запуск: python -m benchmarks.edits
+"""
+
+import asyncio
+import calendar
+import contextlib
+import io
+import os
+import tempfile
+import time
+from collections import Counter
+
+from benchmarks.fake_bot import FakeBot, callback_update
+from database.async_database import AsyncDatabase
+from database.database import Database
+from my_calendar.callback_codec import encode_callback
+from my_calendar.telegram_calendar import Calendar
+from server.update_processor import PerUserUpdateProcessor
+
+USERS = 20
+NAV_TAPS = 10
+TAP_INTERVAL = 0.01
+LATENCY = 0.05
+EDIT_METHODS = ("edit_message_text", "edit_message_reply_markup")
+
+
+class LegacyCalendar(Calendar):
+    """Прежнее поведение: правка на каждое нажатие без проверок"""
+
+    async def show(self, query, text, render):
+        reply_markup = await render()
+        try:
+            await query.edit_message_text(text, reply_markup=reply_markup)
+        except Exception:
+            try:
+                await query.edit_message_reply_markup(reply_markup=reply_markup)
+            except Exception:
+                pass
+
+
+def user_taps():
+    """Нажатия одного пользователя и месяц, который должен остаться на экране"""
+    taps = [encode_callback("next", 2024, month) for month in range(1, NAV_TAPS + 1)]
+    year, month = 2024, NAV_TAPS + 1
+    taps += [encode_callback("day", year, month, 5)] * 2
+    taps += [encode_callback("cancel", year, month)] * 2
+    return taps, (year, month)
+
+
+async def run(name, calendar_class):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AsyncDatabase(Database(os.path.join(tmp, "calendar.db")))
+        calendar_instance = calendar_class(db)
+        bot = FakeBot(latency=LATENCY)
+        processor = PerUserUpdateProcessor(32)
+        await processor.initialize()
+
+        taps, (year, month) = user_taps()
+        start = time.perf_counter()
+        tasks = []
+        update_id = 0
+        for data in taps:
+            for user_id in range(1, USERS + 1):
+                update_id += 1
+                update = callback_update(update_id, user_id, data, bot)
+                coroutine = calendar_instance.calendar_callback(update, None)
+                tasks.append(
+                    asyncio.create_task(processor.process_update(update, coroutine))
+                )
+            await asyncio.sleep(TAP_INTERVAL)
+        span = time.perf_counter() - start
+        await asyncio.gather(*tasks)
+        await processor.shutdown()
+        if calendar_class is Calendar:
+            await calendar_instance.wait_edits()
+        elapsed = time.perf_counter() - start
+
+        per_user = Counter(
+            kwargs["chat_id"] for method, kwargs in bot.calls if method in EDIT_METHODS
+        )
+        edits = sum(per_user.values())
+        expected = f"{calendar.month_name[month]} {year}"
+        stale = sum(
+            1
+            for user_id in range(1, USERS + 1)
+            if bot.messages[(user_id, 1)][1].inline_keyboard[0][0].text != expected
+        )
+        await db.close()
+
+    taps_count = len(taps) * USERS
+    limit = int(span / LATENCY) + 2
+    most = max(per_user.values())
+    print(
+        f"{name:>8}: {taps_count} нажатий, {edits} правок "
+        f"({edits / taps_count:.2f} на нажатие), {elapsed:.2f} с, "
+        f"устаревших экранов: {stale}; за серию из {len(taps)} нажатий "
+        f"до {most} правок одного сообщения (предел по задержке {limit})"
+    )
+    return stale, most, limit
+
+
+async def shutdown(wait_edits):
+    """Остановка сразу после двух быстрых ">>" на стыке лет: второй экран
+    рисуется, когда дойдёт первая правка, и читает из базы смены нового года.
+    Возвращает пользователей без последнего экрана и число ошибок
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AsyncDatabase(Database(os.path.join(tmp, "calendar.db")))
+        calendar_instance = Calendar(db)
+        bot = FakeBot(latency=LATENCY)
+        processor = PerUserUpdateProcessor(32)
+        await processor.initialize()
+        update_id = 0
+        for month in (11, 12):
+            for user_id in range(1, USERS + 1):
+                update_id += 1
+                data = encode_callback("next", 2024, month)
+                update = callback_update(update_id, user_id, data, bot)
+                coroutine = calendar_instance.calendar_callback(update, None)
+                await processor.process_update(update, coroutine)
+            # Второе нажатие - пока первая правка в пути
+            await asyncio.sleep(LATENCY / 2)
+        await processor.join()
+        # Ошибки отложенных правок печатаются; здесь они только считаются
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            if wait_edits:
+                await calendar_instance.wait_edits()
+            await db.close()
+            await asyncio.sleep(LATENCY * 3)
+        errors = output.getvalue().count("Error editing message")
+    expected = f"{calendar.month_name[1]} 2025"
+    lost = sum(
+        1
+        for user_id in range(1, USERS + 1)
+        if (user_id, 1) not in bot.messages
+        or bot.messages[(user_id, 1)][1].inline_keyboard[0][0].text != expected
+    )
+    return lost, errors
+
+
+async def main():
+    await run("legacy", LegacyCalendar)
+    stale, most, limit = await run("current", Calendar)
+    assert stale == 0
+    assert most <= limit, "правки одного сообщения не склеиваются"
+
+    lost, errors = await shutdown(wait_edits=False)
+    print(f"остановка без wait_edits: без ответа {lost} из {USERS}, ошибок {errors}")
+    assert lost, "сценарий остановки не застал правок в пути"
+    lost, errors = await shutdown(wait_edits=True)
+    print(f"остановка с wait_edits: без ответа {lost} из {USERS}, ошибок {errors}")
+    assert lost == 0 and errors == 0
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,123 @@
+"""Бенчмарк выгрузки смен в .ics для пользователя с длинной историей.
+
+Сравнивает наивную сборку (вся история одним запросом в один объект
+icalendar) с потоковой выгрузкой ShiftExport: время, пиковую память
+(tracemalloc) и повторную выгрузку из кэша. Затем меняет одну смену и
+проверяет, что файл собирается заново, содержит изменение и при разборе
+импортом даёт ровно смены из базы.
+
+Запуск: python -m benchmarks.export [число смен, по умолчанию 12000]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import tracemalloc
+from datetime import date, datetime, timedelta, timezone
+
+from icalendar import Calendar as ICalendar, Event
+
+from benchmarks.common import Stopwatch, rotation, seed
+from database.async_database import AsyncDatabase
+from database.database import Database
+from my_calendar.export import PRODID, ShiftExport
+from my_calendar.importer import ImportReport, parse_ics
+
+USER_ID = 1
+FIRST_DAY = date(2000, 1, 1)
+# Два дня, две ночи подряд с FIRST_DAY, без выходных
+CYCLE = [True, True, False, False]
+
+
+def history(count):
+    return rotation(
+        [USER_ID],
+        FIRST_DAY,
+        FIRST_DAY + timedelta(days=count - 1),
+        cycle=CYCLE,
+        offsets={USER_ID: -FIRST_DAY.toordinal()},
+    )
+
+
+def naive_export(db):
+    """Вся история в памяти: один запрос и один объект календаря"""
+    rows = db.conn.execute(
+        "SELECT date, is_day FROM events WHERE user_id = ? ORDER BY date",
+        (USER_ID,),
+    ).fetchall()
+    calendar_ = ICalendar()
+    calendar_.add("prodid", PRODID)
+    calendar_.add("version", "2.0")
+    stamp = datetime.now(timezone.utc)
+    for day, is_day in rows:
+        start = date.fromisoformat(day)
+        event = Event()
+        event.add("uid", f"{USER_ID}-{day}")
+        event.add("dtstamp", stamp)
+        event.add("dtstart", start)
+        event.add("dtend", start + timedelta(days=1))
+        event.add("summary", "Дневная смена" if is_day else "Ночная смена")
+        calendar_.add_component(event)
+    return calendar_.to_ical()
+
+
+async def measure(name, operation):
+    tracemalloc.start()
+    with Stopwatch() as timer:
+        result = await operation()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{name:>18}: {timer.elapsed * 1000:8.1f} мс, пик памяти {peak / 1024:8.0f} КБ"
+    )
+    return result
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 12000
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_db = Database(os.path.join(tmp, "calendar.db"))
+        seed(sync_db, history(count))
+        db = AsyncDatabase(sync_db)
+        exporter = ShiftExport(db, cache_dir=os.path.join(tmp, "exports"))
+        print(f"Смен у пользователя: {count}")
+
+        async def naive():
+            return naive_export(sync_db)
+
+        await measure("наивно", naive)
+        path = await measure("поток, холодно", lambda: exporter.export(USER_ID))
+        size = os.path.getsize(path)
+        await measure("поток, из кэша", lambda: exporter.export(USER_ID))
+
+        await db.add_event(USER_ID, "2000-01-03", True)
+        await measure("после изменения", lambda: exporter.export(USER_ID))
+        with open(path, encoding="utf-8") as f:
+            content = f.read()
+        events = content.count("BEGIN:VEVENT")
+        nights = sum(1 for i in range(count) if i % 4 >= 2)
+        # 2000-01-03 была ночной сменой и стала дневной
+        changed = content.count("Ночная смена") == nights - 1
+        print(
+            f"Файл: {size / 1024:.0f} КБ, событий {events}, "
+            f"изменение учтено: {'да' if changed else 'нет'}"
+        )
+        assert events == count and changed
+        report = ImportReport()
+        exported = [
+            (day, is_day)
+            for _, day, is_day in parse_ics(content.splitlines(), USER_ID, report)
+        ]
+        source = [
+            (day, bool(is_day))
+            for day, is_day in sync_db.get_events_range(
+                USER_ID, FIRST_DAY.isoformat(), "9999-12-31"
+            )
+        ]
+        assert not report.skipped and sorted(exported) == source
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
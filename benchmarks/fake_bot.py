@@ -0,0 +1,110 @@
+import asyncio
+import random
+
+from telegram import Update
+from telegram.error import BadRequest
+
+
+class FakeBot:
+    """Локальная замена telegram.Bot: записывает вызовы и имитирует задержку сети.
+
+    jitter добавляет к задержке случайную величину, чтобы параллельные
+    вызовы завершались не в порядке отправки, как в реальной сети.
+    Правка, не меняющая сообщение, отклоняется, как в Telegram.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.sent = []
+        self.calls = []
+        self.messages = {}  # (chat_id, message_id) -> (текст, разметка)
+        self._random = random.Random(seed)
+
+    async def _network(self, method, **kwargs):
+        delay = self.latency + self._random.random() * self.jitter
+        if delay:
+            await asyncio.sleep(delay)
+        # Вызов записывается, когда "доходит" до Telegram: порядок calls -
+        # порядок, в котором пользователь увидит ответы
+        self.calls.append((method, kwargs))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._network("send_message", chat_id=chat_id, text=text, **kwargs)
+        self.sent.append((chat_id, text))
+
+    async def answer_callback_query(self, callback_query_id, text=None, **kwargs):
+        await self._network(
+            "answer_callback_query", callback_query_id=callback_query_id, text=text
+        )
+        return True
+
+    async def answer_inline_query(self, inline_query_id, results, **kwargs):
+        await self._network(
+            "answer_inline_query",
+            inline_query_id=inline_query_id,
+            results=results,
+            **kwargs,
+        )
+        return True
+
+    def _edit(self, kwargs, text=None):
+        key = (kwargs.get("chat_id"), kwargs.get("message_id"))
+        old_text, old_markup = self.messages.get(key, (None, None))
+        content = (text or old_text, kwargs.get("reply_markup"))
+        if content == (old_text, old_markup):
+            raise BadRequest(
+                "Message is not modified: specified new message content and reply "
+                "markup are exactly the same as a current content and reply markup "
+                "of the message"
+            )
+        self.messages[key] = content
+
+    async def edit_message_text(self, text, **kwargs):
+        await self._network("edit_message_text", text=text, **kwargs)
+        self._edit(kwargs, text)
+        return True
+
+    async def edit_message_reply_markup(self, **kwargs):
+        await self._network("edit_message_reply_markup", **kwargs)
+        self._edit(kwargs)
+        return True
+
+
+def callback_update(update_id, user_id, data, bot=None):
+    """Нажатие inline-кнопки в том виде, в каком его присылает Telegram"""
+    user = {"id": user_id, "is_bot": False, "first_name": "Тест"}
+    payload = {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": user_id, "type": "private"},
+                "text": "Когда на завод?",
+            },
+        },
+    }
+    if bot is None:
+        return payload
+    return Update.de_json(payload, bot)
+
+
+def inline_update(update_id, user_id, query, bot=None):
+    """Inline-запрос "@бот query" в том виде, в каком его присылает Telegram"""
+    payload = {
+        "update_id": update_id,
+        "inline_query": {
+            "id": str(update_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": "Тест"},
+            "query": query,
+            "offset": "",
+        },
+    }
+    if bot is None:
+        return payload
+    return Update.de_json(payload, bot)
@@ -0,0 +1,127 @@
+"""Бенчмарк inline-режима: задержка ответа и чтения базы по мере набора запроса.
+
+Каждый пользователь набирает "@бот today", "week", "завтра" и даты (в том
+числе из архивного года): Telegram присылает запрос на каждую букву.
+Сравниваются ответы без памяти (cache_size=0, каждый запрос читает базу)
+и с памятью ответов: задержка на ответ FakeBot и SQL-запросы на ответ.
+Проверяется, что тексты ответов совпадают, что с памятью база читается не
+больше READS_PER_USER раз на пользователя, повторный набор не читает её вовсе,
+а запись смены сразу видна в следующем ответе.
+
+Запуск: python -m benchmarks.inline [пользователей, по умолчанию 200]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+from benchmarks.common import QueryCounter, Stopwatch, percentiles, rotation
+from benchmarks.fake_bot import FakeBot, inline_update
+from database.async_database import AsyncDatabase
+from database.database import Database
+from my_calendar.inline import InlineShifts
+
+TODAY = date.today()
+FIRST_DAY = date(TODAY.year - 3, 1, 1)
+ARCHIVED_DAY = date(TODAY.year - 3, 3, 5)
+# Чтений базы на пользователя с памятью ответов: пустой запрос (сегодня,
+# завтра и неделя одним запросом) и две набранные даты
+READS_PER_USER = 3
+
+
+def typing(text):
+    """Запросы, которые Telegram присылает, пока пользователь набирает text"""
+    return [text[:length] for length in range(1, len(text) + 1)]
+
+
+QUERIES = (
+    [""]
+    + typing("today")
+    + typing("week")
+    + typing("завтра")
+    + typing(TODAY.strftime("%d.%m.%Y"))
+    + typing(ARCHIVED_DAY.strftime("%d.%m.%Y"))
+)
+
+
+def answers(bot):
+    return [
+        [(result.id, result.input_message_content.message_text) for result in results]
+        for method, kwargs in bot.calls
+        if method == "answer_inline_query"
+        for results in [kwargs["results"]]
+    ]
+
+
+async def run(name, db, counter, users, cache_size, inline=None):
+    """Набор QUERIES всеми users: (InlineShifts, ответы, SQL-запросов)"""
+    inline = inline or InlineShifts(db, cache_size=cache_size)
+    bot = FakeBot()
+    latencies = []
+    counter.count = 0
+    update_id = 0
+    for user_id in range(1, users + 1):
+        for text in QUERIES:
+            update_id += 1
+            update = inline_update(update_id, user_id, text, bot)
+            with Stopwatch() as timer:
+                await inline.inline_query(update, None)
+            latencies.append(timer.elapsed)
+
+    p50, p99, _ = percentiles(latencies)
+    print(
+        f"{name:>12}: {len(latencies)} запросов, p50 "
+        f"{p50 * 1000:.3f} мс, p99 {p99 * 1000:.3f} мс, "
+        f"{counter.count / len(latencies):.2f} SQL на ответ"
+    )
+    return inline, answers(bot), counter.count
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_db = Database(os.path.join(tmp, "calendar.db"))
+        sync_db.import_events(
+            rotation(range(1, users + 1), FIRST_DAY, TODAY + timedelta(days=60))
+        )
+        while sync_db.archive_events(TODAY.year - 2):
+            pass
+        counter = QueryCounter(sync_db.conn)
+        db = AsyncDatabase(sync_db)
+        print(f"Пользователей {users}, запросов на пользователя {len(QUERIES)}")
+
+        _, uncached, _ = await run("без памяти", db, counter, users, 0)
+        inline, cached, queries = await run("с памятью", db, counter, users, 4096)
+        assert cached == uncached, "ответы с памятью и без неё различаются"
+        assert queries <= users * READS_PER_USER, queries
+        _, repeated, queries = await run(
+            "повторно", db, counter, users, 4096, inline=inline
+        )
+        assert repeated == cached and queries == 0, queries
+        archived = [
+            text
+            for results in cached
+            for result_id, text in results
+            if result_id == f"date:{ARCHIVED_DAY.isoformat()}"
+        ]
+        print(f"Смена из архива: {archived[0]}")
+        assert len(archived) == users
+
+        # Запись смены сбрасывает память ответов пользователя
+        bot = FakeBot()
+        before = await db.shifts.get_event(1, TODAY)
+        await db.add_event(1, TODAY.isoformat(), not before)
+        counter.count = 0
+        await inline.inline_query(inline_update(0, 1, "today", bot), None)
+        text = answers(bot)[0][0][1]
+        expected = "День☀️" if not before else "Ночь🌙"
+        print(f"После записи: {text!r}, SQL {counter.count}")
+        # Год пользователя перечитывается одним запросом
+        assert text.endswith(expected) and counter.count == 1, counter.count
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
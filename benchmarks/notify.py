@@ -0,0 +1,177 @@
+"""Бенчмарк ежедневной рассылки: пропускная способность check_and_notify.
+
+Сначала рассылка с лимитами, с которыми работает бот (30 сообщений в
+секунду на всех, 1 в секунду на чат): по времени отправки каждого
+сообщения проверяется, что ни в одну секунду лимиты не превышены. Затем
+несколько сообщений в одни и те же чаты - проверка лимита на чат. Для
+сравнения - та же рассылка без общего лимита: сколько даёт сама
+параллельная отправка, и оценка времени последовательной. После неё
+ограничителей чатов в памяти должно остаться меньше, чем было чатов.
+Напоследок - загрузка годовых смен всех пользователей для сводки: цикл
+событий не должен стоять, пока они разбираются.
+
+Запуск: python -m benchmarks.notify
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from benchmarks.common import Stopwatch, rotation, seed, ticker
+from benchmarks.fake_bot import FakeBot
+from database.async_database import AsyncDatabase
+from database.database import Database
+from my_calendar.dispatcher import MessageDispatcher
+from my_calendar.notification import Notification
+
+USERS = 2000
+LIMITED_USERS = 300  # При 30 сообщениях в секунду - около 10 с
+LATENCY = 0.05  # Задержка одного send_message, как у реального API
+GLOBAL_RATE = 30
+PER_CHAT_RATE = 1
+CHATS = 10
+MESSAGES_PER_CHAT = 4
+# Точность таймеров цикла событий
+EPSILON = 0.002
+# Допустимая остановка цикла событий при загрузке смен года
+MAX_STALL = 0.1
+
+
+class TimedBot(FakeBot):
+    """FakeBot, запоминающий момент каждого вызова send_message"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sent_at = []  # (time.monotonic(), chat_id)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent_at.append((time.monotonic(), chat_id))
+        await super().send_message(chat_id, text, **kwargs)
+
+
+def max_per_window(times, window=1.0):
+    """Наибольшее число отправок в полуинтервале длиной window"""
+    times = sorted(times)
+    most = 0
+    first = 0
+    for last, moment in enumerate(times):
+        while moment - times[first] >= window - EPSILON:
+            first += 1
+        most = max(most, last - first + 1)
+    return most
+
+
+def check_limits(bot):
+    """Наибольшее число отправок за секунду: (всего, в один чат)"""
+    by_chat = defaultdict(list)
+    for moment, chat_id in bot.sent_at:
+        by_chat[chat_id].append(moment)
+    per_chat = max(max_per_window(times) for times in by_chat.values())
+    return max_per_window([moment for moment, _ in bot.sent_at]), per_chat
+
+
+async def broadcast(users, global_rate):
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_db = Database(os.path.join(tmp, "calendar.db"))
+        # Сегодня и завтра у каждого смена: день и ночь или наоборот
+        today = date.today()
+        seed(
+            sync_db,
+            rotation(
+                range(1, users + 1),
+                today,
+                today + timedelta(days=1),
+                cycle=[True, False],
+            ),
+        )
+        db = AsyncDatabase(sync_db)
+
+        bot = TimedBot(latency=LATENCY)
+        notification = Notification(SimpleNamespace(bot=bot), db)
+        notification.dispatcher = MessageDispatcher(
+            bot, global_rate=global_rate, per_chat_rate=PER_CHAT_RATE
+        )
+        with Stopwatch() as timer:
+            delivered = await notification.check_and_notify(notification.app)
+        await db.close()
+    return bot, notification.dispatcher, delivered, timer.elapsed
+
+
+async def load_year(users):
+    """Загрузка смен года всех users в ShiftStore: (секунды, остановка цикла, с)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_db = Database(os.path.join(tmp, "calendar.db"))
+        year = date.today().year
+        seed(
+            sync_db,
+            rotation(range(1, users + 1), date(year, 1, 1), date(year, 12, 31)),
+        )
+        db = AsyncDatabase(sync_db)
+        stop = asyncio.Event()
+        gaps = []
+        ticks = asyncio.create_task(ticker(stop, gaps))
+        with Stopwatch() as timer:
+            bitmaps = await db.shifts.bitmaps(range(1, users + 1), year)
+        stop.set()
+        await ticks
+        await db.close()
+    assert len(bitmaps) == users
+    return timer.elapsed, max(gaps)
+
+
+async def main():
+    bot, _, delivered, elapsed = await broadcast(LIMITED_USERS, GLOBAL_RATE)
+    in_second, _ = check_limits(bot)
+    print(
+        f"с лимитами бота: {delivered} сообщений за {elapsed:.2f} с "
+        f"({delivered / elapsed:.1f} сообщений/с), за секунду не больше "
+        f"{in_second} (лимит {GLOBAL_RATE}); {USERS} пользователей заняли бы "
+        f"~{USERS / GLOBAL_RATE:.0f} с"
+    )
+    assert delivered == LIMITED_USERS and in_second <= GLOBAL_RATE
+
+    # Несколько сообщений в одни и те же чаты
+    bot = TimedBot(latency=LATENCY)
+    dispatcher = MessageDispatcher(
+        bot, global_rate=GLOBAL_RATE, per_chat_rate=PER_CHAT_RATE
+    )
+    messages = [
+        (chat_id, f"сообщение {i}")
+        for i in range(MESSAGES_PER_CHAT)
+        for chat_id in range(1, CHATS + 1)
+    ]
+    with Stopwatch() as timer:
+        delivered = await dispatcher.send_many(messages)
+    in_second, per_chat = check_limits(bot)
+    print(
+        f"{CHATS} чатов по {MESSAGES_PER_CHAT} сообщения: за {timer.elapsed:.2f} с, "
+        f"в один чат за секунду не больше {per_chat} (лимит {PER_CHAT_RATE})"
+    )
+    assert delivered == len(messages)
+    assert in_second <= GLOBAL_RATE and per_chat <= PER_CHAT_RATE
+
+    # Без общего лимита: не конфигурация бота, а предел самой параллельной отправки
+    _, dispatcher, delivered, elapsed = await broadcast(USERS, 10**6)
+    limiters = len(dispatcher._chat_limiters)
+    print(
+        f"без общего лимита: {delivered} сообщений за {elapsed:.2f} с "
+        f"({delivered / elapsed:.0f} сообщений/с, "
+        f"последовательно было бы ~{USERS * LATENCY:.0f} с), "
+        f"ограничителей чатов в памяти {limiters} из {USERS}"
+    )
+    assert limiters < USERS
+
+    elapsed, stall = await load_year(USERS)
+    print(
+        f"смены года {USERS} пользователей: {elapsed * 1000:.0f} мс, "
+        f"цикл событий стоял до {stall * 1000:.1f} мс"
+    )
+    assert stall < MAX_STALL, "смены разбираются в цикле событий"
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,210 @@
+"""Проверка outbox уведомлений: падение посреди рассылки и перезапуск.
+
+Всем USERS пользователям назначено уведомление на несколько минут назад,
+то есть бот "проспал" рассылку. Рассылка идёт в дочернем процессе против
+FakeBot, который дописывает каждого получателя в журнал. Каждому десятому
+пользователю первая попытка не доходит (сетевая ошибка), и сводка уходит
+повторной попыткой из outbox.
+
+Первый процесс убивается SIGKILL посреди рассылки. Второй процесс
+досылает остаток и завершается, когда в outbox не остаётся ожидающих
+сводок. Третий запуск проверяет, что повторно ничего не отправляется.
+В конце считается, сколько пользователей получили сводку, сколько
+получили её дважды и сколько не получили.
+
+Отдельно проверяется сбой при планировании: база дважды не записывает
+сводки в outbox (ошибка SQLite и исключение), и все сводки всё равно
+должны уйти - сработавшее время не теряется.
+
+Запуск: python -m benchmarks.outbox
+"""
+
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from telegram.error import NetworkError
+
+from benchmarks.common import Stopwatch, rotation
+from benchmarks.fake_bot import FakeBot
+from database.async_database import AsyncDatabase
+from database.database import Database, writes
+from my_calendar.dispatcher import MessageDispatcher
+from my_calendar.notification import Notification
+
+USERS = 1000
+SEND_RATE = 300  # сообщений в секунду: рассылка идёт несколько секунд
+KILL_AFTER = 1.5
+
+
+class LoggingBot(FakeBot):
+    """FakeBot, записывающий доставленные сводки в файл и теряющий первые попытки"""
+
+    def __init__(self, log_path):
+        super().__init__(latency=0.01)
+        self.log = open(log_path, "a", encoding="utf-8")
+        self.failed_once = set()
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id % 10 == 0 and chat_id not in self.failed_once:
+            self.failed_once.add(chat_id)
+            raise NetworkError("Имитация обрыва соединения")
+        await super().send_message(chat_id, text, **kwargs)
+        # Журнал в ядре переживёт SIGKILL: flush без fsync достаточно
+        self.log.write(f"{chat_id}\n")
+        self.log.flush()
+
+
+class FlakyDatabase(Database):
+    """База, у которой первые попытки записать сводки в outbox не удаются"""
+
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        self.failures = ["error", "exception"]
+
+    @writes
+    def plan_digests(self, user_ids, digest_date, due_at):
+        if self.failures:
+            if self.failures.pop(0) == "exception":
+                raise RuntimeError("Имитация сбоя планирования")
+            # Так plan_digests сообщает об ошибке SQLite
+            return None
+        return super().plan_digests(user_ids, digest_date, due_at)
+
+
+def seed(db_path):
+    db = Database(db_path)
+    now = datetime.now(timezone.utc)
+    today = now.date()
+    notify_time = (now - timedelta(minutes=5)).strftime("%H:%M")
+    # Сегодня и завтра у каждого смена: день и ночь или наоборот
+    db.import_events(
+        rotation(
+            range(1, USERS + 1), today, today + timedelta(days=1), cycle=[True, False]
+        )
+    )
+    for user_id in range(1, USERS + 1):
+        db.set_notification_settings(user_id, notify_time, "UTC")
+    db.close()
+
+
+async def child(db_path, log_path):
+    sync_db = Database(db_path)
+    db = AsyncDatabase(sync_db)
+    bot = LoggingBot(log_path)
+    notification = Notification(SimpleNamespace(bot=bot), db)
+    notification.dispatcher = MessageDispatcher(
+        bot, global_rate=SEND_RATE, per_chat_rate=10**6, max_retries=0
+    )
+    notification.retry_delay = timedelta(seconds=0.5)
+    loop_task = asyncio.create_task(notification.notification_loop())
+
+    # Работаем, пока в outbox есть ожидающие сводки
+    await asyncio.sleep(0.5)
+    while True:
+        pending = sync_db.conn.execute(
+            "SELECT count(*) FROM outbox WHERE status = 'pending'"
+        ).fetchone()[0]
+        if not pending:
+            break
+        await asyncio.sleep(0.2)
+    loop_task.cancel()
+    await db.close()
+
+
+def run_child(db_path, log_path, kill_after=None):
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.outbox", "child", db_path, log_path]
+    )
+    with Stopwatch() as timer:
+        if kill_after is None:
+            process.wait()
+        else:
+            time.sleep(kill_after)
+            process.send_signal(signal.SIGKILL)
+            process.wait()
+    return timer.elapsed
+
+
+def delivered(log_path):
+    if not os.path.exists(log_path):
+        return Counter()
+    with open(log_path, encoding="utf-8") as f:
+        return Counter(int(line) for line in f if line.strip())
+
+
+def report(name, log_path):
+    counts = delivered(log_path)
+    duplicates = sum(1 for count in counts.values() if count > 1)
+    missing = USERS - len(counts)
+    print(
+        f"{name:>28}: доставлено {len(counts)}, дважды {duplicates}, "
+        f"не доставлено {missing}"
+    )
+
+
+def outbox_status(db_path):
+    db = Database(db_path)
+    rows = db.conn.execute(
+        "SELECT status, count(*), max(attempts) FROM outbox GROUP BY status"
+    ).fetchall()
+    db.close()
+    return ", ".join(
+        f"{status}: {count} (попыток до {attempts})" for status, count, attempts in rows
+    )
+
+
+async def planning_failure(db_path):
+    sync_db = FlakyDatabase(db_path)
+    db = AsyncDatabase(sync_db)
+    bot = FakeBot()
+    notification = Notification(SimpleNamespace(bot=bot), db)
+    notification.dispatcher = MessageDispatcher(
+        bot, global_rate=10**6, per_chat_rate=10**6
+    )
+    notification.retry_delay = timedelta(seconds=0.1)
+    loop_task = asyncio.create_task(notification.notification_loop())
+    for _ in range(100):
+        await asyncio.sleep(0.1)
+        if len(bot.sent) == USERS:
+            break
+    loop_task.cancel()
+    await db.close()
+    print(
+        f"{'сбой планирования':>28}: доставлено {len({chat for chat, _ in bot.sent})} "
+        f"из {USERS}, неудачных попыток записи осталось {len(sync_db.failures)}"
+    )
+    assert len(bot.sent) == USERS and not sync_db.failures
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "flaky.db")
+        seed(db_path)
+        asyncio.run(planning_failure(db_path))
+
+        db_path = os.path.join(tmp, "calendar.db")
+        log_path = os.path.join(tmp, "delivered.log")
+        seed(db_path)
+
+        run_child(db_path, log_path, kill_after=KILL_AFTER)
+        report(f"убит через {KILL_AFTER} с", log_path)
+        elapsed = run_child(db_path, log_path)
+        report(f"после перезапуска ({elapsed:.1f} с)", log_path)
+        elapsed = run_child(db_path, log_path)
+        report(f"ещё один запуск ({elapsed:.1f} с)", log_path)
+        print(f"outbox: {outbox_status(db_path)}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "child":
+        asyncio.run(child(sys.argv[2], sys.argv[3]))
+    else:
+        main()
@@ -0,0 +1,72 @@
+"""Нагрузочная проверка пула чтения: параллельные читатели и писатели.
+
+Каждый писатель по порядку заполняет дни месяца, читатели в это время
+проверяют, что видят непрерывный префикс этих дней (без потерянных или
+перепутанных строк). В конце сверяется итоговое содержимое.
+
+Запуск: python -m benchmarks.pool
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from database.async_database import AsyncDatabase
+from database.database import Database
+
+WRITERS = 20
+READERS = 40
+READS_PER_READER = 200
+DAYS = 31
+
+
+async def writer(db, user_id):
+    for day in range(1, DAYS + 1):
+        await db.add_event(user_id, f"2024-10-{day:02d}", day % 2 == 0)
+
+
+async def reader(db, reader_id):
+    for i in range(READS_PER_READER):
+        user_id = (reader_id + i) % WRITERS
+        events = await db.get_month_events(user_id, 2024, 10)
+        days = sorted(events)
+        assert days == list(range(1, len(days) + 1)), days
+        assert all(events[day] == (day % 2 == 0) for day in days)
+
+
+async def measure(read_pool_size):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AsyncDatabase(
+            Database(
+                os.path.join(tmp, "calendar.db"),
+                journal_mode="WAL",
+                synchronous="NORMAL",
+                read_pool_size=read_pool_size,
+            ),
+            commit_window=0.002,
+        )
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(writer(db, user_id) for user_id in range(WRITERS)),
+            *(reader(db, reader_id) for reader_id in range(READERS)),
+        )
+        elapsed = time.perf_counter() - start
+        for user_id in range(WRITERS):
+            assert len(await db.get_month_events(user_id, 2024, 10)) == DAYS
+        await db.close()
+
+    operations = WRITERS * DAYS + READERS * READS_PER_READER
+    print(
+        f"пул чтения {read_pool_size}: {operations / elapsed:8.0f} операций/с, "
+        "данные согласованы"
+    )
+
+
+async def main():
+    for read_pool_size in (0, 4):
+        await measure(read_pool_size)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+"""Бенчмарк отрисовки календаря: запросы и задержка на один рендер.
+
+В конце проверка кэша клавиатур: холодный рендер, идущий одновременно с
+add_event в тот же месяц, не оставляет в кэше устаревшую клавиатуру -
+следующий create_calendar показывает записанную смену. Запись другого
+пользователя во время рендера не мешает закэшировать его результат.
+
+Запуск: python -m benchmarks.render
+"""
+
+import asyncio
+import calendar
+import os
+import random
+import tempfile
+from datetime import date
+
+from benchmarks.common import QueryCounter, per_call_async, random_shifts, seed
+from database.async_database import AsyncDatabase
+from database.database import Database, month_range
+from database.shift_store import ShiftStore
+from my_calendar.callback_codec import encode_callback
+from my_calendar.telegram_calendar import Calendar
+
+USERS = 50
+YEAR = 2024
+RENDERS = 500
+RACES = 200
+
+
+def last_four_events(conn, user_id, year, month):
+    """Запрос бывшего Database.get_last_four_events (кнопка "Заполнить месяц")"""
+    return conn.execute(
+        """
+        SELECT is_day, date FROM events
+        WHERE user_id = ? AND date >= ? AND date < ?
+        ORDER BY date DESC
+        LIMIT 4
+        """,
+        (user_id, *month_range(year, month)),
+    ).fetchall()
+
+
+async def legacy_render(db, user_id, year, month):
+    """Схема доступа старого create_calendar: запрос на каждый день месяца"""
+    for day in range(1, calendar.monthrange(year, month)[1] + 1):
+        await db.get_event(user_id, f"{year}-{month:02d}-{day:02d}")
+    await db.run(last_four_events, db.db.conn, user_id, year, month)
+    await db.get_events(user_id, year, month)
+
+
+async def measure(name, render, counter):
+    rnd = random.Random(7)
+    counter.count = 0
+    elapsed, _ = await per_call_async(
+        lambda: render(rnd.randint(1, USERS), YEAR, rnd.randint(1, 12)), RENDERS
+    )
+    print(
+        f"{name:>8}: {counter.count / RENDERS:6.1f} запросов/рендер, "
+        f"{elapsed * 1000:7.3f} мс/рендер"
+    )
+
+
+def day_symbol(markup, year, month, day):
+    data = encode_callback("day", year, month, day)
+    for row in markup.inline_keyboard:
+        for button in row:
+            if button.callback_data == data:
+                return button.text[-1]
+
+
+async def stale_check(db, calendar_instance):
+    """Рендеры, пересёкшиеся с записью, и что после них лежит в кэше"""
+    rnd = random.Random(11)
+    stale = 0
+    for _ in range(RACES):
+        user_id, month, day = rnd.randint(1, USERS), rnd.randint(1, 12), 10
+        is_day = not await db.shifts.get_event(user_id, f"{YEAR}-{month:02d}-10")
+        calendar_instance.markup_cache.clear()
+        db.shifts.clear()
+        await asyncio.gather(
+            calendar_instance.create_calendar(user_id, YEAR, month),
+            db.add_event(user_id, f"{YEAR}-{month:02d}-{day:02d}", is_day),
+        )
+        markup = await calendar_instance.create_calendar(user_id, YEAR, month)
+        if day_symbol(markup, YEAR, month, day) != ("☼" if is_day else "☽"):
+            stale += 1
+
+    # Запись другого пользователя во время рендера
+    cached = 0
+    for _ in range(RACES):
+        user_id, month = rnd.randint(1, USERS - 1), rnd.randint(1, 12)
+        calendar_instance.markup_cache.clear()
+        await asyncio.gather(
+            calendar_instance.create_calendar(user_id, YEAR, month),
+            db.add_event(USERS, f"{YEAR}-{month:02d}-11", rnd.random() < 0.5),
+        )
+        if len(calendar_instance.markup_cache):
+            cached += 1
+    print(
+        f"рендер одновременно с записью: устаревших клавиатур {stale} из {RACES}; "
+        f"с записью другого пользователя закэшировано {cached} из {RACES}"
+    )
+    assert stale == 0 and cached == RACES
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_db = Database(os.path.join(tmp, "calendar.db"))
+        seed(
+            sync_db,
+            random_shifts(
+                range(1, USERS + 1),
+                date(YEAR, 1, 1),
+                date(YEAR, 12, 31),
+                random.Random(42),
+            ),
+        )
+        db = AsyncDatabase(sync_db)
+        counter = QueryCounter(sync_db.conn)
+        calendar_instance = Calendar(db)
+
+        await measure("legacy", lambda *args: legacy_render(db, *args), counter)
+
+        async def cold_render(*args):
+            calendar_instance.markup_cache.clear()
+            db.shifts.clear()
+            return await calendar_instance.create_calendar(*args)
+
+        async def warm_render(*args):
+            calendar_instance.markup_cache.clear()
+            return await calendar_instance.create_calendar(*args)
+
+        await measure("cold", cold_render, counter)
+        # Прогрев: битовые карты всех пользователей за год
+        await db.shifts.bitmaps(range(1, USERS + 1), YEAR)
+        await measure("warm", warm_render, counter)
+        await measure("cached", calendar_instance.create_calendar, counter)
+        print(f"кэш клавиатур: {calendar_instance.markup_cache.stats()}")
+        print(f"смены в памяти: {db.shifts.stats()}")
+        await stale_check(db, calendar_instance)
+
+        # Хранилище меньше числа пользователей: лишние годы вытесняются,
+        # ответы остаются верными
+        small = ShiftStore(db, maxsize=USERS // 5)
+        days = [f"{YEAR}-{month:02d}-15" for month in range(1, 13)]
+        wrong = 0
+        for user_id in list(range(1, USERS + 1)) * 2:
+            for day in days:
+                if await small.get_event(user_id, day) != sync_db.get_event(
+                    user_id, day
+                ):
+                    wrong += 1
+        print(f"смены в памяти, maxsize {small.maxsize}: {small.stats()}")
+        assert wrong == 0 and small.stats()["user_years"] == small.maxsize
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,174 @@
+"""Бенчмарк переноса старых смен в архив.
+
+USERS пользователей с графиком 2/2/4 за YEARS. Архивируется всё старше
+двух лет; при этом параллельно идёт запись смен в текущий месяц, и
+сравниваются задержки add_event до и во время переноса. Затем VACUUM
+шагами, размер файла и число строк events до и после.
+
+Проверки: смены за любой год, месяц и день, смены бригады, получатели
+сводок, выгрузка .ics и клавиатура календаря архивного месяца совпадают
+с тем, что было до переноса; запись в архивный
+год возвращает его в events; статистика смен согласована (rebuild_stats).
+
+Запуск: python -m benchmarks.retention [пользователей, по умолчанию 500]
+"""
+
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+from datetime import date
+
+from benchmarks.common import Stopwatch, percentiles, rotation, seed
+from database.async_database import AsyncDatabase
+from database.database import Database
+from database.retention import Retention
+from my_calendar.export import ShiftExport
+from my_calendar.telegram_calendar import Calendar
+
+YEARS = range(2016, 2026)
+TODAY = date(2025, 10, 18)
+# Работал только в старые годы: после переноса все его смены в архиве,
+# а сводки ему приходить не перестают
+ARCHIVED_USER = 10**6
+SAMPLE_USERS = [1, 2, 3, 250, ARCHIVED_USER]
+WRITES = 300
+
+
+def size_report(name, db, path):
+    """Размер файла, строк events и строк архива"""
+    size = os.path.getsize(path)
+    events = db.conn.execute("SELECT count(*) FROM events").fetchone()[0]
+    archived = db.conn.execute("SELECT count(*) FROM events_archive").fetchone()[0]
+    print(
+        f"{name:>18}: файл {size / 1024 / 1024:6.1f} МБ, "
+        f"строк events {events:8d}, строк архива {archived:5d}"
+    )
+    return size, events, archived
+
+
+async def snapshot(db, exporter, calendar_, team_id):
+    """Всё, что видит пользователь: смены по годам, .ics и клавиатура месяца"""
+    db.shifts.clear()
+    calendar_.markup_cache.clear()
+    result = {
+        "team": await db.get_team_shifts(team_id, "2018-02-20", "2019-01-10"),
+        "digests": sorted(
+            set(await db.get_default_notification_users()) & set(SAMPLE_USERS)
+        ),
+    }
+    for user_id in SAMPLE_USERS:
+        for year in YEARS:
+            events = await db.get_year_events([user_id], year)
+            result[(user_id, year)] = sorted((d, bool(s)) for _, d, s in events)
+        result[(user_id, "month")] = (
+            [(d, bool(s)) for d, s in await db.get_events(user_id, 2018, 3)],
+            await db.get_month_events(user_id, 2018, 3),
+            [await db.get_event(user_id, f"2018-03-{day:02d}") for day in (1, 2, 3, 4)],
+        )
+        ics = []
+        async for chunk in exporter.iter_ics(user_id):
+            # DTSTAMP - время выгрузки, меняется от раза к разу
+            ics.extend(
+                line for line in chunk.splitlines() if not line.startswith(b"DTSTAMP")
+            )
+        result[(user_id, "ics")] = ics
+        markup = await calendar_.create_calendar(user_id, 2018, 3)
+        result[(user_id, "markup")] = markup.to_dict()
+    return result
+
+
+async def write_latencies(db, user_id):
+    latencies = []
+    for i in range(WRITES):
+        with Stopwatch() as timer:
+            await db.add_event(user_id, f"2025-10-{i % 28 + 1:02d}", i % 2 == 0)
+        latencies.append(timer.elapsed)
+        await asyncio.sleep(0.002)
+    return latencies
+
+
+def latency_report(name, latencies):
+    p50, p99, longest = percentiles(latencies)
+    print(
+        f"{name:>18}: add_event p50 {p50 * 1000:6.2f} мс, "
+        f"p99 {p99 * 1000:6.2f} мс, max {longest * 1000:6.2f} мс"
+    )
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "calendar.db")
+        sync_db = Database(path, journal_mode="WAL", synchronous="NORMAL")
+        count, elapsed = seed(
+            sync_db,
+            itertools.chain(
+                rotation(range(1, users + 1), date(YEARS[0], 1, 1), TODAY),
+                rotation([ARCHIVED_USER], date(YEARS[0], 1, 1), date(2019, 12, 31)),
+            ),
+        )
+        team_id = sync_db.create_team("Бригада", "RETENTION", 1, "Первый")
+        for user_id in SAMPLE_USERS[1:]:
+            sync_db.join_team("RETENTION", user_id, f"Участник {user_id}")
+        print(f"Пользователей {users}, смен {count}, заполнено за {elapsed:.1f} с")
+        sync_db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        size_before, events_before, _ = size_report("до переноса", sync_db, path)
+
+        db = AsyncDatabase(sync_db)
+        exporter = ShiftExport(db, cache_dir=os.path.join(tmp, "exports"))
+        calendar_ = Calendar(db)
+        retention = Retention(db)
+        before = await snapshot(db, exporter, calendar_, team_id)
+
+        latency_report("без переноса", await write_latencies(db, users + 1))
+        with Stopwatch() as timer:
+            latencies, moved = await asyncio.gather(
+                write_latencies(db, users + 2), retention.archive(TODAY)
+            )
+        latency_report("во время переноса", latencies)
+        print(
+            f"Перенесено {moved} смен за годы до {retention.archive_year(TODAY)} "
+            f"за {timer.elapsed:.1f} с"
+        )
+
+        with Stopwatch() as timer:
+            await retention.vacuum()
+            sync_db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        print(f"VACUUM шагами: {timer.elapsed:.1f} с")
+        size_after, events_after, archived = size_report(
+            "после переноса", sync_db, path
+        )
+        # Место перенесённых строк возвращено файлу; в events добавились
+        # только смены, записанные во время замеров
+        assert moved > 0 and archived > 0
+        assert events_after <= events_before - moved + 2 * WRITES
+        assert size_after < size_before, "VACUUM не вернул место файлу"
+
+        after = await snapshot(db, exporter, calendar_, team_id)
+        print(f"Видимые данные совпадают: {'да' if before == after else 'нет'}")
+        assert before == after, [key for key in before if before[key] != after[key]]
+
+        # Правка архивного года: год возвращается в events целиком
+        await db.add_event(1, "2018-03-05", True)
+        events = await db.get_year_events([1], 2018)
+        thawed = sync_db.conn.execute(
+            "SELECT count(*) FROM events_archive WHERE user_id = 1 AND year = 2018"
+        ).fetchone()[0]
+        expected = dict(before[(1, 2018)], **{"2018-03-05": True})
+        shifts = sorted((d, bool(s)) for _, d, s in events)
+        print(
+            f"Правка архивного года: год вернулся в events: "
+            f"{'да' if not thawed else 'нет'}, смены верны: "
+            f"{'да' if shifts == sorted(expected.items()) else 'нет'}"
+        )
+        assert not thawed and shifts == sorted(expected.items())
+        mismatched = await db.rebuild_stats()
+        print(f"Расхождений статистики: {mismatched}")
+        assert mismatched == 0
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,91 @@
+"""Проверка очереди уведомлений на переходах на летнее и зимнее время.
+
+Часы идут по минутам через сутки перехода в America/New_York, и на
+каждой минуте pop_due забирает сработавшие ключи. Время из пропавшего
+часа (02:30 в день перехода на летнее время) должно сработать один раз, в
+03:30 по летнему; время из повторяющегося часа (01:30 в день перехода на
+зимнее) - тоже один раз, при первом наступлении; обычное время - в свой
+час по местным часам. Затем - скорость pop_due на USERS ключах.
+
+Запуск: python -m benchmarks.scheduler
+"""
+
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from benchmarks.common import Stopwatch
+from my_calendar.scheduler import NotificationScheduler, next_fire_time
+
+TZ = ZoneInfo("America/New_York")
+SPRING_FORWARD = datetime(2026, 3, 8, tzinfo=TZ)
+FALL_BACK = datetime(2026, 11, 1, tzinfo=TZ)
+USERS = 10000
+
+
+def fire_times(notify_time, day, days=3):
+    """Местные моменты срабатывания notify_time за days суток с полуночи перед day"""
+    now = (day - timedelta(days=1)).astimezone(timezone.utc)
+    scheduler = NotificationScheduler()
+    scheduler.schedule("user", notify_time, TZ, now)
+    fired = []
+    for _ in range(days * 24 * 60):
+        now += timedelta(minutes=1)
+        fired.extend(fire_at.astimezone(TZ) for _, _, fire_at in scheduler.pop_due(now))
+    return fired
+
+
+def local(fired):
+    return [
+        (moment.date().isoformat(), moment.strftime("%H:%M %Z")) for moment in fired
+    ]
+
+
+def check_transitions():
+    # Пропавший час: 02:30 8 марта нет, срабатывает сразу после перехода
+    fired = local(fire_times(time(2, 30), SPRING_FORWARD))
+    print(f"02:30 при переходе на летнее время: {fired}")
+    assert fired == [
+        ("2026-03-07", "02:30 EST"),
+        ("2026-03-08", "03:30 EDT"),
+        ("2026-03-09", "02:30 EDT"),
+    ]
+    # Повторяющийся час: 01:30 1 ноября бывает дважды, срабатывает один раз
+    fired = local(fire_times(time(1, 30), FALL_BACK))
+    print(f"01:30 при переходе на зимнее время: {fired}")
+    assert fired == [
+        ("2026-10-31", "01:30 EDT"),
+        ("2026-11-01", "01:30 EDT"),
+        ("2026-11-02", "01:30 EST"),
+    ]
+    # Время вне перехода остаётся тем же по местным часам
+    for day in (SPRING_FORWARD, FALL_BACK):
+        fired = fire_times(time(8, 0), day)
+        assert [moment.strftime("%H:%M") for moment in fired] == ["08:00"] * 3
+    # next_fire_time прямо в момент срабатывания даёт следующие сутки
+    first = next_fire_time(time(1, 30), TZ, FALL_BACK.astimezone(timezone.utc))
+    second = next_fire_time(time(1, 30), TZ, first)
+    assert second - first == timedelta(hours=25)
+
+
+def measure_pop_due():
+    start = datetime(2026, 3, 7, tzinfo=timezone.utc)
+    scheduler = NotificationScheduler()
+    for user_id in range(USERS):
+        scheduler.schedule(user_id, time(user_id % 24, user_id % 60), TZ, start)
+    with Stopwatch() as timer:
+        due = scheduler.pop_due(start + timedelta(days=1))
+    print(
+        f"pop_due: {len(due)} ключей за {timer.elapsed * 1000:.1f} мс "
+        f"({timer.elapsed / len(due) * 10**6:.1f} мкс на ключ)"
+    )
+    assert len(due) == USERS and len(scheduler) == USERS
+    assert scheduler.next_deadline() > start + timedelta(days=1)
+
+
+def main():
+    check_transitions()
+    measure_pop_due()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Бенчмарк статистики смен: годовая сводка, цена записи и согласованность.
+
+Годовая сводка пользователя считается двумя способами: как раньше -
+12 вызовов get_events с подсчётом смен в Python, и одним чтением
+shift_stats (до 12 строк). Цена поддержки статистики - скорость add_event
+и import_events с пересчётом месяцев и без него. В конце идёт случайная
+смесь всех методов записи через групповой коммит, после которой
+shift_stats затронутых пользователей должна совпасть с подсчётом по
+events, а rebuild_stats - найти 0 расхождений.
+
+Запуск: python -m benchmarks.stats
+"""
+
+import asyncio
+import os
+import random
+import tempfile
+from datetime import date
+
+from benchmarks.common import Stopwatch, per_call, rotation, seed
+from database.async_database import AsyncDatabase
+from database.database import Database
+
+USERS = 300
+YEARS = range(2015, 2026)
+REPEAT = 200
+SINGLE_WRITES = 500
+RANDOM_WRITES = 2000
+
+
+def history(users):
+    return rotation(range(1, users + 1), date(YEARS[0], 1, 1), date(YEARS[-1], 12, 31))
+
+
+def year_by_events(db, user_id, year):
+    stats = []
+    for month in range(1, 13):
+        events = db.get_events(user_id, year, month)
+        days = sum(1 for _, is_day in events if is_day)
+        if events:
+            stats.append((month, days, len(events) - days))
+    return stats
+
+
+def measure(name, operation, repeat=REPEAT):
+    elapsed, result = per_call(operation, repeat)
+    print(f"{name:>32}: {elapsed * 1000:8.3f} мс")
+    return result
+
+
+def write_costs(tmp):
+    """Запись с пересчётом статистики и без него (заглушка вместо _update_stats)"""
+    update_stats = Database.__dict__["_update_stats"]
+    for name, stats in (("со статистикой", update_stats), ("без статистики", None)):
+        if stats is None:
+            Database._update_stats = staticmethod(lambda cursor, months: None)
+        try:
+            db = Database(os.path.join(tmp, f"writes_{stats is None}.db"))
+            _, import_time = seed(db, history(100))
+            with Stopwatch() as timer:
+                for i in range(SINGLE_WRITES):
+                    day = f"2030-{i % 12 + 1:02d}-{i % 28 + 1:02d}"
+                    db.add_event(1, day, i % 2 == 0)
+            single = timer.elapsed / SINGLE_WRITES
+            db.close()
+        finally:
+            Database._update_stats = update_stats
+        print(
+            f"{name:>32}: импорт 100 пользователей за {import_time:.2f} с, "
+            f"add_event {single * 1000:.3f} мс"
+        )
+
+
+async def random_writes(db):
+    rng = random.Random(1)
+
+    async def one():
+        user_id = rng.randint(1, 20)
+        year, month = rng.choice(YEARS), rng.randint(1, 12)
+        day = f"{year}-{month:02d}-{rng.randint(1, 28):02d}"
+        operation = rng.random()
+        if operation < 0.4:
+            await db.add_event(user_id, day, rng.random() < 0.5)
+        elif operation < 0.6:
+            await db.delete_event(user_id, day)
+        elif operation < 0.75:
+            await db.add_events(
+                user_id,
+                [(f"{year}-{month:02d}-{d:02d}", d % 3 == 0) for d in range(1, 29)],
+            )
+        elif operation < 0.85:
+            await db.delete_events_for_month(user_id, year, month)
+        else:
+            await db.import_events([(user_id, day, True), (user_id + 1, day, False)])
+
+    await asyncio.gather(*(one() for _ in range(RANDOM_WRITES)))
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_db = Database(os.path.join(tmp, "calendar.db"))
+        count, elapsed = seed(sync_db, history(USERS))
+        print(
+            f"Пользователей {USERS}, смен {count} за {len(YEARS)} лет, "
+            f"заполнено за {elapsed:.1f} с"
+        )
+
+        old = measure("год по get_events", lambda: year_by_events(sync_db, 7, 2020))
+        new = measure("год по shift_stats", lambda: sync_db.get_year_stats(7, 2020))
+        print(f"{'совпадает':>32}: {'да' if old == new else 'нет'}")
+        assert old == new
+        write_costs(tmp)
+
+        db = AsyncDatabase(sync_db, commit_window=0.001)
+        with Stopwatch() as timer:
+            await random_writes(db)
+        # Пользователи 1-21: случайные записи и import_events для user_id + 1
+        recounted = [
+            (user_id, year)
+            for user_id in range(1, 22)
+            for year in YEARS
+            if year_by_events(sync_db, user_id, year)
+            != sync_db.get_year_stats(user_id, year)
+        ]
+        mismatched = await db.rebuild_stats()
+        print(
+            f"{RANDOM_WRITES} случайных записей за {timer.elapsed:.1f} с, "
+            f"лет с другим подсчётом по events: {len(recounted)}, "
+            f"расхождений статистики: {mismatched}"
+        )
+        assert not recounted, recounted[:5]
+        assert mismatched == 0
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,245 @@
+"""Сводный бенчмарк бота на синтетических пользователях и фейковом Telegram.
+
+Заполняет временную базу N пользователями с M месяцами смен и прогоняет
+create_calendar, calendar_callback (day/add/prev/next/fill_month/clear_events)
+и check_and_notify против FakeBot. Для каждого сценария считает операции в
+секунду, p50/p99 задержки и SQL-запросы на операцию, результат сохраняет в
+JSON, чтобы сравнивать коммиты между собой.
+
+Запуск:
+    python -m benchmarks.suite --users 200 --months 12 --output results.json
+    python -m benchmarks.suite --compare results.json
+"""
+
+import argparse
+import asyncio
+import calendar
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+from datetime import date
+from types import SimpleNamespace
+
+from benchmarks.common import CYCLE, QueryCounter, Stopwatch, percentiles, rotation
+from benchmarks.fake_bot import FakeBot, callback_update
+from database.async_database import AsyncDatabase
+from database.database import Database
+from my_calendar.callback_codec import encode_callback
+from my_calendar.dispatcher import MessageDispatcher
+from my_calendar.notification import Notification
+from my_calendar.telegram_calendar import Calendar
+
+START_YEAR = 2024
+
+
+def months(count):
+    for index in range(count):
+        yield START_YEAR + index // 12, index % 12 + 1
+
+
+def seed(db, users, month_count, rnd):
+    """Смены по графику 2/2/4 со случайным сдвигом у каждого пользователя"""
+    user_ids = range(1, users + 1)
+    offsets = {user_id: rnd.randrange(len(CYCLE)) for user_id in user_ids}
+    year, month = list(months(month_count))[-1]
+    last_day = date(year, month, calendar.monthrange(year, month)[1])
+    db.import_events(
+        rotation(user_ids, date(START_YEAR, 1, 1), last_day, offsets=offsets)
+    )
+
+
+class Suite:
+    def __init__(self, args):
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.results = {}
+
+    def random_target(self):
+        year, month = self.rnd.choice(list(months(self.args.months)))
+        return self.rnd.randint(1, self.args.users), year, month
+
+    async def measure(self, name, operation, prepare=None, iterations=None):
+        """Прогон сценария: prepare (вне замера) и operation на каждой итерации"""
+        iterations = iterations or self.args.iterations
+        latencies = []
+        queries = 0
+        for i in range(iterations):
+            context = await prepare(i) if prepare else None
+            if self.args.cold:
+                self.calendar.markup_cache.clear()
+                self.db.shifts.clear()
+            self.counter.count = 0
+            with Stopwatch() as timer:
+                await operation(context)
+            latencies.append(timer.elapsed)
+            queries += self.counter.count
+
+        total = sum(latencies)
+        p50, p99, _ = percentiles(latencies)
+        result = {
+            "iterations": iterations,
+            "ops_per_sec": iterations / total if total else 0.0,
+            "p50_ms": p50 * 1000,
+            "p99_ms": p99 * 1000,
+            "queries_per_op": queries / iterations,
+        }
+        self.results[name] = result
+        print(
+            f"{name:>22}: {result['ops_per_sec']:9.1f} оп/с  "
+            f"p50 {result['p50_ms']:7.3f} мс  p99 {result['p99_ms']:7.3f} мс  "
+            f"{result['queries_per_op']:6.1f} SQL/оп"
+        )
+
+    async def tap(self, user_id, data):
+        self.update_id += 1
+        update = callback_update(self.update_id, user_id, data, self.bot)
+        await self.calendar.calendar_callback(update, None)
+        # Правка сообщения уходит в фоне: замер включает её отправку
+        await self.calendar.wait_edits()
+
+    async def run(self):
+        args = self.args
+        with tempfile.TemporaryDirectory() as tmp:
+            sync_db = Database(os.path.join(tmp, "calendar.db"))
+            seed(sync_db, args.users, args.months, self.rnd)
+            self.db = AsyncDatabase(sync_db)
+            self.counter = QueryCounter(sync_db.conn)
+            self.bot = FakeBot()
+            self.calendar = Calendar(self.db)
+            self.update_id = 0
+            await self.scenarios()
+            await self.db.close()
+
+    async def scenarios(self):
+        async def random_target(_):
+            return self.random_target()
+
+        async def render(target):
+            await self.calendar.create_calendar(*target)
+
+        await self.measure("create_calendar", render, random_target)
+
+        for action in ("day", "add_day", "add_night", "prev", "next"):
+
+            async def tap_action(target, action=action):
+                user_id, year, month = target
+                if action in ("prev", "next"):
+                    data = encode_callback(action, year, month)
+                else:
+                    day = self.rnd.randint(1, calendar.monthrange(year, month)[1])
+                    data = encode_callback(action, year, month, day)
+                await self.tap(user_id, data)
+
+            await self.measure(f"callback:{action}", tap_action, random_target)
+
+        async def fill_target(_):
+            # Месяц, начатый двумя днями и двумя ночами, чтобы кнопка была доступна
+            user_id, year, month = self.random_target()
+            await self.db.delete_events_for_month(user_id, year, month)
+            await self.db.add_events(
+                user_id,
+                [
+                    (f"{year}-{month:02d}-{day:02d}", is_day)
+                    for day, is_day in ((1, True), (2, True), (3, False), (4, False))
+                ],
+            )
+            return user_id, year, month
+
+        async def fill_month(target):
+            user_id, year, month = target
+            await self.tap(user_id, encode_callback("fill_month", year, month))
+
+        await self.measure("callback:fill_month", fill_month, fill_target)
+
+        async def clear_events(target):
+            user_id, year, month = target
+            await self.tap(user_id, encode_callback("clear_events", year, month))
+
+        await self.measure("callback:clear_events", clear_events, fill_target)
+
+        # Уведомления: одна операция - рассылка всем пользователям по умолчанию
+        notification = Notification(SimpleNamespace(bot=self.bot), self.db)
+        notification.dispatcher = MessageDispatcher(
+            self.bot, global_rate=10**9, per_chat_rate=10**9
+        )
+
+        async def notify(_):
+            await notification.check_and_notify(notification.app)
+
+        await self.measure(
+            "check_and_notify",
+            notify,
+            iterations=max(1, self.args.iterations // 100),
+        )
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nСравнение с {baseline_path} (коммит {baseline.get('commit')}):")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None or not before["ops_per_sec"]:
+            continue
+        change = (result["ops_per_sec"] / before["ops_per_sec"] - 1) * 100
+        print(
+            f"{name:>22}: {change:+7.1f}% оп/с, SQL/оп "
+            f"{before['queries_per_op']:.1f} -> {result['queries_per_op']:.1f}"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--cold", action="store_true", help="сбрасывать кэши перед каждой операцией"
+    )
+    parser.add_argument("--output", help="куда сохранить результаты в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    return parser.parse_args()
+
+
+async def main():
+    args = parse_args()
+    suite = Suite(args)
+    await suite.run()
+
+    report = {
+        "commit": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {
+            "users": args.users,
+            "months": args.months,
+            "iterations": args.iterations,
+            "seed": args.seed,
+            "cold": args.cold,
+        },
+        "results": suite.results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        compare(suite.results, args.compare)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+"""Бенчмарк "кто на смене" для бригад на 10 000 пользователей.
+
+Все USERS пользователей работают по графику 2/2/4 со сдвигом и состоят в
+одной большой бригаде (весь завод); первые SMALL_TEAM из них - ещё и в
+маленькой. Для обеих бригад меряется запрос на день и на неделю с планом,
+который выбирает SQLite, диапазоном по индексу (date, is_day, user_id),
+обходом участников по индексу (user_id, date, is_day) и полным просмотром
+events, как было бы без индексов, и get_team_shifts, который выбирает
+индекс по размеру бригады: для завода на день - диапазон дат, для
+маленькой бригады - обход участников. Затем - повторное чтение из кэша Teams;
+после записи одной смены проверяется, что кэш за этот месяц сброшен.
+
+Запуск: python -m benchmarks.teams [пользователей, по умолчанию 10000]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+from benchmarks.common import per_call, per_call_async, rotation, seed
+from database.async_database import AsyncDatabase
+from database.database import Database
+from my_calendar.teams import Teams
+
+FIRST_DAY = date(2025, 9, 1)
+DAYS = 91
+SMALL_TEAM = 25
+QUERY_DAY = date(2025, 10, 15)
+REPEAT = 20
+
+TEAM_QUERY = """
+    SELECT events.date, events.is_day, members.user_id, members.name
+    FROM events {hint}
+    JOIN team_members AS members
+        ON members.team_id = ? AND members.user_id = events.user_id
+    WHERE events.date >= ? AND events.date <= ?
+    ORDER BY events.date, events.is_day DESC, members.name
+"""
+
+
+def seed_teams(db, users):
+    """Смены за DAYS дней и две бригады: (смен, секунды, завод, бригада)"""
+    last_day = FIRST_DAY + timedelta(days=DAYS - 1)
+    count, elapsed = seed(db, rotation(range(1, users + 1), FIRST_DAY, last_day))
+    factory = db.create_team("Завод", "all", 1, "Сотрудник 1")
+    small = db.create_team("Бригада", "small", 1, "Сотрудник 1")
+    with db.transaction() as cursor:
+        cursor.executemany(
+            "INSERT OR IGNORE INTO team_members (team_id, user_id, name) VALUES (?, ?, ?)",
+            [
+                (team_id, user_id, f"Сотрудник {user_id}")
+                for user_id in range(2, users + 1)
+                for team_id in (
+                    (factory, small) if user_id <= SMALL_TEAM else (factory,)
+                )
+            ],
+        )
+    return count, elapsed, factory, small
+
+
+def measure_sql(db, name, hint, team_id, days):
+    sql = TEAM_QUERY.format(hint=hint)
+    params = (
+        team_id,
+        QUERY_DAY.isoformat(),
+        (QUERY_DAY + timedelta(days=days - 1)).isoformat(),
+    )
+    plan = " / ".join(
+        row[3] for row in db.conn.execute("EXPLAIN QUERY PLAN " + sql, params)
+    )
+    elapsed, rows = per_call(lambda: db.conn.execute(sql, params).fetchall(), REPEAT)
+    print(f"{name:>30}: {elapsed * 1000:8.2f} мс, строк {len(rows):6d}  [{plan}]")
+    return rows
+
+
+def measure_chosen(db, name, team_id, days):
+    """get_team_shifts целиком: время и выбранный им индекс"""
+    first_date = QUERY_DAY.isoformat()
+    last_date = (QUERY_DAY + timedelta(days=days - 1)).isoformat()
+    index = db._team_shifts_index(db.conn.cursor(), team_id, first_date, last_date)
+    elapsed, rows = per_call(
+        lambda: db.get_team_shifts(team_id, first_date, last_date), REPEAT
+    )
+    print(f"{name:>30}: {elapsed * 1000:8.2f} мс, строк {len(rows):6d}  [{index}]")
+    return index, rows
+
+
+async def measure_cached(teams, name, team_id, days):
+    elapsed, shifts = await per_call_async(
+        lambda: teams.on_shift(team_id, QUERY_DAY, days), REPEAT
+    )
+    print(f"{name:>30}: {elapsed * 1000:8.3f} мс")
+    return shifts
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    with tempfile.TemporaryDirectory() as tmp:
+        sync_db = Database(os.path.join(tmp, "calendar.db"))
+        count, elapsed, factory, small = seed_teams(sync_db, users)
+        print(f"Пользователей {users}, смен {count}, заполнено за {elapsed:.1f} с")
+
+        chosen = {}
+        for team_name, team_id in (("завод", factory), ("бригада", small)):
+            for days in (1, 7):
+                label = f"{team_name}, {days} дн."
+                expected = measure_sql(
+                    sync_db, f"{label}, выбор SQLite", "", team_id, days
+                )
+                measure_sql(
+                    sync_db,
+                    f"{label}, индекс по дате",
+                    "INDEXED BY idx_events_date",
+                    team_id,
+                    days,
+                )
+                measure_sql(
+                    sync_db,
+                    f"{label}, по пользователям",
+                    "INDEXED BY idx_events_user_date",
+                    team_id,
+                    days,
+                )
+                measure_sql(
+                    sync_db, f"{label}, без индексов", "NOT INDEXED", team_id, days
+                )
+                index, rows = measure_chosen(
+                    sync_db, f"{label}, get_team_shifts", team_id, days
+                )
+                assert rows == expected
+                chosen[(team_name, days)] = index
+
+        assert chosen[("завод", 1)] == "idx_events_date"
+        assert (
+            chosen[("бригада", 1)] == chosen[("бригада", 7)] == "idx_events_user_date"
+        )
+
+        db = AsyncDatabase(sync_db)
+        teams = Teams(db)
+        await teams.on_shift(factory, QUERY_DAY, 7)
+        shifts = await measure_cached(teams, "завод, 7 дн., кэш", factory, 7)
+        on_day = len(shifts[0][1])
+
+        # Сотрудник 1 в этот день не работал, теперь выходит в дневную смену
+        await db.add_event(1, QUERY_DAY.isoformat(), True)
+        shifts = await teams.on_shift(factory, QUERY_DAY, 1)
+        updated = len(shifts[0][1]) == on_day + 1
+        print(
+            f"Днём {on_day} человек, после записи смены кэш обновлён: "
+            f"{'да' if updated else 'нет'}, {teams.cache.stats()}"
+        )
+        await db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
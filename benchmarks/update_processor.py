@@ -0,0 +1,125 @@
+"""Бенчмарк обработки обновлений: последовательно, просто параллельно и
+параллельно с очередью на пользователя.
+
+Каждый пользователь несколько раз быстрой серией отмечает начало графика
+(день, день, ночь, ночь), жмёт "Заполнить месяц", "Очистить" и снова
+отмечает начало графика. fill_month сначала читает месяц, потом пишет,
+так что при параллельной обработке нажатий одного пользователя он читает
+месяц до записи предыдущих нажатий и пишет после очистки из следующих.
+
+Эталон - последовательная обработка. Для остальных схем считаются
+пользователи, у которых ответы (в порядке, в котором их получил Telegram)
+или итоговые смены месяца отличаются от эталона. Очередь на пользователя
+должна давать 0 и там и там; обработка без очередей - нет.
+
+Запуск: python -m benchmarks.update_processor
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from telegram.ext import SimpleUpdateProcessor
+
+from benchmarks.fake_bot import FakeBot, callback_update
+from database.async_database import AsyncDatabase
+from database.database import Database
+from my_calendar.callback_codec import encode_callback
+from my_calendar.telegram_calendar import Calendar
+from server.update_processor import PerUserUpdateProcessor
+
+USERS = 50
+ROUNDS = 3
+CONCURRENCY = 32
+YEAR, MONTH = 2024, 10
+
+START = [
+    encode_callback("add_day", YEAR, MONTH, 1),
+    encode_callback("add_day", YEAR, MONTH, 2),
+    encode_callback("add_night", YEAR, MONTH, 3),
+    encode_callback("add_night", YEAR, MONTH, 4),
+    encode_callback("fill_month", YEAR, MONTH),
+]
+CLEAR = encode_callback("clear_events", YEAR, MONTH)
+# После очистки снова отмечается начало графика: при последовательной
+# обработке в месяце остаются эти 4 смены
+BURST = START + [CLEAR] + START[:4]
+
+
+def interleaved_taps():
+    # Пользователи жмут сериями: нажатия одного пользователя идут подряд,
+    # серии разных пользователей чередуются
+    return [
+        (user_id, data)
+        for _ in range(ROUNDS)
+        for user_id in range(1, USERS + 1)
+        for data in BURST
+    ]
+
+
+async def run(name, processor, expected=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AsyncDatabase(Database(os.path.join(tmp, "calendar.db")))
+        calendar_instance = Calendar(db)
+        bot = FakeBot(latency=0.005, jitter=0.01)
+        users = {}
+
+        start = time.perf_counter()
+        if processor is None:
+            for update_id, (user_id, data) in enumerate(interleaved_taps()):
+                users[str(update_id)] = user_id
+                update = callback_update(update_id, user_id, data, bot)
+                await calendar_instance.calendar_callback(update, None)
+        else:
+            await processor.initialize()
+            tasks = []
+            for update_id, (user_id, data) in enumerate(interleaved_taps()):
+                users[str(update_id)] = user_id
+                update = callback_update(update_id, user_id, data, bot)
+                coroutine = calendar_instance.calendar_callback(update, None)
+                tasks.append(
+                    asyncio.create_task(processor.process_update(update, coroutine))
+                )
+            await asyncio.gather(*tasks)
+            await processor.shutdown()
+        await calendar_instance.wait_edits()
+        elapsed = time.perf_counter() - start
+
+        # Ответы и итоговый месяц каждого пользователя
+        result = {user_id: [] for user_id in range(1, USERS + 1)}
+        for method, kwargs in bot.calls:
+            if method == "answer_callback_query":
+                result[users[kwargs["callback_query_id"]]].append(kwargs["text"])
+        for user_id in result:
+            events = await db.get_month_events(user_id, YEAR, MONTH)
+            result[user_id] = (result[user_id], sorted(events.items()))
+        await db.close()
+
+    taps = USERS * ROUNDS * len(BURST)
+    report = f"{name:>30}: {taps / elapsed:6.0f} нажатий/с"
+    if expected is not None:
+        reordered = sum(1 for u in result if result[u][0] != expected[u][0])
+        lost = sum(1 for u in result if result[u][1] != expected[u][1])
+        report += (
+            f", ответы не как при последовательной обработке: {reordered}, "
+            f"месяц не совпадает: {lost} из {USERS}"
+        )
+    print(report)
+    return result
+
+
+async def main():
+    expected = await run("последовательно (эталон)", None)
+    assert all(len(events) == 4 for _, events in expected.values())
+    await run("параллельно без очередей", SimpleUpdateProcessor(CONCURRENCY), expected)
+    per_user = await run(
+        "параллельно, очередь на польз.",
+        PerUserUpdateProcessor(CONCURRENCY),
+        expected,
+    )
+    assert per_user == expected, "очередь на пользователя нарушила порядок"
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
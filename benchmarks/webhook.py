@@ -0,0 +1,155 @@
+"""Бенчмарк webhook: задержка от POST обновления до очереди Application.
+
+Записанные JSON обновлений отправляются на локальный WebhookServer, как это
+делает Telegram; сеть и токен не нужны. Для сравнения: polling с
+poll_interval=1 после каждого ответа getUpdates спит секунду, поэтому
+нажатие ждёт до 1000 мс (в среднем около 500 мс) плюс круг до серверов Telegram.
+
+Затем проверки устойчивости: сервер без секрета не создаётся, /metrics
+без токена не отдаётся и не включается без него; больше
+max_connections простаивающих соединений не мешают ни обновлению от
+Telegram, ни GET /metrics и закрываются сервером по таймауту; запрос,
+застрявший на середине заголовков, получает 408.
+
+Запуск: python -m benchmarks.webhook
+"""
+
+import asyncio
+import statistics
+import time
+
+import httpx
+from telegram.ext import Application
+
+from benchmarks.fake_bot import callback_update
+from my_calendar.callback_codec import encode_callback
+from server.webhook import WebhookServer
+
+REQUESTS = 2000
+CLIENTS = 4
+SECRET = "benchmark-secret"
+METRICS_TOKEN = "benchmark-metrics"
+TAP = encode_callback("next", 2024, 10)
+
+
+async def client(http, url, update_ids, sent_at):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    for update_id in update_ids:
+        sent_at[update_id] = time.perf_counter()
+        response = await http.post(
+            url,
+            json=callback_update(update_id, 1000 + update_id % 50, TAP),
+            headers=headers,
+        )
+        assert response.status_code == 200, response.status_code
+
+
+async def robustness(app):
+    try:
+        WebhookServer(app, port=0)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("webhook без секрета должен отклоняться")
+    try:
+        WebhookServer(app, port=0, secret_token=SECRET, metrics_path="/metrics")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("метрики без токена не должны включаться")
+
+    webhook = WebhookServer(
+        app,
+        port=0,
+        secret_token=SECRET,
+        max_connections=CLIENTS,
+        metrics_path="/metrics",
+        metrics_token=METRICS_TOKEN,
+        idle_timeout=0.5,
+        read_timeout=0.2,
+    )
+    await webhook.start()
+    base = f"http://127.0.0.1:{webhook.port}"
+    idle = [
+        await asyncio.open_connection("127.0.0.1", webhook.port)
+        for _ in range(CLIENTS * 5)
+    ]
+    async with httpx.AsyncClient(timeout=2) as http:
+        start = time.perf_counter()
+        response = await http.post(
+            f"{base}{webhook.url_path}",
+            json=callback_update(1, 1000, TAP),
+            headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+        )
+        assert response.status_code == 200, response.status_code
+        await app.update_queue.get()
+        response = await http.get(
+            f"{base}/metrics", headers={"Authorization": f"Bearer {METRICS_TOKEN}"}
+        )
+        assert response.status_code == 200, response.status_code
+        busy = time.perf_counter() - start
+        for headers in ({}, {"Authorization": f"Bearer {SECRET}"}):
+            response = await http.get(f"{base}/metrics", headers=headers)
+            assert response.status_code == 403, "метрики без токена"
+
+    # Простаивающие соединения сервер закрывает сам
+    closed = 0
+    for reader, writer in idle:
+        if await asyncio.wait_for(reader.read(), 2) == b"":
+            closed += 1
+        writer.close()
+
+    reader, writer = await asyncio.open_connection("127.0.0.1", webhook.port)
+    writer.write(f"POST {webhook.url_path} HTTP/1.1\r\nHost: x\r\n".encode())
+    status_line = await asyncio.wait_for(reader.readline(), 2)
+    writer.close()
+    await webhook.stop()
+    print(
+        f"{len(idle)} простаивающих соединений: обновление и /metrics за "
+        f"{busy * 1000:.1f} мс, закрыто по таймауту {closed}; "
+        f"застрявший запрос: {status_line.decode().strip()}"
+    )
+    assert closed == len(idle) and b" 408 " in status_line
+
+
+async def main():
+    app = Application.builder().token("123:benchmark").updater(None).build()
+    webhook = WebhookServer(app, port=0, secret_token=SECRET, max_connections=CLIENTS)
+    await webhook.start()
+    url = f"http://127.0.0.1:{webhook.port}{webhook.url_path}"
+
+    async with httpx.AsyncClient() as http:
+        response = await http.post(url, json=callback_update(0, 1000, TAP))
+        assert response.status_code == 403, "запрос без секрета должен отклоняться"
+
+        sent_at = {}
+        latencies = []
+
+        async def consume():
+            for _ in range(REQUESTS):
+                update = await app.update_queue.get()
+                latencies.append(time.perf_counter() - sent_at[update.update_id])
+
+        start = time.perf_counter()
+        await asyncio.gather(
+            consume(),
+            *(
+                client(http, url, range(i + 1, REQUESTS + 1, CLIENTS), sent_at)
+                for i in range(CLIENTS)
+            ),
+        )
+        elapsed = time.perf_counter() - start
+
+    await webhook.stop()
+    latencies.sort()
+    print(
+        f"webhook: {REQUESTS / elapsed:.0f} обновлений/с, "
+        f"p50 {statistics.median(latencies) * 1000:.2f} мс, "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} мс"
+    )
+    print("polling (poll_interval=1): до 1000 мс, в среднем ~500 мс ожидания")
+    await robustness(app)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
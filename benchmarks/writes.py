@@ -0,0 +1,62 @@
+"""Бенчмарк записи: коммит на каждую запись против WAL и группового коммита.
+
+Запуск: python -m benchmarks.writes
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+
+from database.async_database import AsyncDatabase
+from database.database import Database
+
+WRITERS = 50  # Пользователи, одновременно нажимающие кнопки
+WRITES_PER_WRITER = 20
+
+CONFIGS = [
+    ("журнал отката, коммит на запись", {}, None),
+    (
+        "WAL + NORMAL, коммит на запись",
+        {"journal_mode": "WAL", "synchronous": "NORMAL"},
+        None,
+    ),
+    (
+        "WAL + FULL, групповой коммит",
+        {"journal_mode": "WAL", "synchronous": "FULL"},
+        0.002,
+    ),
+    (
+        "WAL + NORMAL, групповой коммит",
+        {"journal_mode": "WAL", "synchronous": "NORMAL"},
+        0.002,
+    ),
+]
+
+
+async def writer(db, user_id):
+    for day in range(WRITES_PER_WRITER):
+        await db.add_event(user_id, f"2024-10-{day + 1:02d}", day % 2 == 0)
+
+
+async def measure(name, options, commit_window):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = AsyncDatabase(
+            Database(os.path.join(tmp, "calendar.db"), **options),
+            commit_window=commit_window,
+        )
+        start = time.perf_counter()
+        await asyncio.gather(*(writer(db, user_id) for user_id in range(WRITERS)))
+        elapsed = time.perf_counter() - start
+        await db.close()
+    total = WRITERS * WRITES_PER_WRITER
+    print(f"{name:>32}: {total / elapsed:8.0f} записей/с")
+
+
+async def main():
+    for name, options, commit_window in CONFIGS:
+        await measure(name, options, commit_window)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
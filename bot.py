@@ -1,6 +1,7 @@
 import asyncio
 import logging
 import os
+from datetime import timedelta
 
 from dotenv import load_dotenv
 from telegram import Update, ReplyKeyboardMarkup
@@ -9,14 +10,80 @@ from telegram.ext import (
     CommandHandler,
 )
 
+from database.async_database import AsyncDatabase
 from database.database import Database
+from database.retention import Retention
+from my_calendar.export import ShiftExport
+from my_calendar.importer import ShiftImport
+from my_calendar.inline import InlineShifts
 from my_calendar.notification import Notification
+from my_calendar.stats import ShiftStats
+from my_calendar.teams import Teams
 from my_calendar.telegram_calendar import Calendar
+from server.metrics import ERRORS, metrics
+from server.update_processor import PerUserUpdateProcessor
+from server.webhook import WebhookServer
 
 load_dotenv()
 TOKEN = os.getenv("BOT_TOKEN")
-
-db = Database()
+# WAL и групповой коммит включаются через окружение, например
+# DB_JOURNAL_MODE=WAL DB_SYNCHRONOUS=NORMAL DB_COMMIT_WINDOW=0.005
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE")
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS")
+DB_COMMIT_WINDOW = os.getenv("DB_COMMIT_WINDOW")
+# Число соединений только для чтения; 0 - читать через соединение записи,
+# тогда чтения разных пользователей идут по очереди в одном потоке.
+# Параллельное чтение - с пулом, лучше вместе с DB_JOURNAL_MODE=WAL:
+# в режиме WAL запись не останавливает чтение
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "0"))
+
+# Приём обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Публичный адрес, который регистрируется в Telegram; без него webhook
+# только слушает локальный порт (например, за прокси, настроенным отдельно)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+# Обязателен в режиме webhook: без него любой, кто знает адрес, может
+# прислать поддельное обновление от имени администратора
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+
+# На сколько минут опоздания после простоя бота ещё досылать сводки
+NOTIFY_CATCH_UP_MINUTES = int(os.getenv("NOTIFY_CATCH_UP_MINUTES", "120"))
+
+# Смены старше стольких дней переносятся в архив целыми годами
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "730"))
+
+# Сколько секунд Telegram кэширует ответ на inline-запрос (@бот today/week);
+# правка смен становится видна в inline-режиме не позже чем через столько
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "10"))
+
+# Сколько обновлений разных пользователей обрабатывается одновременно
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+
+# Метрики: в webhook-режиме отдаются по GET на METRICS_PATH с заголовком
+# Authorization: Bearer METRICS_TOKEN (без токена не отдаются), в любом
+# режиме могут периодически записываться в METRICS_FILE (textfile-коллектор)
+METRICS_PATH = os.getenv("METRICS_PATH", "/metrics")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_FILE = os.getenv("METRICS_FILE")
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "15"))
+# Telegram id администраторов через запятую: им доступны команды /metrics
+# и /stats check и загрузка смен других пользователей из CSV
+ADMIN_IDS = {
+    int(user_id) for user_id in os.getenv("ADMIN_IDS", "").split(",") if user_id
+}
+
+db = AsyncDatabase(
+    Database(
+        journal_mode=DB_JOURNAL_MODE,
+        synchronous=DB_SYNCHRONOUS,
+        read_pool_size=DB_READ_POOL_SIZE,
+    ),
+    commit_window=float(DB_COMMIT_WINDOW) if DB_COMMIT_WINDOW else None,
+)
 
 
 # В начале файла добавьте:
@@ -27,6 +94,7 @@ logger = logging.getLogger(__name__)
 
 
 async def error_handler(update: Update, context):
+    ERRORS.inc("handler")
     logger.error(f"Exception while handling an update: {context.error}")
 
 
@@ -36,26 +104,95 @@ async def start(update: Update, context):
     await update.message.reply_text("Скоро на завод", reply_markup=reply_markup)
 
 
+async def metrics_command(update: Update, context):
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    # Сообщение Telegram ограничено 4096 символами
+    await update.message.reply_text(metrics.summary()[:4096])
+
+
 async def main():
-    app = Application.builder().token(TOKEN).build()
+    if BOT_MODE == "webhook" and not WEBHOOK_SECRET:
+        raise SystemExit("Для BOT_MODE=webhook нужно задать WEBHOOK_SECRET")
+    update_processor = PerUserUpdateProcessor(UPDATE_CONCURRENCY)
+    app = (
+        Application.builder().token(TOKEN).concurrent_updates(update_processor).build()
+    )
     app.add_handler(CommandHandler("start", start))
-
-    Calendar.setup(application=app, db=db)
+    app.add_handler(CommandHandler("metrics", metrics_command))
+
+    calendar_instance = Calendar.setup(application=app, db=db)
+    ShiftExport.setup(application=app, db=db)
+    ShiftImport.setup(application=app, db=db, admin_ids=ADMIN_IDS)
+    Teams.setup(application=app, db=db)
+    ShiftStats.setup(application=app, db=db, admin_ids=ADMIN_IDS)
+    InlineShifts.setup(application=app, db=db, cache_time=INLINE_CACHE_TIME)
+    notification_loop = Notification.setup(
+        application=app,
+        db=db,
+        catch_up_grace=timedelta(minutes=NOTIFY_CATCH_UP_MINUTES),
+    )
 
     app.add_error_handler(error_handler)
 
+    retention = Retention(db, archive_after=timedelta(days=ARCHIVE_AFTER_DAYS))
+
+    notification_task = None
+    retention_task = None
+    metrics_task = None
+    webhook = None
     try:
         await app.initialize()
         await app.start()
-        await app.updater.start_polling(poll_interval=1)
-
-        await asyncio.create_task(Notification.setup(application=app, db=db))
+        if BOT_MODE == "webhook":
+            webhook = WebhookServer(
+                app,
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                metrics_path=METRICS_PATH if METRICS_TOKEN else None,
+                metrics_token=METRICS_TOKEN,
+            )
+            await webhook.start()
+            if WEBHOOK_URL:
+                await app.bot.set_webhook(
+                    url=WEBHOOK_URL,
+                    secret_token=WEBHOOK_SECRET,
+                    max_connections=WEBHOOK_MAX_CONNECTIONS,
+                    allowed_updates=Update.ALL_TYPES,
+                )
+        else:
+            await app.updater.start_polling(poll_interval=1)
+
+        notification_task = asyncio.create_task(notification_loop)
+        retention_task = asyncio.create_task(retention.retention_loop())
+        if METRICS_FILE:
+            metrics_task = asyncio.create_task(
+                metrics.write_file_loop(METRICS_FILE, METRICS_INTERVAL)
+            )
 
         await asyncio.Event().wait()  # Ожидание завершения работы бота
     finally:
-        await app.updater.stop()
+        if notification_task is not None:
+            notification_task.cancel()
+        if retention_task is not None:
+            retention_task.cancel()
+        if metrics_task is not None:
+            metrics_task.cancel()
+        if webhook is not None:
+            await webhook.stop()
+        if app.updater.running:
+            await app.updater.stop()
         await app.stop()
+        # Обновления, уже стоящие в очередях пользователей, обрабатываются,
+        # пока бот ещё не закрыт
+        await update_processor.join()
+        # Правки сообщений календаря идут в фоне и читают базу
+        await calendar_instance.wait_edits()
         await app.shutdown()
+        await db.close()
 
 
 if __name__ == "__main__":
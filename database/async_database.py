@@ -0,0 +1,151 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database.shift_store import ShiftStore
+from server.metrics import DB_SECONDS
+
+
+class AsyncDatabase:
+    """Асинхронная обёртка над Database.
+
+    Каждый вызов метода выполняется в отдельном потоке, поэтому sqlite3
+    не блокирует цикл событий, пока диск занят. Методы вызываются так же,
+    как у Database, только через await: ``await db.get_event(user_id, date)``.
+
+    Если задан commit_window (в секундах, 0 - без ожидания), методы записи
+    идут через единую очередь: всё, что пришло за окно или пока шёл
+    предыдущий коммит, записывается одной транзакцией (групповой коммит).
+    await каждого вызова завершается только после коммита его записи.
+
+    Если у Database есть пул соединений для чтения, чтение идёт параллельно
+    в отдельных потоках по числу соединений, а запись - в своём единственном потоке.
+    Без пула (read_pool_size=0) чтения и записи идут по очереди в одном
+    потоке: цикл событий свободен, но чтения разных пользователей не
+    пересекаются.
+    """
+
+    def __init__(self, db, executor=None, commit_window=None):
+        self.db = db
+        # Один поток для соединения записи: транзакции идут строго по очереди
+        self._executor = executor or ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="database"
+        )
+        if db.read_pool_size:
+            self._read_executor = ThreadPoolExecutor(
+                max_workers=db.read_pool_size, thread_name_prefix="database-read"
+            )
+        else:
+            self._read_executor = self._executor
+        self.commit_window = commit_window
+        self._write_queue = None
+        self._writer_task = None
+        # Горячий путь: смены в памяти, согласованные с записями в базу
+        self.shifts = ShiftStore(self)
+
+    async def run(self, func, *args, **kwargs):
+        """Выполнение произвольной функции в потоке записи базы данных"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def _read(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._read_executor, functools.partial(func, *args, **kwargs)
+        )
+
+    def add_write_listener(self, callback):
+        """Подписка на изменения смен; callback вызывается в потоке базы данных"""
+        self.db.add_write_listener(callback)
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+
+        if not getattr(attr, "is_write", False):
+            call = self._read
+        elif self.commit_window is not None:
+            call = self._write
+        else:
+            call = self.run
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await call(attr, *args, **kwargs)
+            finally:
+                # Вместе с ожиданием свободного потока и группового коммита
+                DB_SECONDS.observe(time.perf_counter() - start, name)
+
+        return method
+
+    async def _write(self, func, *args, **kwargs):
+        if self._writer_task is None:
+            self._write_queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._writer())
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((functools.partial(func, *args, **kwargs), future))
+        return await future
+
+    async def _writer(self):
+        stopping = False
+        while not stopping:
+            batch = [await self._write_queue.get()]
+            if self.commit_window:
+                await asyncio.sleep(self.commit_window)
+            while not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+            # None в очереди - сигнал остановки от close()
+            if None in batch:
+                stopping = True
+                batch = [item for item in batch if item is not None]
+            if batch:
+                await self._commit(batch)
+
+    async def _commit(self, batch):
+        try:
+            results = await self.run(self._commit_batch, [op for op, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), (result, error) in zip(batch, results):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _commit_batch(self, operations):
+        """Выполнение пачки записей одной транзакцией в потоке базы данных.
+
+        Каждая запись идёт в своей точке сохранения, поэтому ошибка одной
+        не откатывает остальные.
+        """
+        results = []
+        with self.db.transaction():
+            for operation in operations:
+                try:
+                    with self.db.transaction():
+                        results.append((operation(), None))
+                except Exception as e:
+                    results.append((None, e))
+        return results
+
+    async def close(self):
+        """Запись оставшейся очереди, закрытие соединений и остановка потоков базы данных"""
+        if self._writer_task is not None:
+            await self._write_queue.put(None)
+            await self._writer_task
+        if self._read_executor is not self._executor:
+            self._read_executor.shutdown(wait=True)
+        await self.run(self.db.close)
+        self._executor.shutdown(wait=True)
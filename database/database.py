@@ -1,17 +1,314 @@
-import calendar
+import heapq
+import itertools
+import json
+import logging
+import os
+import queue
 import sqlite3
-from datetime import datetime
+import threading
+from contextlib import contextmanager
+
+from database.shift_store import BYTES_PER_YEAR, iter_shifts, pack_shifts
+from server.metrics import ERRORS
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+SYNCHRONOUS_LEVELS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+# Статистика смен по месяцам, посчитанная заново по events
+STATS_QUERY = """
+    SELECT user_id, CAST(substr(date, 1, 4) AS INTEGER) AS year,
+        CAST(substr(date, 6, 2) AS INTEGER) AS month,
+        sum(is_day) AS day_shifts, sum(NOT is_day) AS night_shifts
+    FROM events
+    GROUP BY user_id, substr(date, 1, 7)
+"""
+
+# Бригады меньше этого читаются обходом участников по (user_id, date) без
+# подсчёта смен в диапазоне дат
+LARGE_TEAM = 1000
+
+# Пользователи со временем уведомлений по умолчанию: все, у кого есть
+# смены, в том числе только архивные
+DEFAULT_NOTIFICATION_USERS = """
+    SELECT user_id FROM events
+    UNION
+    SELECT user_id FROM events_archive
+    EXCEPT
+    SELECT user_id FROM notification_settings
+"""
+
+
+# Миграции схемы: версия -> запросы. Текущая версия хранится в PRAGMA user_version
+MIGRATIONS = {
+    1: [
+        # Покрывающий индекс: выборки за месяц идут диапазоном по (user_id, date)
+        # и не обращаются к самой таблице за is_day
+        """
+        CREATE INDEX IF NOT EXISTS idx_events_user_date
+        ON events (user_id, date, is_day)
+        """,
+    ],
+    2: [
+        # Личное время уведомлений: notify_time в формате HH:MM, timezone - имя IANA
+        """
+        CREATE TABLE IF NOT EXISTS notification_settings (
+            user_id INTEGER PRIMARY KEY,
+            notify_time TEXT NOT NULL,
+            timezone TEXT NOT NULL
+        )
+        """,
+    ],
+    3: [
+        # Очередь ежедневных сводок: строка на пользователя и дату сводки
+        # создаётся заранее, отправитель помечает доставленные. Время - UTC ISO 8601,
+        # status: pending - ждёт отправки, sent, failed - попытки кончились,
+        # expired - не отправлена вовремя
+        """
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            digest_date TEXT NOT NULL,
+            due_at TEXT NOT NULL,
+            next_attempt_at TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'pending',
+            sent_at TEXT,
+            UNIQUE(user_id, digest_date)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_outbox_pending
+        ON outbox (next_attempt_at) WHERE status = 'pending'
+        """,
+    ],
+    4: [
+        # Выборка "кто на смене" идёт по дате для многих пользователей сразу:
+        # индекс (user_id, date) для неё бесполезен, без этого - полный просмотр
+        """
+        CREATE INDEX IF NOT EXISTS idx_events_date
+        ON events (date, is_day, user_id)
+        """,
+        # Бригады: вступают по коду приглашения, name - имя участника в списках
+        """
+        CREATE TABLE IF NOT EXISTS teams (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            code TEXT NOT NULL UNIQUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS team_members (
+            team_id INTEGER NOT NULL REFERENCES teams (id),
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            PRIMARY KEY (team_id, user_id)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_team_members_user
+        ON team_members (user_id)
+        """,
+    ],
+    5: [
+        # Число дневных и ночных смен за месяц; поддерживается при каждой
+        # записи смен в той же транзакции (Database._update_stats)
+        """
+        CREATE TABLE IF NOT EXISTS shift_stats (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            month INTEGER NOT NULL,
+            day_shifts INTEGER NOT NULL,
+            night_shifts INTEGER NOT NULL,
+            PRIMARY KEY (user_id, year, month)
+        ) WITHOUT ROWID
+        """,
+        f"INSERT OR REPLACE INTO shift_stats {STATS_QUERY}",
+    ],
+    6: [
+        # Архив старых смен: строка на пользователя и год, shifts - битовая
+        # карта года по 2 бита на день (database.shift_store). Год пользователя
+        # хранится целиком либо в events, либо здесь
+        """
+        CREATE TABLE IF NOT EXISTS events_archive (
+            user_id INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            shifts BLOB NOT NULL,
+            PRIMARY KEY (user_id, year)
+        ) WITHOUT ROWID
+        """,
+    ],
+}
+
+
+def writes(method):
+    """Пометка метода записи: AsyncDatabase ставит такие вызовы в очередь группового коммита"""
+    method.is_write = True
+    return method
+
+
+def month_range(year, month):
+    """Полуоткрытый диапазон дат месяца [первое число, первое число следующего)"""
+    next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return f"{year}-{month:02d}-01", f"{next_year}-{next_month:02d}-01"
+
+
+def month_bounds(year, month):
+    """Первая и последняя даты месяца для выборок включительно.
+
+    Последняя - YYYY-MM-31: как строка она не меньше любой даты месяца.
+    """
+    return f"{year}-{month:02d}-01", f"{year}-{month:02d}-31"
 
 
 class Database:
-    def __init__(self, db_path="calendar.db"):
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
-        self.cursor = self.conn.cursor()
+    def __init__(
+        self,
+        db_path="calendar.db",
+        journal_mode=None,
+        synchronous=None,
+        read_pool_size=0,
+    ):
+        # Соединение для записи. Транзакциями управляет transaction(),
+        # поэтому модуль sqlite3 их не открывает
+        self.conn = sqlite3.connect(
+            db_path, check_same_thread=False, isolation_level=None
+        )
+        # Действует только для новой базы и только до смены режима журнала;
+        # существующую базу переводит enable_incremental_vacuum
+        self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self._write_lock = threading.RLock()
+        self._write_listeners = []
+        self._pending_writes = []
+        self._transaction_depth = 0
+        self._configure(journal_mode, synchronous)
         self._create_table()
 
+        # Пул соединений только для чтения; у базы в памяти он невозможен,
+        # тогда чтение идёт через соединение для записи
+        if db_path == ":memory:":
+            read_pool_size = 0
+        self.read_pool_size = read_pool_size
+        self._readers = queue.Queue()
+        for _ in range(read_pool_size):
+            reader = sqlite3.connect(
+                f"file:{os.path.abspath(db_path)}?mode=ro",
+                uri=True,
+                check_same_thread=False,
+                isolation_level=None,
+            )
+            self._readers.put(reader)
+
+    def _configure(self, journal_mode, synchronous):
+        """Режим журнала (например WAL) и уровень synchronous. None - не менять"""
+        if journal_mode is not None:
+            if journal_mode.upper() not in JOURNAL_MODES:
+                raise ValueError(f"Неизвестный режим журнала: {journal_mode}")
+            self.conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+        if synchronous is not None:
+            if synchronous.upper() not in SYNCHRONOUS_LEVELS:
+                raise ValueError(f"Неизвестный уровень synchronous: {synchronous}")
+            self.conn.execute(f"PRAGMA synchronous = {synchronous}")
+
+    @contextmanager
+    def _reader(self):
+        """Курсор для чтения: соединение берётся из пула на время вызова"""
+        if not self.read_pool_size:
+            with self._write_lock:
+                yield self.conn.cursor()
+            return
+        reader = self._readers.get()
+        try:
+            yield reader.cursor()
+        finally:
+            self._readers.put(reader)
+
+    @contextmanager
+    def transaction(self):
+        """Транзакция записи на соединении для записи.
+
+        Вложенный вызов становится точкой сохранения: ошибка внутри него
+        откатывает только его изменения, а коммит делает внешний вызов.
+        Подписчики на изменения оповещаются после коммита.
+        """
+        with self._write_lock:
+            cursor = self.conn.cursor()
+            depth = self._transaction_depth
+            pending = len(self._pending_writes)
+            if depth == 0:
+                cursor.execute("BEGIN IMMEDIATE")
+            else:
+                cursor.execute(f"SAVEPOINT sp{depth}")
+            self._transaction_depth += 1
+            try:
+                yield cursor
+            except BaseException:
+                self._transaction_depth -= 1
+                del self._pending_writes[pending:]
+                if depth == 0:
+                    cursor.execute("ROLLBACK")
+                else:
+                    cursor.execute(f"ROLLBACK TO sp{depth}")
+                    cursor.execute(f"RELEASE sp{depth}")
+                raise
+            self._transaction_depth -= 1
+
+            if depth > 0:
+                cursor.execute(f"RELEASE sp{depth}")
+                return
+            changed = dict.fromkeys(self._pending_writes)
+            self._pending_writes.clear()
+            try:
+                self._update_stats(cursor, changed)
+                cursor.execute("COMMIT")
+            except sqlite3.Error:
+                cursor.execute("ROLLBACK")
+                raise
+        for user_id, year, month in changed:
+            for callback in self._write_listeners:
+                callback(user_id, year, month)
+
+    def add_write_listener(self, callback):
+        """Подписка на изменения смен: callback(user_id, year, month) после коммита"""
+        self._write_listeners.append(callback)
+
+    def _notify_write(self, user_id, year, month):
+        """Запоминает изменённый месяц; подписчики узнают о нём после коммита"""
+        self._pending_writes.append((user_id, year, month))
+
+    @staticmethod
+    def _update_stats(cursor, months):
+        """Пересчёт shift_stats за изменённые месяцы перед коммитом.
+
+        Месяц пересчитывается по индексу (user_id, date) - не больше 31
+        строки, поэтому любая запись смен, включая пачки и импорт,
+        оставляет статистику согласованной без отдельной логики в каждом методе.
+        """
+        if not months:
+            return
+        cursor.executemany(
+            "DELETE FROM shift_stats WHERE user_id = ? AND year = ? AND month = ?",
+            months,
+        )
+        cursor.executemany(
+            """
+            INSERT INTO shift_stats (user_id, year, month, day_shifts, night_shifts)
+            SELECT user_id, ?, ?, sum(is_day), sum(NOT is_day) FROM events
+            WHERE user_id = ? AND date >= ? AND date < ?
+            GROUP BY user_id
+        """,
+            [
+                (year, month, user_id, *month_range(year, month))
+                for user_id, year, month in months
+            ],
+        )
+
     def _create_table(self):
-        """Создание таблицы для хранения событий, если она не существует"""
-        self.cursor.execute(
+        """Создание таблицы для хранения событий и применение миграций схемы"""
+        cursor = self.conn.cursor()
+        cursor.execute(
             """
             CREATE TABLE IF NOT EXISTS events (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -22,156 +319,884 @@ class Database:
             )
         """
         )
-        self.conn.commit()
 
-    def add_event(self, user_id, date, is_day):
-        """Добавление или обновление события в базе данных"""
-        try:
-            self.cursor.execute(
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        for target in sorted(MIGRATIONS):
+            if target <= version:
+                continue
+            # Каждая миграция атомарна: либо применена целиком вместе с версией, либо нет
+            with self.transaction() as cursor:
+                for statement in MIGRATIONS[target]:
+                    cursor.execute(statement)
+                cursor.execute(f"PRAGMA user_version = {target}")
+
+    def _thaw(self, cursor, user_years):
+        """Возврат архивных лет (user_id, year) в events перед записью в них.
+
+        Уже записанные в events смены не перезаписываются архивными.
+        """
+        for user_id, year in user_years:
+            cursor.execute(
+                "SELECT shifts FROM events_archive WHERE user_id = ? AND year = ?",
+                (user_id, year),
+            )
+            archived = cursor.fetchone()
+            if archived is None:
+                continue
+            cursor.executemany(
                 """
-                INSERT OR REPLACE INTO events (user_id, date, is_day)
+                INSERT OR IGNORE INTO events (user_id, date, is_day)
                 VALUES (?, ?, ?)
             """,
-                (user_id, date, is_day),
+                [
+                    (user_id, day, is_day)
+                    for day, is_day in iter_shifts(*archived, year)
+                ],
+            )
+            cursor.execute(
+                "DELETE FROM events_archive WHERE user_id = ? AND year = ?",
+                (user_id, year),
             )
-            self.conn.commit()
+
+    @writes
+    def add_event(self, user_id, date, is_day):
+        """Добавление или обновление события в базе данных"""
+        try:
+            with self.transaction() as cursor:
+                self._thaw(cursor, [(user_id, int(date[:4]))])
+                cursor.execute(
+                    """
+                    INSERT OR REPLACE INTO events (user_id, date, is_day)
+                    VALUES (?, ?, ?)
+                """,
+                    (user_id, date, is_day),
+                )
+                self._notify_write(user_id, int(date[:4]), int(date[5:7]))
         except sqlite3.Error as e:
-            print(f"Ошибка добавления события: {e}")
+            ERRORS.inc("db")
+            logger.error(f"Ошибка добавления события: {e}")
 
-    def get_event(self, user_id, date):
-        """Получение события на конкретную дату"""
+    @writes
+    def add_events(self, user_id, events, replace=True):
+        """Добавление или обновление многих смен одной транзакцией.
+
+        events - пары (date, is_day). С replace=False занятые дни не
+        меняются. Возвращает число записанных смен.
+        """
+        events = list(events)
+        if not events:
+            return 0
+        conflict = "REPLACE" if replace else "IGNORE"
         try:
-            self.cursor.execute(
-                """
-                SELECT is_day FROM events
-                WHERE user_id = ? AND date = ?
-            """,
-                (user_id, date),
-            )
-            result = self.cursor.fetchone()
-            return result[0] if result else None
+            with self.transaction() as cursor:
+                self._thaw(cursor, {(user_id, int(d[:4])) for d, _ in events})
+                cursor.executemany(
+                    f"""
+                    INSERT OR {conflict} INTO events (user_id, date, is_day)
+                    VALUES (?, ?, ?)
+                """,
+                    [(user_id, date, is_day) for date, is_day in events],
+                )
+                written = cursor.rowcount
+                for year, month in sorted(
+                    {(int(d[:4]), int(d[5:7])) for d, _ in events}
+                ):
+                    self._notify_write(user_id, year, month)
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка добавления событий: {e}")
+            return 0
+        return written
+
+    @writes
+    def import_events(self, rows):
+        """Загрузка смен (user_id, date, is_day) одной транзакцией.
+
+        rows может быть генератором: строки читаются по мере записи и не
+        собираются в список. Возвращает число записанных смен, при ошибке
+        None (транзакция откатывается целиком).
+        """
+        months = set()
+
+        def tracked():
+            for user_id, date, is_day in rows:
+                months.add((user_id, int(date[:4]), int(date[5:7])))
+                yield user_id, date, is_day
+
+        try:
+            with self.transaction() as cursor:
+                cursor.executemany(
+                    """
+                    INSERT OR REPLACE INTO events (user_id, date, is_day)
+                    VALUES (?, ?, ?)
+                """,
+                    tracked(),
+                )
+                count = cursor.rowcount
+                # Годы становятся известны по ходу записи; загруженные смены
+                # при этом важнее архивных
+                self._thaw(cursor, {(user_id, year) for user_id, year, _ in months})
+                for user_id, year, month in sorted(months):
+                    self._notify_write(user_id, year, month)
         except sqlite3.Error as e:
-            print(f"Ошибка получения события: {e}")
+            ERRORS.inc("db")
+            logger.error(f"Ошибка импорта событий: {e}")
             return None
+        return count
 
+    def get_event(self, user_id, date):
+        """Получение события на конкретную дату, в том числе архивного"""
+        events = self.get_events_range(user_id, date, date)
+        return events[0][1] if events else None
+
+    @writes
     def delete_event(self, user_id, date):
-        print(user_id)
-        """Удаление события на конкретную дату"""
+        """Удаление события на конкретную дату; True, если смена была"""
         try:
-            self.cursor.execute(
-                """
-                SELECT id FROM events
-                WHERE user_id = ? AND date = ?
-                LIMIT 1
-            """,
-                (user_id, date),
-            )
-            event_id = self.cursor.fetchone()
-            if event_id:
-                self.cursor.execute(
+            with self.transaction() as cursor:
+                self._thaw(cursor, [(user_id, int(date[:4]))])
+                cursor.execute(
                     """
                     DELETE FROM events
-                    WHERE id = ?
+                    WHERE user_id = ? AND date = ?
                 """,
-                    (event_id[0],),
+                    (user_id, date),
                 )
-                self.conn.commit()
+                deleted = cursor.rowcount > 0
+                if deleted:
+                    self._notify_write(user_id, int(date[:4]), int(date[5:7]))
+            return deleted
         except sqlite3.Error as e:
-            print(f"Ошибка удаления события: {e}")
+            ERRORS.inc("db")
+            logger.error(f"Ошибка удаления события: {e}")
+            return False
 
     def get_events(self, user_id, year, month):
-        """Получение всех событий за конкретный месяц"""
-        try:
-            month_str = f"{year}-{month:02d}"
-            self.cursor.execute(
-                """
-                SELECT date, is_day FROM events
-                WHERE user_id = ? AND strftime('%Y-%m', date) = ?
-            """,
-                (user_id, month_str),
+        """Все события за месяц, в том числе архивные: (date, is_day) по порядку дат"""
+        return self.get_events_range(user_id, *month_bounds(year, month))
+
+    def get_month_events(self, user_id, year, month):
+        """Все смены за месяц одним запросом в виде {день: is_day}"""
+        return {
+            int(date[8:10]): is_day
+            for date, is_day in self.get_events_range(
+                user_id, *month_bounds(year, month)
             )
-            return self.cursor.fetchall()
+        }
+
+    def get_year_events(self, user_ids, year):
+        """Все смены за год для списка пользователей: (user_id, date, is_day).
+
+        Включая архив: events и events_archive читаются одним запросом, то
+        есть из одного снимка базы, и перенос в архив не теряет строк.
+        """
+        users = json.dumps(list(user_ids))
+        try:
+            with self._reader() as cursor:
+                cursor.execute(
+                    """
+                    SELECT events.user_id, events.date, events.is_day, NULL
+                    FROM json_each(?) AS users
+                    JOIN events
+                        ON events.user_id = users.value AND date >= ? AND date < ?
+                    UNION ALL
+                    SELECT archive.user_id, NULL, NULL, archive.shifts
+                    FROM json_each(?) AS users
+                    JOIN events_archive AS archive
+                        ON archive.user_id = users.value AND archive.year = ?
+                """,
+                    (users, f"{year}-01-01", f"{year + 1}-01-01", users, year),
+                )
+                rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка получения событий за год: {e}")
+            return []
+        events = []
+        for user_id, date, is_day, shifts in rows:
+            if shifts is None:
+                events.append((user_id, date, is_day))
+            else:
+                events.extend(
+                    (user_id, day, is_day) for day, is_day in iter_shifts(shifts, year)
+                )
+        return events
+
+    def get_year_bitmaps(self, user_ids, year):
+        """Битовые карты года для списка пользователей: {user_id: bytearray}.
+
+        Те же смены, что у get_year_events, но собираются здесь, в потоке
+        базы: у тысяч пользователей разбор дат занимает сотни миллисекунд и в
+        цикле событий задерживал бы все обработчики. Архивный год уже хранится
+        битовой картой и копируется как есть.
+        """
+        user_ids = list(user_ids)
+        users = json.dumps(user_ids)
+        try:
+            with self._reader() as cursor:
+                cursor.execute(
+                    """
+                    SELECT events.user_id, events.date, events.is_day, NULL
+                    FROM json_each(?) AS users
+                    JOIN events
+                        ON events.user_id = users.value AND date >= ? AND date < ?
+                    UNION ALL
+                    SELECT archive.user_id, NULL, NULL, archive.shifts
+                    FROM json_each(?) AS users
+                    JOIN events_archive AS archive
+                        ON archive.user_id = users.value AND archive.year = ?
+                """,
+                    (users, f"{year}-01-01", f"{year + 1}-01-01", users, year),
+                )
+                rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка получения смен за год: {e}")
+            return None
+        bitmaps = {}
+        events = {}
+        for user_id, day, is_day, shifts in rows:
+            if shifts is not None:
+                bitmaps[user_id] = bytearray(shifts)
+            else:
+                events.setdefault(user_id, []).append((day, is_day))
+        for user_id, shifts in events.items():
+            bitmaps[user_id] = pack_shifts(shifts, bitmaps.get(user_id))
+        for user_id in user_ids:
+            bitmaps.setdefault(user_id, bytearray(BYTES_PER_YEAR))
+        return bitmaps
+
+    def get_events_range(self, user_id, first_date, last_date):
+        """Смены пользователя с first_date по last_date включительно, по порядку дат.
+
+        Один запрос по индексу (user_id, date) и архивным годам диапазона.
+        """
+        try:
+            with self._reader() as cursor:
+                cursor.execute(
+                    """
+                    SELECT date, is_day, NULL FROM events
+                    WHERE user_id = ? AND date >= ? AND date <= ?
+                    UNION ALL
+                    SELECT year, NULL, shifts FROM events_archive
+                    WHERE user_id = ? AND year >= ? AND year <= ?
+                """,
+                    (
+                        user_id,
+                        first_date,
+                        last_date,
+                        user_id,
+                        int(first_date[:4]),
+                        int(last_date[:4]),
+                    ),
+                )
+                rows = cursor.fetchall()
         except sqlite3.Error as e:
-            print(f"Ошибка получения событий: {e}")
+            ERRORS.inc("db")
+            logger.error(f"Ошибка получения смен за период: {e}")
             return []
+        events = [(date, is_day) for date, is_day, shifts in rows if shifts is None]
+        for year, _, shifts in rows:
+            if shifts is not None:
+                events.extend(
+                    event
+                    for event in iter_shifts(shifts, year)
+                    if first_date <= event[0] <= last_date
+                )
+        return sorted(events)
+
+    def get_events_page(self, user_id, after="", limit=1000):
+        """Следующие limit смен пользователя с датой больше after, по порядку дат.
+
+        Постраничное чтение по индексу (user_id, date): вся история
+        пользователя не загружается в память и не держит курсор между вызовами.
+        Архивные годы читаются тем же запросом и распаковываются, только
+        пока не набрана страница.
+        """
+        try:
+            with self._reader() as cursor:
+                cursor.execute(
+                    """
+                    SELECT * FROM (
+                        SELECT date, is_day, NULL FROM events
+                        WHERE user_id = ? AND date > ?
+                        ORDER BY date
+                        LIMIT ?
+                    )
+                    UNION ALL
+                    SELECT year, NULL, shifts FROM events_archive
+                    WHERE user_id = ? AND year >= ?
+                """,
+                    (user_id, after, limit, user_id, int(after[:4] or 0)),
+                )
+                rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка получения страницы событий: {e}")
+            return []
+        events = [(date, is_day) for date, is_day, shifts in rows if shifts is None]
+        archived = sorted((year, shifts) for year, _, shifts in rows if shifts)
+        if not archived:
+            return events
+        archived_events = (
+            event
+            for year, shifts in archived
+            for event in iter_shifts(shifts, year)
+            if event[0] > after
+        )
+        return list(itertools.islice(heapq.merge(events, archived_events), limit))
+
+    @writes
+    def archive_events(self, before_year, limit=100):
+        """Перенос смен за годы раньше before_year из events в events_archive.
+
+        За вызов переносится не больше limit пар (пользователь, год), чтобы
+        транзакция была короткой. Смены при этом не меняются, поэтому
+        подписчики на изменения не оповещаются. Возвращает число
+        перенесённых смен, 0 - переносить больше нечего.
+        """
+        try:
+            with self.transaction() as cursor:
+                # Диапазон по индексу (date, is_day, user_id): старые даты в начале
+                cursor.execute(
+                    """
+                    SELECT DISTINCT user_id, CAST(substr(date, 1, 4) AS INTEGER)
+                    FROM events
+                    WHERE date < ?
+                    LIMIT ?
+                """,
+                    (f"{before_year}-01-01", limit),
+                )
+                moved = 0
+                for user_id, year in cursor.fetchall():
+                    bounds = (user_id, f"{year}-01-01", f"{year + 1}-01-01")
+                    cursor.execute(
+                        """
+                        SELECT date, is_day FROM events
+                        WHERE user_id = ? AND date >= ? AND date < ?
+                    """,
+                        bounds,
+                    )
+                    shifts = cursor.fetchall()
+                    cursor.execute(
+                        "SELECT shifts FROM events_archive WHERE user_id = ? AND year = ?",
+                        (user_id, year),
+                    )
+                    archived = cursor.fetchone()
+                    if archived is not None:
+                        shifts = itertools.chain(iter_shifts(*archived, year), shifts)
+                    cursor.execute(
+                        """
+                        INSERT OR REPLACE INTO events_archive (user_id, year, shifts)
+                        VALUES (?, ?, ?)
+                    """,
+                        (user_id, year, pack_shifts(shifts)),
+                    )
+                    cursor.execute(
+                        """
+                        DELETE FROM events
+                        WHERE user_id = ? AND date >= ? AND date < ?
+                    """,
+                        bounds,
+                    )
+                    moved += cursor.rowcount
+                return moved
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка переноса смен в архив: {e}")
+            return 0
+
+    def enable_incremental_vacuum(self):
+        """Перевод базы в режим auto_vacuum = INCREMENTAL.
+
+        Для базы, созданной до этого режима, нужен однократный полный VACUUM.
+        Вызывается в потоке записи (AsyncDatabase.run). Возвращает True,
+        если VACUUM понадобился.
+        """
+        with self._write_lock:
+            cursor = self.conn.cursor()
+            if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                return False
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+            return True
+
+    def incremental_vacuum(self, pages):
+        """Возврат до pages свободных страниц файлу; возвращает число оставшихся.
+
+        Вызывается в потоке записи (AsyncDatabase.run).
+        """
+        with self._write_lock:
+            cursor = self.conn.cursor()
+            # Каждый шаг оператора освобождает одну страницу: executescript
+            # выполняет его до конца, execute - только первый шаг
+            cursor.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+            return cursor.execute("PRAGMA freelist_count").fetchone()[0]
 
     def get_all_users(self):
         """Получение всех уникальных user_id из таблицы events"""
         try:
-            self.cursor.execute("SELECT DISTINCT user_id FROM events")
-            return [row[0] for row in self.cursor.fetchall()]
+            with self._reader() as cursor:
+                cursor.execute("SELECT DISTINCT user_id FROM events")
+                return [row[0] for row in cursor.fetchall()]
         except sqlite3.Error as e:
-            print(f"Ошибка получения всех пользователей: {e}")
+            ERRORS.inc("db")
+            logger.error(f"Ошибка получения всех пользователей: {e}")
             return []
 
-    def get_last_event(self, user_id, year, month):
+    def get_default_notification_users(self):
+        """Пользователи с событиями, у которых нет личного времени уведомлений"""
         try:
-            self.cursor.execute(
-                """
-                    SELECT is_day, date FROM events
-                    WHERE user_id = ? AND strftime('%Y', date) = ? AND strftime('%m', date) = ?
-                    ORDER BY date DESC
-                    LIMIT 1
+            with self._reader() as cursor:
+                cursor.execute(DEFAULT_NOTIFICATION_USERS)
+                return [row[0] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка получения пользователей для уведомлений: {e}")
+            return []
+
+    @writes
+    def set_notification_settings(self, user_id, notify_time, timezone):
+        """Сохранение личного времени уведомлений пользователя"""
+        try:
+            with self.transaction() as cursor:
+                cursor.execute(
+                    """
+                    INSERT OR REPLACE INTO notification_settings (user_id, notify_time, timezone)
+                    VALUES (?, ?, ?)
+                """,
+                    (user_id, notify_time, timezone),
+                )
+            return True
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка сохранения настроек уведомлений: {e}")
+            return False
+
+    @writes
+    def delete_notification_settings(self, user_id):
+        """Возврат пользователя ко времени уведомлений по умолчанию"""
+        try:
+            with self.transaction() as cursor:
+                cursor.execute(
+                    "DELETE FROM notification_settings WHERE user_id = ?", (user_id,)
+                )
+            return True
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка удаления настроек уведомлений: {e}")
+            return False
+
+    def get_notification_settings(self, user_id=None):
+        """Личные настройки уведомлений: список (user_id, notify_time, timezone)"""
+        try:
+            with self._reader() as cursor:
+                if user_id is None:
+                    cursor.execute(
+                        "SELECT user_id, notify_time, timezone FROM notification_settings"
+                    )
+                else:
+                    cursor.execute(
+                        """
+                        SELECT user_id, notify_time, timezone FROM notification_settings
+                        WHERE user_id = ?
                     """,
-                (user_id, str(year), str(month).zfill(2)),
-            )
-            return self.cursor.fetchone()  # Возвращаем кортеж (is_day, date) или None
+                        (user_id,),
+                    )
+                return cursor.fetchall()
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка получения настроек уведомлений: {e}")
+            return []
+
+    @writes
+    def plan_digests(self, user_ids, digest_date, due_at):
+        """Постановка сводок на digest_date в outbox к моменту due_at.
+
+        user_ids=None - все пользователи со временем уведомлений по умолчанию.
+        Уже запланированные (и отправленные) сводки не дублируются.
+        Возвращает число новых строк или None при ошибке базы.
+        """
+        if user_ids is None:
+            users_query = DEFAULT_NOTIFICATION_USERS
+            params = (digest_date, due_at, due_at)
+        else:
+            users_query = "SELECT value AS user_id FROM json_each(?)"
+            params = (digest_date, due_at, due_at, json.dumps(list(user_ids)))
+        try:
+            with self.transaction() as cursor:
+                cursor.execute(
+                    f"""
+                    INSERT OR IGNORE INTO outbox
+                        (user_id, digest_date, due_at, next_attempt_at)
+                    SELECT users.user_id, ?, ?, ?
+                    FROM ({users_query}) AS users
+                """,
+                    params,
+                )
+                return cursor.rowcount
         except sqlite3.Error as e:
-            print(f"Ошибка получения последнего события: {e}")
+            ERRORS.inc("db")
+            logger.error(f"Ошибка планирования уведомлений: {e}")
             return None
 
-    def get_last_four_events(self, user_id, year, month):
+    def get_due_digests(self, now, limit=500):
+        """Сводки к отправке на момент now: (id, user_id, digest_date, attempts)"""
         try:
-            self.cursor.execute(
-                """
-            SELECT is_day, date FROM events
-            WHERE user_id = ? AND strftime('%Y', date) = ? AND strftime('%m', date) = ?
-            ORDER BY date DESC
-            LIMIT 4
-            """,
-                (user_id, str(year), str(month).zfill(2)),
-            )
-            events = self.cursor.fetchall()
+            with self._reader() as cursor:
+                cursor.execute(
+                    """
+                    SELECT id, user_id, digest_date, attempts FROM outbox
+                    WHERE status = 'pending' AND next_attempt_at <= ?
+                    ORDER BY next_attempt_at
+                    LIMIT ?
+                """,
+                    (now, limit),
+                )
+                return cursor.fetchall()
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка получения уведомлений к отправке: {e}")
+            return []
 
-            if (
-                not events
-            ):  # Если нет событий за текущий месяц, возвращаем пустой список
-                return []
+    def get_next_digest_time(self):
+        """Ближайшее время попытки отправки среди неотправленных сводок или None"""
+        try:
+            with self._reader() as cursor:
+                cursor.execute(
+                    "SELECT min(next_attempt_at) FROM outbox WHERE status = 'pending'"
+                )
+                return cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка получения времени уведомлений: {e}")
+            return None
 
-            last_event_date = datetime.strptime(
-                events[0][1], "%Y-%m-%d"
-            )  # Дата последнего события
-            num_days_in_month = calendar.monthrange(year, month)[
-                1
-            ]  # Количество дней в месяце
+    @writes
+    def mark_digest_sent(self, outbox_id, sent_at):
+        try:
+            with self.transaction() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE outbox SET status = 'sent', sent_at = ?, attempts = attempts + 1
+                    WHERE id = ?
+                """,
+                    (sent_at, outbox_id),
+                )
+            return True
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка отметки уведомления: {e}")
+            return False
 
-            # Проверяем, достаточно ли дней до конца месяца для заполнения
-            remaining_days = num_days_in_month - last_event_date.day
-            if remaining_days < 6:  # 2 дня + 2 ночи + 4 пропуска = 8 дней (минимум)
-                return []  # Недостаточно дней, возвращаем пустой список
+    @writes
+    def retry_digest(self, outbox_id, next_attempt_at):
+        """Неудачная попытка: следующая в next_attempt_at, при None - больше не пытаться"""
+        try:
+            with self.transaction() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE outbox
+                    SET attempts = attempts + 1,
+                        next_attempt_at = coalesce(?, next_attempt_at),
+                        status = CASE WHEN ? IS NULL THEN 'failed' ELSE status END
+                    WHERE id = ?
+                """,
+                    (next_attempt_at, next_attempt_at, outbox_id),
+                )
+            return True
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка переноса уведомления: {e}")
+            return False
 
-            return [
-                row[0] for row in events
-            ]  # Возвращаем список типов событий (True/False)
+    @writes
+    def expire_digests(self, due_before):
+        """Неотправленные сводки со сроком раньше due_before больше не отправляются"""
+        try:
+            with self.transaction() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE outbox SET status = 'expired'
+                    WHERE status = 'pending' AND due_at < ?
+                """,
+                    (due_before,),
+                )
+                return cursor.rowcount
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка отметки просроченных уведомлений: {e}")
+            return 0
 
+    @writes
+    def delete_old_digests(self, digest_before):
+        """Удаление истории outbox за даты раньше digest_before"""
+        try:
+            with self.transaction() as cursor:
+                cursor.execute(
+                    "DELETE FROM outbox WHERE digest_date < ?", (digest_before,)
+                )
+                return cursor.rowcount
         except sqlite3.Error as e:
-            print(f"Ошибка получения событий: {e}")
+            ERRORS.inc("db")
+            logger.error(f"Ошибка очистки outbox: {e}")
+            return 0
+
+    @writes
+    def create_team(self, name, code, user_id, member_name):
+        """Создание бригады с создателем в составе; возвращает id или None"""
+        try:
+            with self.transaction() as cursor:
+                cursor.execute(
+                    "INSERT INTO teams (name, code) VALUES (?, ?)", (name, code)
+                )
+                team_id = cursor.lastrowid
+                cursor.execute(
+                    """
+                    INSERT INTO team_members (team_id, user_id, name)
+                    VALUES (?, ?, ?)
+                """,
+                    (team_id, user_id, member_name),
+                )
+                return team_id
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка создания бригады: {e}")
+            return None
+
+    @writes
+    def join_team(self, code, user_id, member_name):
+        """Вступление в бригаду по коду: (team_id, название) или None, если кода нет"""
+        try:
+            with self.transaction() as cursor:
+                cursor.execute("SELECT id, name FROM teams WHERE code = ?", (code,))
+                team = cursor.fetchone()
+                if team is None:
+                    return None
+                cursor.execute(
+                    """
+                    INSERT OR REPLACE INTO team_members (team_id, user_id, name)
+                    VALUES (?, ?, ?)
+                """,
+                    (team[0], user_id, member_name),
+                )
+                return team
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка вступления в бригаду: {e}")
+            return None
+
+    @writes
+    def leave_team(self, code, user_id):
+        """Выход из бригады по коду; возвращает True, если пользователь в ней состоял"""
+        try:
+            with self.transaction() as cursor:
+                cursor.execute(
+                    """
+                    DELETE FROM team_members
+                    WHERE user_id = ?
+                        AND team_id = (SELECT id FROM teams WHERE code = ?)
+                """,
+                    (user_id, code),
+                )
+                return cursor.rowcount > 0
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка выхода из бригады: {e}")
+            return False
+
+    def get_user_teams(self, user_id):
+        """Бригады пользователя: список (team_id, название, код)"""
+        try:
+            with self._reader() as cursor:
+                cursor.execute(
+                    """
+                    SELECT teams.id, teams.name, teams.code
+                    FROM team_members JOIN teams ON teams.id = team_members.team_id
+                    WHERE team_members.user_id = ?
+                    ORDER BY teams.name
+                """,
+                    (user_id,),
+                )
+                return cursor.fetchall()
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка получения бригад: {e}")
             return []
 
-    def delete_events_for_month(self, user_id, year, month):
+    def get_team_shifts(self, team_id, first_date, last_date):
+        """Смены участников бригады с first_date по last_date включительно.
+
+        Возвращает (date, is_day, user_id, имя) по порядку дат. Архивные годы
+        участников читаются тем же запросом и распаковываются. Индекс для
+        events выбирается по размеру бригады (см. _team_shifts_index).
+        """
         try:
-            self.cursor.execute(
-                """
-            DELETE FROM events
-            WHERE user_id = ? AND strftime('%Y', date) = ? AND strftime('%m', date) = ?
-            """,
-                (user_id, str(year), str(month).zfill(2)),
+            with self._reader() as cursor:
+                index = self._team_shifts_index(cursor, team_id, first_date, last_date)
+                cursor.execute(
+                    f"""
+                    SELECT events.date, events.is_day, members.user_id, members.name
+                    FROM events INDEXED BY {index}
+                    JOIN team_members AS members
+                        ON members.team_id = ? AND members.user_id = events.user_id
+                    WHERE events.date >= ? AND events.date <= ?
+                    UNION ALL
+                    SELECT archive.year, archive.shifts, members.user_id, members.name
+                    FROM events_archive AS archive
+                    JOIN team_members AS members
+                        ON members.team_id = ? AND members.user_id = archive.user_id
+                    WHERE archive.year >= ? AND archive.year <= ?
+                    ORDER BY 1, 2 DESC, 4
+                """,
+                    (
+                        team_id,
+                        first_date,
+                        last_date,
+                        team_id,
+                        int(first_date[:4]),
+                        int(last_date[:4]),
+                    ),
+                )
+                rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка получения смен бригады: {e}")
+            return []
+        # Архивные строки - (год, битовая карта, ...): число в SQLite меньше
+        # строки, поэтому они идут первыми
+        archived = 0
+        while archived < len(rows) and isinstance(rows[archived][0], int):
+            archived += 1
+        if not archived:
+            return rows
+        shifts = rows[archived:]
+        for year, bitmap, user_id, name in rows[:archived]:
+            shifts.extend(
+                (date, is_day, user_id, name)
+                for date, is_day in iter_shifts(bitmap, year)
+                if first_date <= date <= last_date
             )
+        shifts.sort(key=lambda shift: (shift[0], not shift[1], shift[3]))
+        return shifts
+
+    @staticmethod
+    def _team_shifts_index(cursor, team_id, first_date, last_date):
+        """Индекс events для смен бригады за период.
+
+        Обход участников по (user_id, date) - поиск в индексе на участника,
+        диапазон дат по (date, is_day, user_id) - поиск участника на каждую
+        смену всех пользователей за период. Дешевле то, где поисков меньше.
+        Статистика ANALYZE тут не помогает: она знает средний размер бригады,
+        и с ней SQLite выбирает диапазон дат и для бригад из десятка человек.
+        """
+        cursor.execute(
+            "SELECT count(*) FROM team_members WHERE team_id = ?", (team_id,)
+        )
+        members = cursor.fetchone()[0]
+        if members >= LARGE_TEAM:
+            cursor.execute(
+                "SELECT count(*) FROM events WHERE date >= ? AND date <= ?",
+                (first_date, last_date),
+            )
+            if cursor.fetchone()[0] < members:
+                return "idx_events_date"
+        return "idx_events_user_date"
+
+    def get_year_stats(self, user_id, year):
+        """Число смен по месяцам года: список (month, дневных, ночных), до 12 строк"""
+        try:
+            with self._reader() as cursor:
+                cursor.execute(
+                    """
+                    SELECT month, day_shifts, night_shifts FROM shift_stats
+                    WHERE user_id = ? AND year = ?
+                    ORDER BY month
+                """,
+                    (user_id, year),
+                )
+                return cursor.fetchall()
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка получения статистики: {e}")
+            return []
+
+    @writes
+    def rebuild_stats(self):
+        """Пересчёт shift_stats по events и архиву целиком.
+
+        Возвращает число месяцев, статистика которых расходилась с events
+        (0 - таблица была согласована), при ошибке None.
+        """
+        try:
+            with self.transaction() as cursor:
+                cursor.execute(STATS_QUERY)
+                expected = {
+                    (user_id, year, month): (day_shifts, night_shifts)
+                    for user_id, year, month, day_shifts, night_shifts in cursor
+                }
+                # Архивные годы считаются по битовым картам
+                cursor.execute("SELECT user_id, year, shifts FROM events_archive")
+                for user_id, year, shifts in cursor.fetchall():
+                    for day, is_day in iter_shifts(shifts, year):
+                        key = (user_id, year, int(day[5:7]))
+                        day_shifts, night_shifts = expected.get(key, (0, 0))
+                        expected[key] = (
+                            day_shifts + is_day,
+                            night_shifts + (not is_day),
+                        )
+
+                cursor.execute(
+                    """
+                    SELECT user_id, year, month, day_shifts, night_shifts
+                    FROM shift_stats
+                """
+                )
+                stored = {
+                    (user_id, year, month): (day_shifts, night_shifts)
+                    for user_id, year, month, day_shifts, night_shifts in cursor
+                }
+                mismatched = sum(
+                    1
+                    for key in expected.keys() | stored.keys()
+                    if expected.get(key) != stored.get(key)
+                )
+                cursor.execute("DELETE FROM shift_stats")
+                cursor.executemany(
+                    """
+                    INSERT INTO shift_stats
+                        (user_id, year, month, day_shifts, night_shifts)
+                    VALUES (?, ?, ?, ?, ?)
+                """,
+                    [(*key, *counts) for key, counts in expected.items()],
+                )
+                return mismatched
+        except sqlite3.Error as e:
+            ERRORS.inc("db")
+            logger.error(f"Ошибка пересчёта статистики: {e}")
+            return None
+
+    @writes
+    def delete_events_for_month(self, user_id, year, month):
+        try:
+            with self.transaction() as cursor:
+                self._thaw(cursor, [(user_id, year)])
+                cursor.execute(
+                    """
+                DELETE FROM events
+                WHERE user_id = ? AND date >= ? AND date < ?
+                """,
+                    (user_id, *month_range(year, month)),
+                )
+                self._notify_write(user_id, year, month)
             return True
         except sqlite3.Error as e:
-            print(f"Ошибка получения событий: {e}")
+            ERRORS.inc("db")
+            logger.error(f"Ошибка получения событий: {e}")
             return False
 
     def close(self):
-        """Закрытие соединения с базой данных"""
+        """Закрытие соединений с базой данных"""
+        for _ in range(self.read_pool_size):
+            self._readers.get().close()
         self.conn.close()
@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from datetime import date, timedelta
+
+from server.metrics import ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Смены старше этого срока уходят в архив целыми годами
+ARCHIVE_AFTER = timedelta(days=730)
+# Пар (пользователь, год) за одну транзакцию и пауза между транзакциями:
+# перенос идёт через поток записи и не должен задерживать запись смен
+ARCHIVE_BATCH = 4
+ARCHIVE_PAUSE = 0.05
+# Страниц за один шаг incremental_vacuum (4 КБ страница - до 4 МБ за шаг)
+VACUUM_PAGES = 1000
+# Как часто проверять, не пора ли переносить следующий год
+CHECK_INTERVAL = timedelta(hours=6)
+
+
+class Retention:
+    """Перенос старых смен из events в компактный архив.
+
+    Годы, закончившиеся раньше чем ARCHIVE_AFTER назад, переносятся в
+    events_archive - строка с битовой картой на пользователя и год вместо
+    строки и трёх записей индексов на каждую смену. events и его индексы
+    остаются размером в пару лет истории, горячие страницы помещаются в
+    кэш. Архив по-прежнему виден календарю (через ShiftStore) и выгрузке
+    .ics; запись в архивный год возвращает его в events.
+
+    Освободившиеся страницы возвращаются файлу маленькими шагами
+    incremental_vacuum с теми же паузами.
+    """
+
+    def __init__(
+        self,
+        db,
+        archive_after=ARCHIVE_AFTER,
+        batch_size=ARCHIVE_BATCH,
+        pause=ARCHIVE_PAUSE,
+        check_interval=CHECK_INTERVAL,
+    ):
+        self.db = db
+        self.archive_after = archive_after
+        self.batch_size = batch_size
+        self.pause = pause
+        self.check_interval = check_interval
+
+    def archive_year(self, today=None):
+        """Годы раньше этого переносятся в архив"""
+        today = today or date.today()
+        return (today - self.archive_after).year
+
+    async def archive(self, today=None):
+        """Перенос всех подходящих смен пачками; возвращает число перенесённых"""
+        before_year = self.archive_year(today)
+        total = 0
+        while True:
+            moved = await self.db.archive_events(before_year, self.batch_size)
+            if not moved:
+                return total
+            total += moved
+            await asyncio.sleep(self.pause)
+
+    async def vacuum(self):
+        """Возврат свободных страниц файлу шагами по VACUUM_PAGES"""
+        remaining = None
+        while True:
+            left = await self.db.run(self.db.db.incremental_vacuum, VACUUM_PAGES)
+            # Без auto_vacuum = INCREMENTAL шаг ничего не освобождает
+            if not left or left == remaining:
+                return
+            remaining = left
+            await asyncio.sleep(self.pause)
+
+    async def retention_loop(self):
+        if await self.db.run(self.db.db.enable_incremental_vacuum):
+            logger.info("База переведена в режим auto_vacuum = INCREMENTAL")
+        while True:
+            try:
+                if await self.archive():
+                    await self.vacuum()
+            except Exception as e:
+                ERRORS.inc("retention")
+                logger.error(f"Ошибка переноса смен в архив: {e}")
+            await asyncio.sleep(self.check_interval.total_seconds())
@@ -0,0 +1,154 @@
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+# Коды смен: 2 бита на день
+NO_SHIFT = 0
+NIGHT = 1
+DAY = 2
+
+# 366 дней по 4 дня в байте
+BYTES_PER_YEAR = 92
+# Сколько лет пользователей держать в памяти: ~150 байт на год, около 15 МБ
+MAX_USER_YEARS = 100_000
+
+
+def _position(day):
+    index = day.timetuple().tm_yday - 1
+    return index >> 2, (index & 3) * 2
+
+
+def read_shift(bitmap, day):
+    """Смена в битовой карте года: True - день, False - ночь, None - смены нет"""
+    byte, shift = _position(day)
+    code = (bitmap[byte] >> shift) & 3
+    if code == NO_SHIFT:
+        return None
+    return code == DAY
+
+
+def write_shift(bitmap, day, is_day):
+    byte, shift = _position(day)
+    code = DAY if is_day else NIGHT
+    bitmap[byte] = (bitmap[byte] & ~(3 << shift)) | (code << shift)
+
+
+def pack_shifts(shifts, bitmap=None):
+    """Битовая карта года из пар (YYYY-MM-DD, is_day) одного года.
+
+    Если bitmap задана, смены записываются поверх неё.
+    """
+    if bitmap is None:
+        bitmap = bytearray(BYTES_PER_YEAR)
+    for day, is_day in shifts:
+        write_shift(bitmap, date.fromisoformat(day), is_day)
+    return bitmap
+
+
+def iter_shifts(bitmap, year):
+    """Смены из битовой карты года по порядку дат: (YYYY-MM-DD, is_day)"""
+    first = date(year, 1, 1).toordinal()
+    for byte_index, byte in enumerate(bitmap):
+        if not byte:
+            continue
+        for slot in range(4):
+            code = (byte >> (slot * 2)) & 3
+            if code != NO_SHIFT:
+                day = date.fromordinal(first + byte_index * 4 + slot)
+                yield day.isoformat(), code == DAY
+
+
+class ShiftStore:
+    """Смены в памяти: битовая карта года на пользователя, 2 бита на день.
+
+    Год пользователя загружается из events одним запросом при первом
+    обращении, дальше день/ночь/ничего определяется за O(1) без SQL.
+    При записи в базу год пользователя сбрасывается и перечитывается
+    при следующем обращении; загрузка, пересёкшаяся с записью, не сохраняется.
+    Хранится не больше maxsize лет, давно не нужные вытесняются первыми.
+    """
+
+    def __init__(self, db, maxsize=MAX_USER_YEARS):
+        self.db = db
+        self.maxsize = maxsize
+        self._years = OrderedDict()  # (user_id, year) -> bytearray, по давности
+        self._generation = 0
+        self._lock = threading.Lock()
+        db.add_write_listener(self._invalidate)
+
+    def _invalidate(self, user_id, year, month):
+        with self._lock:
+            self._generation += 1
+            self._years.pop((user_id, year), None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._years.clear()
+
+    async def bitmaps(self, user_ids, year):
+        """Битовые карты года для пользователей; недостающие читаются одним запросом"""
+        result = {}
+        missing = []
+        with self._lock:
+            for user_id in user_ids:
+                bitmap = self._years.get((user_id, year))
+                if bitmap is None:
+                    missing.append(user_id)
+                else:
+                    self._years.move_to_end((user_id, year))
+                    result[user_id] = bitmap
+        if not missing:
+            return result
+
+        generation = self._generation
+        # Карты собираются в потоке базы, в цикл событий приходят готовыми
+        loaded = await self.db.get_year_bitmaps(missing, year)
+        if loaded is None:
+            # Ошибка чтения: пустые карты, в память не сохраняются
+            result.update((user_id, bytearray(BYTES_PER_YEAR)) for user_id in missing)
+            return result
+        with self._lock:
+            if generation == self._generation:
+                for user_id, bitmap in loaded.items():
+                    self._years[(user_id, year)] = bitmap
+                while len(self._years) > self.maxsize:
+                    self._years.popitem(last=False)
+        result.update(loaded)
+        return result
+
+    async def get_event(self, user_id, day):
+        """Смена на дату (date или строка YYYY-MM-DD): True, False или None"""
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        bitmap = (await self.bitmaps([user_id], day.year))[user_id]
+        return read_shift(bitmap, day)
+
+    async def get_month_events(self, user_id, year, month):
+        """Все смены месяца в виде {день: is_day}, как Database.get_month_events"""
+        bitmap = (await self.bitmaps([user_id], year))[user_id]
+        events = {}
+        day = date(year, month, 1)
+        while day.month == month:
+            shift = read_shift(bitmap, day)
+            if shift is not None:
+                events[day.day] = shift
+            day += timedelta(days=1)
+        return events
+
+    def stats(self):
+        """Размер хранилища в памяти"""
+        with self._lock:
+            years = list(self._years.items())
+        user_years = len(years)
+        users = len({user_id for (user_id, _), _ in years})
+        size = sum(sys.getsizeof(bitmap) for _, bitmap in years)
+        return {
+            "users": users,
+            "user_years": user_years,
+            "bitmap_bytes": user_years * BYTES_PER_YEAR,
+            "bytes_with_overhead": size,
+            "bytes_per_user": size // users if users else 0,
+            "maxsize": self.maxsize,
+        }
@@ -0,0 +1,99 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Ограниченный LRU-кэш с инвалидацией по тегу.
+
+    Каждое значение кладётся с тегом (например, (user_id, year, month)),
+    invalidate(tag) удаляет ровно записи с этим тегом. Инвалидация может
+    прийти из потока базы данных, поэтому операции защищены блокировкой.
+
+    Значение, построенное по данным, прочитанным до инвалидации его тега,
+    не сохраняется (см. put). Инвалидация других тегов его не отбрасывает:
+    для каждого тега помнится момент последней инвалидации. Таких отметок
+    хранится не больше maxsize; при вытеснении старой отметки отбрасываются
+    все чтения, начатые до неё, - это безопасно, но реже кэширует.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # ключ -> (тег, значение)
+        self._tags = {}  # тег -> множество ключей
+        self._generation = 0
+        self._invalidated = OrderedDict()  # тег -> generation его инвалидации
+        self._stale_before = 0  # чтения, начатые раньше, устарели целиком
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def generation(self):
+        """Счётчик инвалидаций: запоминается до чтения из базы и передаётся в put"""
+        return self._generation
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value, tag, generation):
+        """Сохранение значения, если с момента generation его тег не инвалидировался.
+
+        Иначе значение могло быть построено по данным до записи и уже устарело.
+        """
+        with self._lock:
+            if (
+                generation < self._stale_before
+                or self._invalidated.get(tag, -1) > generation
+            ):
+                return
+            self._remove(key)
+            self._data[key] = (tag, value)
+            self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+
+    def invalidate(self, tag):
+        with self._lock:
+            self._generation += 1
+            self._invalidated[tag] = self._generation
+            self._invalidated.move_to_end(tag)
+            if len(self._invalidated) > self.maxsize:
+                _, generation = self._invalidated.popitem(last=False)
+                self._stale_before = max(self._stale_before, generation)
+            for key in self._tags.pop(tag, ()):
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._stale_before = self._generation
+            self._invalidated.clear()
+            self._data.clear()
+            self._tags.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _remove(self, key):
+        item = self._data.pop(key, None)
+        if item is None:
+            return
+        keys = self._tags[item[0]]
+        keys.discard(key)
+        if not keys:
+            del self._tags[item[0]]
@@ -0,0 +1,73 @@
+from datetime import date
+
+# Версия раскладки: кнопки из сообщений со старой раскладкой отклоняются,
+# а не разбираются неверно
+VERSION = 1
+# Код действия - индекс в кортеже, поэтому новые действия добавляются только в конец
+ACTIONS = (
+    "ignore",
+    "day",
+    "add_day",
+    "add_night",
+    "delete_event",
+    "cancel",
+    "prev",
+    "next",
+    "fill_month",
+    "fill_year",
+    "clear_events",
+)
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+# Действия с конкретным днём; остальные, кроме ignore, - с месяцем
+DAY_ACTIONS = {"day", "add_day", "add_night", "delete_event"}
+
+# 32 бита: версия (4), действие (4), год (15), месяц (4), день (5) -
+# 8 шестнадцатеричных символов вместо ~15 у day_2024_10_17. Шестнадцатеричная
+# запись кодируется и разбирается встроенными int/format без циклов в Python
+TOKEN_LENGTH = 8
+
+
+def encode_callback(action, year=0, month=0, day=0):
+    """callback_data кнопки: действие и дата в TOKEN_LENGTH символах"""
+    value = (
+        (VERSION << 28)
+        | (ACTION_CODES[action] << 24)
+        | (year << 9)
+        | (month << 5)
+        | day
+    )
+    return f"{value:08x}"
+
+
+def decode_callback(data):
+    """(действие, год, месяц, день) из callback_data или None.
+
+    None - данные другой версии или старого формата (day_2024_10_17),
+    неизвестное действие или несуществующая дата.
+    """
+    if len(data) != TOKEN_LENGTH:
+        return None
+    try:
+        value = int(data, 16)
+    except ValueError:
+        return None
+    # int() принимает и "0x", "_", пробелы и заглавные буквы
+    if value >> 28 != VERSION or f"{value:08x}" != data:
+        return None
+    code = (value >> 24) & 0xF
+    if code >= len(ACTIONS):
+        return None
+    action = ACTIONS[code]
+    year, month, day = (value >> 9) & 0x7FFF, (value >> 5) & 0xF, value & 0x1F
+
+    if action in DAY_ACTIONS:
+        try:
+            date(year, month, day)
+        except ValueError:
+            return None
+    elif action == "ignore":
+        if year or month or day:
+            return None
+    elif not (1 <= year <= 9999 and 1 <= month <= 12 and day == 0):
+        return None
+    return action, year, month, day
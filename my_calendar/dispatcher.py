@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+from server.metrics import ERRORS, TELEGRAM_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# С какого числа ограничителей чатов начинать чистку простаивающих
+CHAT_LIMITERS_PRUNE_AT = 1024
+
+
+class RateLimiter:
+    """Равномерное ограничение частоты: не больше rate вызовов в секунду.
+
+    Интервал 1/rate отсчитывается от фактического вызова (mark), а не от
+    расписания: если отправка проснулась позже, следующие не сжимаются,
+    и в любой секунде остаётся не больше rate вызовов.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._last = float("-inf")
+
+    def delay(self, now):
+        """Сколько ещё ждать до следующего вызова; 0 и меньше - можно сейчас"""
+        return self._last + self.interval - now
+
+    def mark(self, now):
+        self._last = now
+
+    def idle(self, now):
+        """Интервал истёк: новый ограничитель вёл бы себя так же"""
+        return self.delay(now) <= 0
+
+
+class MessageDispatcher:
+    """Массовая отправка сообщений с ограниченной параллельностью.
+
+    Держится в рамках лимитов Telegram: общий (около 30 сообщений в секунду)
+    и на один чат (около 1 сообщения в секунду). При RetryAfter вся отправка
+    ставится на паузу на указанное Telegram время, затем сообщение повторяется.
+    Ограничители чатов, у которых все слоты в прошлом, выбрасываются, поэтому
+    их число - порядка чатов за последние секунды, а не всех чатов бота.
+    """
+
+    def __init__(
+        self,
+        bot,
+        concurrency=20,
+        global_rate=30,
+        per_chat_rate=1,
+        max_retries=3,
+    ):
+        self.bot = bot
+        self.max_retries = max_retries
+        self.per_chat_rate = per_chat_rate
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._global_limiter = RateLimiter(global_rate)
+        self._chat_limiters = {}
+        self._prune_at = CHAT_LIMITERS_PRUNE_AT
+        self._paused_until = 0.0
+
+    def _chat_limiter(self, chat_id):
+        chat_limiter = self._chat_limiters.get(chat_id)
+        if chat_limiter is not None:
+            return chat_limiter
+        if len(self._chat_limiters) >= self._prune_at:
+            now = time.monotonic()
+            self._chat_limiters = {
+                chat: limiter
+                for chat, limiter in self._chat_limiters.items()
+                if not limiter.idle(now)
+            }
+            # Чистка не чаще, чем через столько же новых чатов
+            self._prune_at = max(CHAT_LIMITERS_PRUNE_AT, 2 * len(self._chat_limiters))
+        chat_limiter = self._chat_limiters[chat_id] = RateLimiter(self.per_chat_rate)
+        return chat_limiter
+
+    async def _wait_turn(self, chat_id):
+        while True:
+            now = time.monotonic()
+            # Ограничитель чата берётся заново: пока ждали, его могли вычистить
+            chat_limiter = self._chat_limiter(chat_id)
+            delay = max(
+                self._paused_until - now,
+                chat_limiter.delay(now),
+                self._global_limiter.delay(now),
+            )
+            if delay <= 0:
+                break
+            # Проснувшихся одновременно пропускает первый, остальные ждут дальше
+            await asyncio.sleep(delay)
+        chat_limiter.mark(now)
+        self._global_limiter.mark(now)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        """Отправка одного сообщения с повторами. Возвращает True, если доставлено"""
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self._wait_turn(chat_id)
+                try:
+                    with TELEGRAM_SECONDS.time("send_message"):
+                        await self.bot.send_message(
+                            chat_id=chat_id, text=text, **kwargs
+                        )
+                    return True
+                except RetryAfter as e:
+                    ERRORS.inc("send_message:retry_after")
+                    # Flood control общий для бота: притормаживаем все отправки
+                    self._paused_until = max(
+                        self._paused_until, time.monotonic() + e.retry_after
+                    )
+                    logger.warning(f"RetryAfter {e.retry_after}s для чата {chat_id}")
+                except BadRequest as e:
+                    ERRORS.inc("send_message:bad_request")
+                    logger.error(f"Telegram отклонил сообщение в чат {chat_id}: {e}")
+                    return False
+                except NetworkError as e:
+                    ERRORS.inc("send_message:network")
+                    logger.warning(f"Сетевая ошибка при отправке в чат {chat_id}: {e}")
+                    await asyncio.sleep(2**attempt)
+                except TelegramError as e:
+                    ERRORS.inc("send_message:rejected")
+                    # Бот заблокирован, чат не найден и т.п. - повтор не поможет
+                    logger.error(f"Не удалось отправить сообщение в чат {chat_id}: {e}")
+                    return False
+            logger.error(f"Сообщение в чат {chat_id} не отправлено после повторов")
+            return False
+
+    async def send_many(self, messages):
+        """Отправка пар (chat_id, text) параллельно. Возвращает число доставленных"""
+        results = await asyncio.gather(
+            *(self.send_message(chat_id, text) for chat_id, text in messages)
+        )
+        return sum(results)
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import tempfile
+import threading
+from datetime import date, datetime, timedelta, timezone
+
+from icalendar import Calendar as ICalendar, Event
+from telegram import Update
+from telegram.ext import CommandHandler, ContextTypes
+
+PRODID = "-//Shift Calendar Bot//RU"
+UID_DOMAIN = "shift-calendar-bot"
+
+
+def _calendar_envelope():
+    """Начало и конец VCALENDAR: между ними потоком пишутся VEVENT"""
+    envelope = ICalendar()
+    envelope.add("prodid", PRODID)
+    envelope.add("version", "2.0")
+    envelope.add("x-wr-calname", "Смены")
+    head, _, tail = envelope.to_ical().partition(b"END:VCALENDAR")
+    return head, b"END:VCALENDAR" + tail
+
+
+# Заглушки в шаблоне VEVENT, вместо них подставляются UID и даты смены
+_TEMPLATE_UID = "template-uid"
+_TEMPLATE_START = date(1900, 1, 1)
+_TEMPLATE_END = date(1900, 1, 2)
+
+
+def _event_template(summary, stamp):
+    """VEVENT, собранный icalendar один раз, с местами под UID и даты.
+
+    Событие на весь день; экранирование текста и формат дат остаются за
+    icalendar, а на каждую смену приходится только подстановка строк.
+    """
+    event = Event()
+    event.add("uid", _TEMPLATE_UID)
+    event.add("dtstamp", stamp)
+    event.add("dtstart", _TEMPLATE_START)
+    event.add("dtend", _TEMPLATE_END)
+    event.add("summary", summary)
+    return (
+        event.to_ical()
+        .replace(b"%", b"%%")
+        .replace(_TEMPLATE_UID.encode(), b"%(uid)s")
+        .replace(_TEMPLATE_START.strftime("%Y%m%d").encode(), b"%(start)s")
+        .replace(_TEMPLATE_END.strftime("%Y%m%d").encode(), b"%(end)s")
+    )
+
+
+def format_events(user_id, rows, templates):
+    """VEVENT на каждую смену (date, is_day); UID стабилен для даты"""
+    chunks = []
+    for day, is_day in rows:
+        start = date.fromisoformat(day)
+        chunks.append(
+            templates[bool(is_day)]
+            % {
+                b"uid": f"{user_id}-{day}@{UID_DOMAIN}".encode(),
+                b"start": start.strftime("%Y%m%d").encode(),
+                b"end": (start + timedelta(days=1)).strftime("%Y%m%d").encode(),
+            }
+        )
+    return b"".join(chunks)
+
+
+class ShiftExport:
+    """Выгрузка смен пользователя в iCalendar (.ics).
+
+    Смены читаются из events страницами по page_size и сразу пишутся в
+    файл, так что память не зависит от длины истории. Готовый файл
+    хранится в cache_dir и отдаётся повторно, пока у пользователя не
+    изменится ни одна смена: версия пользователя растёт с каждой записью.
+    """
+
+    def __init__(self, db, cache_dir="exports", page_size=1000):
+        self.db = db
+        self.cache_dir = cache_dir
+        self.page_size = page_size
+        os.makedirs(cache_dir, exist_ok=True)
+        self._versions = {}  # user_id -> число записей смен с запуска
+        self._exported = {}  # user_id -> версия, с которой собран файл в кэше
+        self._lock = threading.Lock()
+        # Выгрузки одного пользователя по очереди: старая не перезапишет новую
+        self._export_locks = {}
+        db.add_write_listener(self._invalidate)
+
+    def _invalidate(self, user_id, year, month):
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._exported.pop(user_id, None)
+
+    def path(self, user_id):
+        return os.path.join(self.cache_dir, f"{user_id}.ics")
+
+    async def iter_ics(self, user_id):
+        """Содержимое .ics по частям: заголовок, VEVENT страницами, конец"""
+        head, tail = _calendar_envelope()
+        yield head
+        stamp = datetime.now(timezone.utc).replace(microsecond=0)
+        templates = {
+            True: _event_template("Дневная смена ☀️", stamp),
+            False: _event_template("Ночная смена 🌙", stamp),
+        }
+        after = ""
+        while True:
+            rows = await self.db.get_events_page(user_id, after, self.page_size)
+            if not rows:
+                break
+            yield format_events(user_id, rows, templates)
+            if len(rows) < self.page_size:
+                break
+            after = rows[-1][0]
+        yield tail
+
+    async def export(self, user_id):
+        """Путь к актуальному .ics пользователя; файл собирается при изменениях"""
+        lock = self._export_locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            path = self.path(user_id)
+            version = self._versions.get(user_id, 0)
+            if self._exported.get(user_id) == version and os.path.exists(path):
+                return path
+
+            # Пишем во временный файл и подменяем целиком: отправляемый
+            # пользователю файл никогда не бывает недописанным
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    async for chunk in self.iter_ics(user_id):
+                        f.write(chunk)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+            with self._lock:
+                # Если смены менялись во время выгрузки, файл мог их пропустить
+                if self._versions.get(user_id, 0) == version:
+                    self._exported[user_id] = version
+            return path
+
+    async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id = update.effective_user.id
+        path = await self.export(user_id)
+        with open(path, "rb") as f:
+            await update.message.reply_document(
+                document=f,
+                filename="shifts.ics",
+                caption="Смены для импорта в календарь",
+            )
+
+    @classmethod
+    def setup(cls, application, db):
+        export_instance = cls(db)
+        application.add_handler(
+            CommandHandler("export", export_instance.export_command)
+        )
+        return export_instance
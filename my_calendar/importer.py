@@ -0,0 +1,364 @@
+import asyncio
+import csv
+import itertools
+import os
+import re
+import tempfile
+from datetime import date, datetime
+
+from icalendar.prop import vDDDTypes
+from telegram import Update
+from telegram.ext import ContextTypes, MessageHandler, filters
+
+# Telegram отдаёт ботам файлы не больше 20 МБ
+MAX_FILE_SIZE = 20 * 1024 * 1024
+# Без прав администратора: год смен одного человека - десятки КБ
+MAX_USER_FILE_SIZE = 1024 * 1024
+# Смен в одной транзакции записи при загрузке файла
+IMPORT_BATCH = 10_000
+# Сколько ошибок перечислять в ответе
+MAX_REPORTED_ERRORS = 5
+# Ошибки чтения файла целиком, после которых разбор не продолжить
+READ_ERRORS = (UnicodeDecodeError, csv.Error)
+DECODE_FAILED = "файл не в кодировке UTF-8 или cp1251"
+WRITE_FAILED = "ошибка записи в базу"
+
+SHIFT_VALUES = {
+    "day": True,
+    "d": True,
+    "день": True,
+    "д": True,
+    "дневная": True,
+    "1": True,
+    "night": False,
+    "n": False,
+    "ночь": False,
+    "н": False,
+    "ночная": False,
+    "0": False,
+}
+# Пустая ячейка или выходной: смены нет, строка не ошибочная
+OFF_VALUES = {"", "-", "off", "выходной", "в"}
+
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y")
+
+# Слова в названии события .ics; сравниваются целые слова, а не подстроки
+# ("day" не должно находиться в "Holiday" и "Monday")
+ICS_OFF_WORDS = {
+    "выходной",
+    "выходная",
+    "отпуск",
+    "отгул",
+    "больничный",
+    "off",
+    "holiday",
+    "vacation",
+}
+ICS_NIGHT_WORDS = {"ночь", "ночью", "ночная", "ночной", "night"}
+ICS_DAY_WORDS = {"день", "днём", "днем", "дневная", "дневной", "day"}
+
+
+class ImportReport:
+    """Итоги разбора файла: собираются по мере чтения строк"""
+
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+        self.users = set()
+        self.first_date = None
+        self.last_date = None
+        # Причина, по которой загрузка прервана; None - файл загружен целиком
+        self.failed = None
+
+    def error(self, line, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"строка {line}: {message}")
+
+    def shift(self, user_id, day, is_day):
+        self.users.add(user_id)
+        if self.first_date is None or day < self.first_date:
+            self.first_date = day
+        if self.last_date is None or day > self.last_date:
+            self.last_date = day
+        return user_id, day, is_day
+
+    def summary(self):
+        if self.failed:
+            text = f"Загрузка прервана: {self.failed}."
+            if self.imported:
+                text += (
+                    f" До ошибки записано смен: {self.imported}, повторная загрузка "
+                    "файла их перезапишет."
+                )
+            else:
+                text += " Смены не записаны."
+        elif not self.imported:
+            text = "Смены не загружены."
+        else:
+            text = (
+                f"Загружено смен: {self.imported} "
+                f"с {self.first_date} по {self.last_date}"
+            )
+            if len(self.users) > 1:
+                text += f", пользователей: {len(self.users)}"
+            text += "."
+        if self.skipped:
+            text += f"\nПропущено строк: {self.skipped}"
+            text += "".join(f"\n• {error}" for error in self.errors)
+        return text
+
+
+def parse_date(value):
+    value = value.strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date().isoformat()
+        except ValueError:
+            pass
+    return None
+
+
+def parse_csv(lines, user_id, report, allow_other_users=False):
+    """Смены (user_id, date, is_day) из CSV по одной строке.
+
+    Колонки: дата и смена, либо user_id, дата и смена (смены других
+    пользователей только при allow_other_users). Разделитель - запятая,
+    точка с запятой или табуляция; строка заголовка пропускается.
+    """
+    lines = iter(lines)
+    first_line = next(lines, "")
+    try:
+        dialect = csv.Sniffer().sniff(first_line, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(itertools.chain([first_line], lines), dialect)
+    for row in reader:
+        line_number = reader.line_num
+        cells = [cell.strip() for cell in row]
+        if not any(cells):
+            continue
+
+        if len(cells) == 2:
+            row_user_id, day, shift = user_id, cells[0], cells[1]
+        elif len(cells) == 3:
+            row_user_id, day, shift = cells
+            try:
+                row_user_id = int(row_user_id)
+            except ValueError:
+                if line_number > 1:
+                    report.error(line_number, f"неверный user_id {row_user_id!r}")
+                continue
+        else:
+            report.error(line_number, "нужно 2 или 3 колонки")
+            continue
+
+        iso_date = parse_date(day)
+        if iso_date is None:
+            # Первая строка с текстом вместо даты - заголовок
+            if line_number > 1:
+                report.error(line_number, f"неверная дата {day!r}")
+            continue
+        if row_user_id != user_id and not allow_other_users:
+            report.error(line_number, "смены другого пользователя")
+            continue
+        shift = shift.lower()
+        if shift in OFF_VALUES:
+            continue
+        if shift not in SHIFT_VALUES:
+            report.error(line_number, f"неизвестная смена {shift!r}")
+            continue
+        yield report.shift(row_user_id, iso_date, SHIFT_VALUES[shift])
+
+
+def _unfold(lines):
+    """Строки iCalendar с развёрнутыми переносами (RFC 5545, 3.1)"""
+    current = None
+    current_number = 0
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield current_number, current
+        current, current_number = line, line_number
+    if current is not None:
+        yield current_number, current
+
+
+def _ics_words(summary):
+    return set(re.findall(r"\w+", summary.lower()))
+
+
+def _ics_off(summary):
+    """Выходной, отпуск и т.п.: смены нет ("Выходной день", "Day off")"""
+    return bool(_ics_words(summary) & ICS_OFF_WORDS)
+
+
+def _ics_shift(summary, start):
+    """День или ночь по названию события, иначе по времени начала"""
+    words = _ics_words(summary)
+    if words & ICS_NIGHT_WORDS or "🌙" in summary:
+        return False
+    if words & ICS_DAY_WORDS or "☀" in summary:
+        return True
+    if isinstance(start, datetime):
+        return 6 <= start.hour < 18
+    return None
+
+
+def parse_ics(lines, user_id, report):
+    """Смены пользователя из VEVENT файла iCalendar, по одному событию.
+
+    Файл не разбирается целиком: в памяти только текущее событие.
+    """
+    event = None
+    for line_number, line in _unfold(lines):
+        name, _, value = line.partition(":")
+        # Параметры вроде VALUE=DATE или TZID не нужны: дата смены берётся как есть
+        name = name.partition(";")[0].upper()
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            event = {"line": line_number}
+        elif event is None:
+            continue
+        elif name == "END" and value.upper() == "VEVENT":
+            start = event.get("DTSTART")
+            summary = event.get("SUMMARY", "")
+            if start is None:
+                report.error(event["line"], "событие без DTSTART")
+            elif not _ics_off(summary):
+                is_day = _ics_shift(summary, start)
+                if is_day is None:
+                    report.error(event["line"], "не понять, день это или ночь")
+                else:
+                    day = start.date() if isinstance(start, datetime) else start
+                    yield report.shift(user_id, day.isoformat(), is_day)
+            event = None
+        elif name == "DTSTART":
+            try:
+                start = vDDDTypes.from_ical(value)
+            except ValueError:
+                report.error(line_number, f"неверная дата {value!r}")
+                event = None
+                continue
+            if not isinstance(start, date):
+                report.error(line_number, "DTSTART должен быть датой")
+                event = None
+                continue
+            event["DTSTART"] = start
+        elif name == "SUMMARY":
+            event["SUMMARY"] = value.replace("\\,", ",").replace("\\;", ";")
+
+
+def _detect_encoding(path):
+    """UTF-8 (в том числе с BOM) или cp1251, как сохраняет Excel"""
+    with open(path, "rb") as f:
+        sample = f.read(64 * 1024)
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # Обрезанный в конце образца многобайтный символ - не повод менять кодировку
+        if e.start < len(sample) - 3:
+            return "cp1251"
+    return "utf-8-sig"
+
+
+def read_rows(path, kind, user_id, report, allow_other_users=False):
+    """Смены файла (user_id, date, is_day) по одной; ошибки строк - в report"""
+    with open(path, encoding=_detect_encoding(path), newline="") as f:
+        if kind == "ics":
+            yield from parse_ics(f, user_id, report)
+        else:
+            yield from parse_csv(f, user_id, report, allow_other_users)
+
+
+def import_file(db, path, kind, user_id, allow_other_users=False):
+    """Разбор файла и запись смен одной транзакцией Database; возвращает ImportReport"""
+    report = ImportReport()
+    try:
+        imported = db.import_events(
+            read_rows(path, kind, user_id, report, allow_other_users)
+        )
+    except READ_ERRORS:
+        report.failed = DECODE_FAILED
+        return report
+    if imported is None:
+        report.failed = WRITE_FAILED
+    else:
+        report.imported = imported
+    return report
+
+
+async def import_batches(db, path, kind, user_id, allow_other_users=False):
+    """Загрузка файла через AsyncDatabase пачками по IMPORT_BATCH смен.
+
+    Пачка разбирается в отдельном потоке, а в поток записи уходит готовой,
+    поэтому транзакция не ждёт чтения файла и записи других пользователей
+    идут между пачками. Пачки пишутся отдельными транзакциями: при ошибке
+    чтения или записи загрузка останавливается, записанными остаются
+    предыдущие пачки - их число и причина остановки попадают в отчёт.
+    """
+    report = ImportReport()
+    rows = read_rows(path, kind, user_id, report, allow_other_users)
+    while True:
+        try:
+            batch = await asyncio.to_thread(list, itertools.islice(rows, IMPORT_BATCH))
+        except READ_ERRORS:
+            report.failed = DECODE_FAILED
+            return report
+        if not batch:
+            return report
+        imported = await db.import_events(batch)
+        if imported is None:
+            report.failed = WRITE_FAILED
+            return report
+        report.imported += imported
+
+
+class ShiftImport:
+    """Загрузка графика смен из присланного файла .ics или .csv.
+
+    Файл читается построчно и пишется в events пачками через executemany,
+    поэтому год смен для сотен пользователей загружается за секунды, а не
+    отдельным коммитом на каждую смену. Смены других пользователей (CSV с
+    колонкой user_id) и файлы больше 1 МБ может загружать только администратор.
+    """
+
+    def __init__(self, db, admin_ids=()):
+        self.db = db
+        self.admin_ids = set(admin_ids)
+
+    async def import_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id = update.effective_user.id
+        is_admin = user_id in self.admin_ids
+        document = update.message.document
+        if document.file_size and document.file_size > MAX_FILE_SIZE:
+            await update.message.reply_text("Файл больше 20 МБ, Telegram его не отдаст")
+            return
+        if not is_admin and (document.file_size or 0) > MAX_USER_FILE_SIZE:
+            await update.message.reply_text(
+                "Файл больше 1 МБ, это не график одного человека"
+            )
+            return
+        kind = "ics" if document.file_name.lower().endswith(".ics") else "csv"
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f"import.{kind}")
+            file = await document.get_file()
+            await file.download_to_drive(path)
+            report = await import_batches(self.db, path, kind, user_id, is_admin)
+        await update.message.reply_text(report.summary())
+
+    @classmethod
+    def setup(cls, application, db, admin_ids=()):
+        import_instance = cls(db, admin_ids)
+        application.add_handler(
+            MessageHandler(
+                filters.Document.FileExtension("ics")
+                | filters.Document.FileExtension("csv"),
+                import_instance.import_document,
+            )
+        )
+        return import_instance
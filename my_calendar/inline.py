@@ -0,0 +1,154 @@
+from datetime import date, datetime, timedelta
+
+from telegram import InlineQueryResultArticle, InputTextMessageContent, Update
+from telegram.ext import ContextTypes, InlineQueryHandler
+
+from my_calendar.cache import LRUCache
+from my_calendar.importer import parse_date
+from my_calendar.teams import WEEK_DAYS
+from server.metrics import INLINE_SECONDS, TELEGRAM_SECONDS
+
+# Сколько секунд Telegram хранит ответ у себя и не присылает тот же запрос
+# пользователя снова. Этот кэш запись смены не сбрасывает, поэтому он короткий
+INLINE_CACHE_TIME = 10
+# Ключевые слова запроса; подходят и начала слов, пока запрос набирается
+KEYWORDS = {
+    "today": ("today", "сегодня"),
+    "tomorrow": ("tomorrow", "завтра"),
+    "week": ("week", "неделя"),
+}
+TITLES = {"today": "Сегодня", "tomorrow": "Завтра"}
+
+
+def shift_name(is_day):
+    if is_day is None:
+        return "завода нет 🌴"
+    return "День☀️" if is_day else "Ночь🌙"
+
+
+class InlineShifts:
+    """Смены в inline-режиме: "@бот today", "tomorrow", "week" или дата.
+
+    Ответ на период строится одним запросом смен по диапазону дат и
+    запоминается до записи смен этого пользователя, поэтому запросы,
+    которые Telegram присылает по мере набора текста, базу не читают.
+    """
+
+    def __init__(self, db, cache_size=4096, cache_time=INLINE_CACHE_TIME):
+        self.db = db
+        self.cache_time = cache_time
+        # (user_id, вид, первый день) -> (заголовок, описание, текст), тег - user_id
+        self.cache = LRUCache(cache_size)
+        db.add_write_listener(self._invalidate_user)
+
+    def _invalidate_user(self, user_id, year, month):
+        self.cache.invalidate(user_id)
+
+    @staticmethod
+    def periods(text, today):
+        """Периоды запроса: [(вид, первый день, число дней)], пустой - запрос не понят"""
+        text = text.strip().lower()
+        kinds = [
+            kind
+            for kind, names in KEYWORDS.items()
+            if any(name.startswith(text) for name in names)
+        ]
+        periods = []
+        for kind in kinds:
+            if kind == "today":
+                periods.append((kind, today, 1))
+            elif kind == "tomorrow":
+                periods.append((kind, today + timedelta(days=1), 1))
+            else:
+                periods.append((kind, today - timedelta(days=today.weekday()), 7))
+        if not periods:
+            iso_date = parse_date(text)
+            if iso_date is not None:
+                periods.append(("date", date.fromisoformat(iso_date), 1))
+        return periods
+
+    @staticmethod
+    def format_period(kind, first_day, days, shifts):
+        """Заголовок, описание и текст сообщения о сменах периода"""
+        if days == 1:
+            day_name = f"{WEEK_DAYS[first_day.weekday()]} {first_day:%d.%m.%Y}"
+            title = f"{TITLES[kind]}, {day_name}" if kind in TITLES else day_name
+            shift = shift_name(shifts.get(first_day.isoformat()))
+            return title, shift, f"{title}: {shift}"
+
+        last_day = first_day + timedelta(days=days - 1)
+        title = f"Неделя {first_day:%d.%m}–{last_day:%d.%m.%Y}"
+        lines = [title]
+        for i in range(days):
+            day = first_day + timedelta(days=i)
+            shift = shift_name(shifts.get(day.isoformat()))
+            lines.append(f"{WEEK_DAYS[day.weekday()]} {day:%d.%m} {shift}")
+        day_shifts = sum(1 for is_day in shifts.values() if is_day)
+        description = f"Дневных {day_shifts}, ночных {len(shifts) - day_shifts}"
+        return title, description, "\n".join(lines)
+
+    async def summaries(self, user_id, periods):
+        """Ответы на периоды; недостающие строятся по одному запросу смен"""
+        result = {}
+        missing = []
+        for kind, first_day, days in periods:
+            summary = self.cache.get((user_id, kind, first_day))
+            if summary is None:
+                missing.append((kind, first_day, days))
+            else:
+                result[kind] = summary
+
+        if missing:
+            generation = self.cache.generation
+            first = min(first_day for _, first_day, _ in missing)
+            last = max(
+                first_day + timedelta(days=days - 1) for _, first_day, days in missing
+            )
+            events = await self.db.get_events_range(
+                user_id, first.isoformat(), last.isoformat()
+            )
+            for kind, first_day, days in missing:
+                period_last = (first_day + timedelta(days=days - 1)).isoformat()
+                shifts = {
+                    day: bool(is_day)
+                    for day, is_day in events
+                    if first_day.isoformat() <= day <= period_last
+                }
+                summary = self.format_period(kind, first_day, days, shifts)
+                self.cache.put((user_id, kind, first_day), summary, user_id, generation)
+                result[kind] = summary
+
+        return [result[kind] for kind, _, _ in periods]
+
+    async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        query = update.inline_query
+        periods = self.periods(query.query, datetime.now().date())
+        if len(periods) == 1:
+            label = periods[0][0]
+        else:
+            label = "several" if periods else "other"
+
+        with INLINE_SECONDS.time(label):
+            summaries = await self.summaries(query.from_user.id, periods)
+            results = [
+                InlineQueryResultArticle(
+                    id=f"{kind}:{first_day.isoformat()}",
+                    title=title,
+                    description=description,
+                    input_message_content=InputTextMessageContent(text),
+                )
+                for (kind, first_day, _), (title, description, text) in zip(
+                    periods, summaries
+                )
+            ]
+            # Ответ личный: у каждого пользователя свои смены
+            with TELEGRAM_SECONDS.time("answer_inline_query"):
+                await query.answer(
+                    results, cache_time=self.cache_time, is_personal=True
+                )
+
+    @classmethod
+    def setup(cls, application, db, cache_time=INLINE_CACHE_TIME):
+        inline_instance = cls(db, cache_time=cache_time)
+        application.add_handler(InlineQueryHandler(inline_instance.inline_query))
+        return inline_instance
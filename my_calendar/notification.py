@@ -1,14 +1,63 @@
 import asyncio
-from datetime import datetime, timedelta, time
-from zoneinfo import ZoneInfo
+from datetime import date, datetime, timedelta, time, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from telegram import Update
+from telegram.ext import CommandHandler, ContextTypes
+
+from database.shift_store import read_shift
+from my_calendar.dispatcher import MessageDispatcher
+from my_calendar.scheduler import NotificationScheduler
+from server.metrics import ERRORS, NOTIFICATION_SECONDS
+
+DEFAULT_TIMEZONE = ZoneInfo("Europe/Moscow")
+DEFAULT_TIME = time(hour=23, minute=39)
+# Ключ в очереди для всех пользователей без личного времени уведомлений
+DEFAULT_GROUP = "default"
+
+# Сводки ставятся в outbox заранее, чтобы отправка началась точно в срок
+PLAN_AHEAD = timedelta(minutes=10)
+# После простоя бота пропущенные сводки досылаются, если опоздание не больше этого
+CATCH_UP_GRACE = timedelta(hours=2)
+# Повтор неудачной отправки: пауза удваивается с каждой попыткой
+RETRY_DELAY = timedelta(seconds=30)
+MAX_ATTEMPTS = 5
+# Сколько сводок outbox отправляется за один проход
+OUTBOX_BATCH = 500
+# Сколько дней хранится история outbox
+OUTBOX_HISTORY = timedelta(days=7)
+
+
+def utc_iso(moment):
+    """Момент времени в виде, в котором он хранится в outbox"""
+    return moment.astimezone(timezone.utc).isoformat(timespec="seconds")
 
 
 class Notification:
-    def __init__(self, application, db):
+    """Ежедневные сводки смен через outbox в базе данных.
+
+    Очередь времён уведомлений в памяти только планирует: за plan_ahead до
+    срока строки сводок записываются в outbox. Отправитель берёт из outbox
+    наступившие сводки, помечает доставленные и переносит неудачные с
+    паузой, поэтому перезапуск или падение посреди рассылки не теряет и не
+    повторяет уже отправленное. После запуска досылаются сводки, пропущенные
+    за последние catch_up_grace.
+    """
+
+    def __init__(self, application, db, catch_up_grace=CATCH_UP_GRACE):
         self.db = db
         self.app = application
+        self.dispatcher = MessageDispatcher(application.bot)
+        self.scheduler = NotificationScheduler()
+        self.plan_ahead = PLAN_AHEAD
+        self.catch_up_grace = catch_up_grace
+        self.retry_delay = RETRY_DELAY
+        self.max_attempts = MAX_ATTEMPTS
+        self._schedule_changed = asyncio.Event()
+        self._outbox_changed = asyncio.Event()
 
-    async def send_notification(self, user_id, today_event, tomorrow_event, app):
+    @staticmethod
+    def build_message(today_event, tomorrow_event):
         if today_event is None:
             today_message = "Сегодня завода нет 🌴"
         else:
@@ -21,45 +70,252 @@ class Notification:
                 f"Завтра завод: {'День☀️' if tomorrow_event else 'Ночь🌙'}"
             )
 
-        message = f"{today_message}\n{tomorrow_message}"
-        await app.bot.send_message(chat_id=user_id, text=message)
+        return f"{today_message}\n{tomorrow_message}"
+
+    async def notify_users(self, user_ids, today):
+        """Рассылка сводки на today и следующий день.
+
+        user_ids=None - все пользователи со временем уведомлений по умолчанию.
+        Смены берутся из битовых карт в памяти, SQL нужен только для
+        пользователей, чей год ещё не загружен (одним запросом на всех).
+        """
+        with NOTIFICATION_SECONDS.time():
+            return await self._notify_users(user_ids, today)
+
+    async def _notify_users(self, user_ids, today):
+        if user_ids is None:
+            user_ids = await self.db.get_default_notification_users()
+        messages = await self.build_messages(user_ids, today)
+        return await self.dispatcher.send_many(messages)
+
+    async def build_messages(self, user_ids, today):
+        """Пары (user_id, текст сводки на today и следующий день)"""
+        tomorrow = today + timedelta(days=1)
+        years = {
+            year: await self.db.shifts.bitmaps(user_ids, year)
+            for year in {today.year, tomorrow.year}
+        }
+        return [
+            (
+                user_id,
+                self.build_message(
+                    read_shift(years[today.year][user_id], today),
+                    read_shift(years[tomorrow.year][user_id], tomorrow),
+                ),
+            )
+            for user_id in user_ids
+        ]
 
     async def check_and_notify(self, app):
-        now = datetime.now()
-        tomorrow = now + timedelta(days=1)
+        """Рассылка пользователям со временем уведомлений по умолчанию"""
+        return await self.notify_users(None, datetime.now(DEFAULT_TIMEZONE).date())
 
-        users = self.db.get_all_users()
-        for user_id in users:
-            today_date = now.strftime("%Y-%m-%d")
-            tomorrow_date = tomorrow.strftime("%Y-%m-%d")
+    def reschedule(self, user_id, notify_time, tz):
+        """Переназначение пользователя в очереди и пробуждение планировщика"""
+        self.scheduler.schedule(user_id, notify_time, tz, datetime.now(timezone.utc))
+        self._schedule_changed.set()
 
-            today_event = self.db.get_event(user_id, today_date)
-            tomorrow_event = self.db.get_event(user_id, tomorrow_date)
+    async def load_schedule(self, now=None):
+        """Очередь времён уведомлений из настроек.
 
-            await self.send_notification(user_id, today_event, tomorrow_event, app)
+        Отсчёт идёт от now - catch_up_grace: время, пропущенное за период
+        простоя, сразу оказывается наступившим и попадает в outbox.
+        """
+        now = now or datetime.now(timezone.utc)
+        after = now - self.catch_up_grace
+        self.scheduler.schedule(DEFAULT_GROUP, DEFAULT_TIME, DEFAULT_TIMEZONE, after)
+        for user_id, notify_time, tz_name in await self.db.get_notification_settings():
+            try:
+                tz = ZoneInfo(tz_name)
+            except (ZoneInfoNotFoundError, ValueError):
+                print(f"Неизвестный часовой пояс {tz_name} у пользователя {user_id}")
+                continue
+            self.scheduler.schedule(user_id, time.fromisoformat(notify_time), tz, after)
 
-    async def notification_loop(self):
-        moscow_tz = ZoneInfo("Europe/Moscow")
-        notification_time = time(hour=23, minute=39)
+    async def plan_due(self, now):
+        """Запись в outbox сводок, чей срок наступит в ближайшие plan_ahead.
 
-        while True:
-            now = datetime.now(moscow_tz)
-            next_notification = datetime.combine(
-                now.date(), notification_time, tzinfo=moscow_tz
+        Возвращает False, если часть сводок записать не удалось: их ключи
+        возвращаются в очередь на тот же момент и планируются повторно.
+        """
+        until = now + self.plan_ahead
+        due = self.scheduler.pop_due(until)
+        if not due:
+            return True
+        # Ключи, чьи сводки ещё не записаны в outbox, с моментом срабатывания
+        pending = {key: fire_at for key, _, fire_at in due}
+        try:
+            personal = {}
+            for key, tz, fire_at in due:
+                # Дата сводки - местная дата пользователя в момент срабатывания
+                digest_date = fire_at.astimezone(tz).date().isoformat()
+                if key != DEFAULT_GROUP:
+                    personal.setdefault((digest_date, fire_at), []).append(key)
+                elif (
+                    await self.db.plan_digests(None, digest_date, utc_iso(fire_at))
+                    is not None
+                ):
+                    del pending[key]
+            for (digest_date, fire_at), user_ids in personal.items():
+                if (
+                    await self.db.plan_digests(user_ids, digest_date, utc_iso(fire_at))
+                    is not None
+                ):
+                    for user_id in user_ids:
+                        del pending[user_id]
+        finally:
+            for key, fire_at in pending.items():
+                self.scheduler.restore(key, fire_at, until)
+            self._outbox_changed.set()
+        await self.db.delete_old_digests((now - OUTBOX_HISTORY).date().isoformat())
+        return not pending
+
+    async def deliver_due(self, now):
+        """Отправка наступивших сводок из outbox; возвращает число взятых строк"""
+        await self.db.expire_digests(utc_iso(now - self.catch_up_grace))
+        rows = await self.db.get_due_digests(utc_iso(now), OUTBOX_BATCH)
+        if not rows:
+            return 0
+
+        by_date = {}
+        for outbox_id, user_id, digest_date, attempts in rows:
+            by_date.setdefault(digest_date, []).append((outbox_id, user_id, attempts))
+        with NOTIFICATION_SECONDS.time():
+            for digest_date, items in by_date.items():
+                texts = dict(
+                    await self.build_messages(
+                        [user_id for _, user_id, _ in items],
+                        date.fromisoformat(digest_date),
+                    )
+                )
+                await asyncio.gather(
+                    *(
+                        self._deliver(outbox_id, user_id, texts[user_id], attempts)
+                        for outbox_id, user_id, attempts in items
+                    )
+                )
+        return len(rows)
+
+    async def _deliver(self, outbox_id, user_id, text, attempts):
+        if await self.dispatcher.send_message(user_id, text):
+            # Отметка сразу после отправки: при падении повторится не больше
+            # сводок, чем было в пути
+            await self.db.mark_digest_sent(
+                outbox_id, utc_iso(datetime.now(timezone.utc))
             )
+            return
+        attempts += 1
+        if attempts >= self.max_attempts:
+            ERRORS.inc("notification")
+            next_attempt_at = None
+        else:
+            next_attempt_at = utc_iso(
+                datetime.now(timezone.utc) + self.retry_delay * 2 ** (attempts - 1)
+            )
+        await self.db.retry_digest(outbox_id, next_attempt_at)
 
-            if now > next_notification:
-                next_notification += timedelta(days=1)
+    async def _plan_loop(self):
+        while True:
+            now = datetime.now(timezone.utc)
+            deadline = self.scheduler.next_deadline() - self.plan_ahead
+            delay = (deadline - now).total_seconds()
 
-            delay = (next_notification - now).total_seconds()
-            await asyncio.sleep(delay)
+            if delay > 0:
+                # Спим до ближайшего планирования или до изменения настроек
+                self._schedule_changed.clear()
+                try:
+                    await asyncio.wait_for(self._schedule_changed.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
 
             try:
-                await self.check_and_notify(self.app)
+                if await self.plan_due(now):
+                    continue
             except Exception as e:
+                print(f"Ошибка при планировании уведомлений: {e}")
+            ERRORS.inc("notification")
+            # Несработавшие ключи уже в очереди на прежний момент
+            await asyncio.sleep(self.retry_delay.total_seconds())
+
+    async def _outbox_loop(self):
+        while True:
+            self._outbox_changed.clear()
+            now = datetime.now(timezone.utc)
+            try:
+                if await self.deliver_due(now):
+                    continue
+            except Exception as e:
+                ERRORS.inc("notification")
                 print(f"Ошибка при отправке уведомлений: {e}")
+                await asyncio.sleep(self.retry_delay.total_seconds())
+                continue
+
+            # Спим до ближайшей попытки или до новых строк в outbox
+            next_attempt = await self.db.get_next_digest_time()
+            delay = None
+            if next_attempt is not None:
+                delay = (datetime.fromisoformat(next_attempt) - now).total_seconds()
+            try:
+                await asyncio.wait_for(self._outbox_changed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def notification_loop(self):
+        await self.load_schedule()
+        await asyncio.gather(self._plan_loop(), self._outbox_loop())
+
+    async def notify_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id = update.effective_user.id
+        args = context.args or []
+
+        if not args:
+            settings = await self.db.get_notification_settings(user_id)
+            if settings:
+                _, notify_time, tz_name = settings[0]
+            else:
+                notify_time = DEFAULT_TIME.strftime("%H:%M")
+                tz_name = f"{DEFAULT_TIMEZONE.key}, по умолчанию"
+            await update.message.reply_text(
+                f"Уведомления приходят в {notify_time} ({tz_name}).\n"
+                "Изменить: /notify ЧЧ:ММ [часовой пояс], например /notify 07:30 "
+                "Europe/Moscow\nВернуть время по умолчанию: /notify default"
+            )
+            return
+
+        if args[0] == "default":
+            await self.db.delete_notification_settings(user_id)
+            self.scheduler.remove(user_id)
+            await update.message.reply_text(
+                f"Уведомления будут приходить в {DEFAULT_TIME.strftime('%H:%M')} "
+                f"({DEFAULT_TIMEZONE.key})"
+            )
+            return
+
+        try:
+            notify_time = datetime.strptime(args[0], "%H:%M").time()
+        except ValueError:
+            await update.message.reply_text("Время нужно указать в формате ЧЧ:ММ")
+            return
+        try:
+            tz = ZoneInfo(args[1]) if len(args) > 1 else DEFAULT_TIMEZONE
+        except (ZoneInfoNotFoundError, ValueError):
+            await update.message.reply_text(f"Неизвестный часовой пояс: {args[1]}")
+            return
+
+        time_str = notify_time.strftime("%H:%M")
+        if not await self.db.set_notification_settings(user_id, time_str, tz.key):
+            await update.message.reply_text("Не удалось сохранить настройки")
+            return
+        self.reschedule(user_id, notify_time, tz)
+        await update.message.reply_text(
+            f"Уведомления будут приходить в {time_str} ({tz.key})"
+        )
 
     @classmethod
-    def setup(cls, application, db):
-        notification_instance = cls(application, db)
+    def setup(cls, application, db, catch_up_grace=CATCH_UP_GRACE):
+        notification_instance = cls(application, db, catch_up_grace)
+        application.add_handler(
+            CommandHandler("notify", notification_instance.notify_command)
+        )
         return notification_instance.notification_loop()
@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+DAY = True
+NIGHT = False
+OFF = None
+
+_SYMBOLS = {"Д": DAY, "Н": NIGHT, "-": OFF}
+
+
+class ShiftPattern:
+    """Ротация смен: цикл дней, ночей и выходных, повторяемый от опорной даты.
+
+    Цикл задаётся строкой, где "Д" - дневная смена, "Н" - ночная, "-" - выходной,
+    например "ДДНН----" для графика 2 дня / 2 ночи / 4 выходных.
+    """
+
+    def __init__(self, title, cycle):
+        if not cycle or any(symbol not in _SYMBOLS for symbol in cycle):
+            raise ValueError(f"Некорректный цикл смен: {cycle!r}")
+        self.title = title
+        self.cycle = [_SYMBOLS[symbol] for symbol in cycle]
+
+    def __len__(self):
+        return len(self.cycle)
+
+    def shift_on(self, anchor, date):
+        """Смена в дату date, если цикл начинается в anchor: DAY, NIGHT или OFF"""
+        return self.cycle[(date - anchor).days % len(self.cycle)]
+
+    def project(self, anchor, start, end):
+        """Пары (date, is_day) для всех рабочих дней в диапазоне [start, end]"""
+        date = start
+        while date <= end:
+            shift = self.shift_on(anchor, date)
+            if shift is not OFF:
+                yield date, shift
+            date += timedelta(days=1)
+
+    def find_anchor(self, shifts):
+        """Начало текущего цикла по последним сменам.
+
+        shifts - список (date, is_day) по возрастанию даты. Если типы последних
+        смен совпадают с рабочей частью цикла, цикл отсчитывается так, чтобы
+        последняя смена была последней рабочей сменой цикла. Иначе None.
+        """
+        work_days = [
+            index for index, shift in enumerate(self.cycle) if shift is not OFF
+        ]
+        if len(shifts) < len(work_days):
+            return None
+        tail = shifts[-len(work_days) :]
+        if [bool(is_day) for _, is_day in tail] != [self.cycle[i] for i in work_days]:
+            return None
+        return tail[-1][0] - timedelta(days=work_days[-1])
+
+
+# Графики, которые продолжает кнопка "Заполнить": подходит тот, с рабочей
+# частью которого совпадают последние смены месяца, первый по порядку
+PATTERNS = {
+    "2/2/4": ShiftPattern("2 дня, 2 ночи, 4 выходных", "ДДНН----"),
+    "4/4": ShiftPattern("4 дня через 4", "ДДДД----"),
+    "4н/4": ShiftPattern("4 ночи через 4", "НННН----"),
+    "1/1/2": ShiftPattern("День, ночь, 2 выходных", "ДН--"),
+}
+
+
+def find_pattern(shifts):
+    """График из PATTERNS, продолжающий shifts, и начало его цикла или None"""
+    for pattern in PATTERNS.values():
+        anchor = pattern.find_anchor(shifts)
+        if anchor is not None:
+            return pattern, anchor
+    return None
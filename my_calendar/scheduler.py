@@ -0,0 +1,90 @@
+import heapq
+import itertools
+from datetime import datetime, timedelta, timezone
+
+
+def next_fire_time(notify_time, tz, after):
+    """Ближайший момент (в UTC) после after, когда в поясе tz наступает notify_time.
+
+    Считается через локальную дату, поэтому переходы на летнее/зимнее время
+    не сдвигают уведомление: время из "пропавшего" часа срабатывает сразу
+    после перехода, а из повторяющегося часа - один раз, при первом наступлении.
+    """
+    local_date = after.astimezone(tz).date()
+    while True:
+        candidate = datetime.combine(local_date, notify_time, tzinfo=tz).astimezone(
+            timezone.utc
+        )
+        if candidate > after:
+            return candidate
+        local_date += timedelta(days=1)
+
+
+class NotificationScheduler:
+    """Очередь с приоритетом из ближайших времён уведомлений.
+
+    Ключ - пользователь (или группа пользователей со временем по умолчанию).
+    При переназначении старая запись в куче не удаляется, а считается
+    устаревшей и пропускается при извлечении, поэтому все операции - O(log n).
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}  # ключ -> (время уведомления, часовой пояс, момент в UTC)
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def schedule(self, key, notify_time, tz, after):
+        """Поставить ключ на ближайшее notify_time в поясе tz после момента after"""
+        fire_at = next_fire_time(notify_time, tz, after)
+        self._entries[key] = (notify_time, tz, fire_at)
+        heapq.heappush(self._heap, (fire_at, next(self._counter), key))
+        return fire_at
+
+    def remove(self, key):
+        self._entries.pop(key, None)
+
+    def _drop_stale(self):
+        while self._heap:
+            fire_at, _, key = self._heap[0]
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] == fire_at:
+                return
+            heapq.heappop(self._heap)
+
+    def next_deadline(self):
+        """Ближайший момент срабатывания или None, если очередь пуста"""
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Извлечь все ключи, чьё время наступило, и сразу назначить их на следующий раз.
+
+        Возвращает тройки (ключ, часовой пояс, момент срабатывания в UTC).
+        """
+        due = []
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            fire_at, _, key = heapq.heappop(self._heap)
+            notify_time, tz, _ = self._entries[key]
+            due.append((key, tz, fire_at))
+            self.schedule(key, notify_time, tz, now)
+
+    def restore(self, key, fire_at, now):
+        """Вернуть ключ, извлечённый pop_due(now), на прежний момент fire_at.
+
+        Нужно, если сработавший ключ не удалось обработать. Если ключ с тех
+        пор переназначили или удалили, ничего не меняется.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        notify_time, tz, next_fire_at = entry
+        if next_fire_at != next_fire_time(notify_time, tz, now):
+            return
+        self._entries[key] = (notify_time, tz, fire_at)
+        heapq.heappush(self._heap, (fire_at, next(self._counter), key))
@@ -0,0 +1,85 @@
+from datetime import datetime
+
+from telegram import Update
+from telegram.ext import CommandHandler, ContextTypes
+
+MONTH_NAMES = [
+    "Январь",
+    "Февраль",
+    "Март",
+    "Апрель",
+    "Май",
+    "Июнь",
+    "Июль",
+    "Август",
+    "Сентябрь",
+    "Октябрь",
+    "Ноябрь",
+    "Декабрь",
+]
+
+
+class ShiftStats:
+    """Сколько дневных и ночных смен отработано за месяц и год.
+
+    Ответ строится по shift_stats - до 12 строк на год, без подсчёта смен
+    по events. Администраторы могут пересчитать таблицу целиком и узнать,
+    расходилась ли она со сменами.
+    """
+
+    def __init__(self, db, admin_ids=()):
+        self.db = db
+        self.admin_ids = set(admin_ids)
+
+    @staticmethod
+    def format_year(year, stats, current_month=None):
+        if not stats:
+            return f"За {year} год смен нет."
+        lines = [f"Смены за {year} год:"]
+        total_days = total_nights = 0
+        for month, day_shifts, night_shifts in stats:
+            marker = " ←" if month == current_month else ""
+            lines.append(
+                f"{MONTH_NAMES[month - 1]}: ☼ {day_shifts}, ☽ {night_shifts}{marker}"
+            )
+            total_days += day_shifts
+            total_nights += night_shifts
+        lines.append(
+            f"Всего: {total_days + total_nights} (☼ {total_days}, ☽ {total_nights})"
+        )
+        return "\n".join(lines)
+
+    async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id = update.effective_user.id
+        args = context.args or []
+        now = datetime.now()
+
+        if args and args[0] == "check":
+            if user_id not in self.admin_ids:
+                return
+            mismatched = await self.db.rebuild_stats()
+            if mismatched is None:
+                await update.message.reply_text("Не удалось пересчитать статистику")
+            else:
+                await update.message.reply_text(
+                    f"Статистика пересчитана, расходилось месяцев: {mismatched}"
+                )
+            return
+
+        year = now.year
+        if args:
+            try:
+                year = int(args[0])
+            except ValueError:
+                await update.message.reply_text("Год нужно указать числом: /stats 2024")
+                return
+
+        stats = await self.db.get_year_stats(user_id, year)
+        current_month = now.month if year == now.year else None
+        await update.message.reply_text(self.format_year(year, stats, current_month))
+
+    @classmethod
+    def setup(cls, application, db, admin_ids=()):
+        stats_instance = cls(db, admin_ids)
+        application.add_handler(CommandHandler("stats", stats_instance.stats_command))
+        return stats_instance
@@ -0,0 +1,153 @@
+import secrets
+from datetime import date, datetime, timedelta
+
+from telegram import Update
+from telegram.ext import CommandHandler, ContextTypes
+
+from my_calendar.cache import LRUCache
+from my_calendar.importer import parse_date
+
+WEEK_DAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+# Сообщение Telegram ограничено 4096 символами
+MAX_MESSAGE_LENGTH = 4096
+
+
+class Teams:
+    """Бригады и просмотр "кто на смене" по дням.
+
+    Состав смены бригады на дату кэшируется. Запись смен любого
+    пользователя сбрасывает кэш за его месяц у всех бригад, изменение
+    состава бригады - весь кэш: и то и другое редко по сравнению с чтением.
+    """
+
+    def __init__(self, db, cache_size=4096):
+        self.db = db
+        # (team_id, дата) -> ([имена днём], [имена ночью]), тег - (год, месяц)
+        self.cache = LRUCache(cache_size)
+        db.add_write_listener(self._invalidate_month)
+
+    def _invalidate_month(self, user_id, year, month):
+        self.cache.invalidate((year, month))
+
+    async def on_shift(self, team_id, first_day, days=1):
+        """Состав смен бригады на days дней с first_day: [(дата, днём, ночью)]"""
+        dates = [first_day + timedelta(days=i) for i in range(days)]
+        result = {}
+        missing = []
+        for day in dates:
+            shifts = self.cache.get((team_id, day))
+            if shifts is None:
+                missing.append(day)
+            else:
+                result[day] = shifts
+
+        if missing:
+            # Недостающие даты читаются одним запросом по диапазону
+            generation = self.cache.generation
+            loaded = {day: ([], []) for day in missing}
+            rows = await self.db.get_team_shifts(
+                team_id, missing[0].isoformat(), missing[-1].isoformat()
+            )
+            for day, is_day, _, name in rows:
+                shifts = loaded.get(date.fromisoformat(day))
+                if shifts is not None:
+                    shifts[0 if is_day else 1].append(name)
+            for day, shifts in loaded.items():
+                self.cache.put(
+                    (team_id, day), shifts, (day.year, day.month), generation
+                )
+            result.update(loaded)
+
+        return [(day, *result[day]) for day in dates]
+
+    @staticmethod
+    def format_shifts(name, shifts):
+        lines = [f"Бригада «{name}»"]
+        for day, day_names, night_names in shifts:
+            lines.append(f"{WEEK_DAYS[day.weekday()]} {day.strftime('%d.%m')}")
+            lines.append(f"☼ {', '.join(day_names) or '—'}")
+            lines.append(f"☽ {', '.join(night_names) or '—'}")
+        return "\n".join(lines)
+
+    async def team_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user_id = update.effective_user.id
+        member_name = update.effective_user.full_name
+        args = context.args or []
+
+        if not args:
+            teams = await self.db.get_user_teams(user_id)
+            text = "".join(f"• {name}, код {code}\n" for _, name, code in teams)
+            await update.message.reply_text(
+                (text or "Вы не состоите в бригадах.\n")
+                + "Создать: /team new Название\n"
+                "Вступить: /team join КОД\n"
+                "Выйти: /team leave КОД\n"
+                "Кто на смене: /onshift [ДД.ММ.ГГГГ | week]"
+            )
+            return
+
+        if args[0] == "new" and len(args) > 1:
+            name = " ".join(args[1:])
+            code = secrets.token_hex(4)
+            team_id = await self.db.create_team(name, code, user_id, member_name)
+            if team_id is None:
+                await update.message.reply_text("Не удалось создать бригаду")
+                return
+            self.cache.clear()
+            await update.message.reply_text(
+                f"Бригада «{name}» создана. Код для вступления: {code}"
+            )
+        elif args[0] == "join" and len(args) == 2:
+            team = await self.db.join_team(args[1], user_id, member_name)
+            if team is None:
+                await update.message.reply_text("Бригады с таким кодом нет")
+                return
+            self.cache.clear()
+            await update.message.reply_text(f"Вы в бригаде «{team[1]}»")
+        elif args[0] == "leave" and len(args) == 2:
+            if not await self.db.leave_team(args[1], user_id):
+                await update.message.reply_text("Вы не состоите в этой бригаде")
+                return
+            self.cache.clear()
+            await update.message.reply_text("Вы вышли из бригады")
+        else:
+            await update.message.reply_text("Не понял команду, см. /team")
+
+    async def on_shift_command(
+        self, update: Update, context: ContextTypes.DEFAULT_TYPE
+    ):
+        user_id = update.effective_user.id
+        args = context.args or []
+
+        first_day = datetime.now().date()
+        days = 1
+        if args and args[0] == "week":
+            first_day -= timedelta(days=first_day.weekday())
+            days = 7
+        elif args:
+            iso_date = parse_date(args[0])
+            if iso_date is None:
+                await update.message.reply_text(
+                    "Дату нужно указать в формате ДД.ММ.ГГГГ"
+                )
+                return
+            first_day = date.fromisoformat(iso_date)
+
+        teams = await self.db.get_user_teams(user_id)
+        if not teams:
+            await update.message.reply_text("Вы не состоите в бригадах, см. /team")
+            return
+        parts = [
+            self.format_shifts(name, await self.on_shift(team_id, first_day, days))
+            for team_id, name, _ in teams
+        ]
+        await update.message.reply_text("\n\n".join(parts)[:MAX_MESSAGE_LENGTH])
+
+    @classmethod
+    def setup(cls, application, db):
+        teams_instance = cls(db)
+        application.add_handler(CommandHandler("team", teams_instance.team_command))
+        application.add_handler(
+            CommandHandler("onshift", teams_instance.on_shift_command)
+        )
+        return teams_instance
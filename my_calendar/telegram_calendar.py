@@ -1,29 +1,83 @@
+import asyncio
 import calendar
-from datetime import datetime
+import functools
+from datetime import date, datetime, timedelta
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import CallbackQueryHandler, MessageHandler, filters, ContextTypes
 
+from my_calendar.cache import LRUCache
+from my_calendar.callback_codec import decode_callback, encode_callback
+from my_calendar.patterns import find_pattern
+from server.metrics import (
+    CALLBACK_SECONDS,
+    COALESCED_EDITS,
+    ERRORS,
+    NOT_MODIFIED,
+    SKIPPED_EDITS,
+    TELEGRAM_SECONDS,
+)
+
+# Пустые кнопки: заголовок, дни недели и дни соседних месяцев
+IGNORE = encode_callback("ignore")
+
 
 class Calendar:
-    def __init__(self, db):
+    def __init__(self, db, cache_size=1024):
         self.db = db
-
-    def create_calendar(self, user_id, year, month):
+        # Готовые клавиатуры месяцев: пользователи листают одни и те же 2-3 месяца
+        self.markup_cache = LRUCache(cache_size)
+        # Последние текст и разметка каждого сообщения календаря:
+        # одинаковая правка не отправляется в Telegram
+        self.sent_messages = LRUCache(cache_size)
+        # Экран, ждущий отправки, и задача, отправляющая правки сообщения
+        self._pending_edits = {}
+        self._edit_tasks = {}
+        # Обработчики кнопок по действию из callback_data
+        self._handlers = {
+            "ignore": self._on_ignore,
+            "day": self._on_day,
+            "add_day": functools.partial(self._on_add_shift, is_day=True),
+            "add_night": functools.partial(self._on_add_shift, is_day=False),
+            "delete_event": self._on_delete_event,
+            "cancel": self._on_cancel,
+            "prev": functools.partial(self._on_navigate, step=-1),
+            "next": functools.partial(self._on_navigate, step=1),
+            "fill_month": functools.partial(self._on_fill, to_year_end=False),
+            "fill_year": functools.partial(self._on_fill, to_year_end=True),
+            "clear_events": self._on_clear_events,
+        }
+        db.add_write_listener(self._invalidate_month)
+
+    def _invalidate_month(self, user_id, year, month):
+        self.markup_cache.invalidate((user_id, year, month))
+
+    async def create_calendar(self, user_id, year, month):
         now = datetime.now()
         today = now.day
 
+        # Отметка текущего дня меняется в полночь, поэтому дата входит в ключ
+        cache_key = (user_id, year, month, now.date())
+        markup = self.markup_cache.get(cache_key)
+        if markup is not None:
+            return markup
+        generation = self.markup_cache.generation
+
+        # Все смены месяца из битовой карты в памяти: {день: is_day}
+        events = await self.db.shifts.get_month_events(user_id, year, month)
+
         markup = [
             [
                 InlineKeyboardButton(
-                    f"{calendar.month_name[month]} {year}", callback_data="ignore"
+                    f"{calendar.month_name[month]} {year}", callback_data=IGNORE
                 )
             ]
         ]
 
         week_days = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
         markup.append(
-            [InlineKeyboardButton(day, callback_data="ignore") for day in week_days]
+            [InlineKeyboardButton(day, callback_data=IGNORE) for day in week_days]
         )
 
         # Получаем первый день недели для текущего месяца (0 - понедельник, 6 - воскресенье)
@@ -38,12 +92,11 @@ class Calendar:
         row = []
         for i in range(first_day_of_month):
             prev_day = days_in_prev_month - first_day_of_month + i + 1
-            row.append(InlineKeyboardButton(str(prev_day), callback_data="ignore"))
+            row.append(InlineKeyboardButton(str(prev_day), callback_data=IGNORE))
 
         # Заполняем дни текущего месяца
         for day in range(1, calendar.monthrange(year, month)[1] + 1):
-            date = f"{year}-{month:02d}-{day:02d}"
-            event = self.db.get_event(user_id, date)
+            event = events.get(day)
 
             display_day = str(day)
             symbol = ""
@@ -57,7 +110,8 @@ class Calendar:
             display_text = f"{display_day}{symbol}"
             row.append(
                 InlineKeyboardButton(
-                    display_text, callback_data=f"day_{year}_{month}_{day}"
+                    display_text,
+                    callback_data=encode_callback("day", year, month, day),
                 )
             )
 
@@ -69,57 +123,98 @@ class Calendar:
             next_month_day = 1
             while len(row) < 7:
                 row.append(
-                    InlineKeyboardButton(str(next_month_day), callback_data="ignore")
+                    InlineKeyboardButton(str(next_month_day), callback_data=IGNORE)
                 )
                 next_month_day += 1
             markup.append(row)
 
-        # Проверяем последние 4 события
-        last_four_events = self.db.get_last_four_events(user_id, year, month)
-
-        if last_four_events == [0, 0, 1, 1]:
-            markup.append(
-                [
-                    InlineKeyboardButton(
-                        "Заполнить до конца месяца?",
-                        callback_data=f"fill_month_{year}_{month}",
-                    )
-                ]
-            )
+        # Если последние смены месяца складываются в один из графиков,
+        # предлагаем продолжить его
+        if self._fill_anchor(events, year, month) is not None:
+            # 2 дня + 2 ночи + 4 пропуска = 8 дней (минимум)
+            if calendar.monthrange(year, month)[1] - max(events) >= 6:
+                markup.append(
+                    [
+                        InlineKeyboardButton(
+                            "Заполнить до конца месяца?",
+                            callback_data=encode_callback("fill_month", year, month),
+                        )
+                    ]
+                )
+            if month < 12:
+                markup.append(
+                    [
+                        InlineKeyboardButton(
+                            "Заполнить до конца года?",
+                            callback_data=encode_callback("fill_year", year, month),
+                        )
+                    ]
+                )
 
-            # Кнопка удаления
-        all_events = self.db.get_events(user_id, year, month)
-        print(all_events)
-        if all_events:
+        # Кнопка удаления
+        if events:
             markup.append(
                 [
                     InlineKeyboardButton(
                         "Очистить смены за месяц",
-                        callback_data=f"clear_events_{year}_{month}",
+                        callback_data=encode_callback("clear_events", year, month),
                     )
                 ]
             )
 
         markup.append(
             [
-                InlineKeyboardButton("<<", callback_data=f"prev_{year}_{month}"),
-                InlineKeyboardButton(">>", callback_data=f"next_{year}_{month}"),
+                InlineKeyboardButton(
+                    "<<", callback_data=encode_callback("prev", year, month)
+                ),
+                InlineKeyboardButton(
+                    ">>", callback_data=encode_callback("next", year, month)
+                ),
             ]
         )
 
-        return InlineKeyboardMarkup(markup)
+        reply_markup = InlineKeyboardMarkup(markup)
+        self.markup_cache.put(
+            cache_key, reply_markup, (user_id, year, month), generation
+        )
+        return reply_markup
+
+    @staticmethod
+    def _fill_anchor(events, year, month):
+        """График по последним сменам месяца и начало его цикла или None"""
+        shifts = [(date(year, month, day), events[day]) for day in sorted(events)]
+        return find_pattern(shifts)
+
+    @classmethod
+    def _fill_shifts(cls, events, year, month, to_year_end=False):
+        """Смены (date, is_day) от последней смены месяца до конца месяца или года"""
+        found = cls._fill_anchor(events, year, month)
+        if found is None:
+            return None
+        pattern, anchor = found
+        start = date(year, month, max(events)) + timedelta(days=1)
+        if to_year_end:
+            end = date(year, 12, 31)
+        else:
+            end = date(year, month, calendar.monthrange(year, month)[1])
+        return [
+            (day.isoformat(), is_day)
+            for day, is_day in pattern.project(anchor, start, end)
+        ]
 
-    def create_day_night_keyboard(self, user_id, year, month, day):
+    async def create_day_night_keyboard(self, user_id, year, month, day):
         date = f"{year}-{month:02d}-{day:02d}"
-        event = self.db.get_event(user_id, date)
+        event = await self.db.shifts.get_event(user_id, date)
 
         keyboard = [
             [
                 InlineKeyboardButton(
-                    "☀️ День", callback_data=f"add_day_{year}_{month}_{day}"
+                    "☀️ День",
+                    callback_data=encode_callback("add_day", year, month, day),
                 ),
                 InlineKeyboardButton(
-                    "🌙 Ночь", callback_data=f"add_night_{year}_{month}_{day}"
+                    "🌙 Ночь",
+                    callback_data=encode_callback("add_night", year, month, day),
                 ),
             ]
         ]
@@ -130,150 +225,180 @@ class Calendar:
                 [
                     InlineKeyboardButton(
                         "❌ Удалить смену",
-                        callback_data=f"delete_event_{year}_{month}_{day}",
+                        callback_data=encode_callback("delete_event", year, month, day),
                     )
                 ]
             )
 
         keyboard.append(
-            [InlineKeyboardButton("Отмена", callback_data=f"cancel_{year}_{month}")]
+            [
+                InlineKeyboardButton(
+                    "Отмена", callback_data=encode_callback("cancel", year, month)
+                )
+            ]
         )
         return InlineKeyboardMarkup(keyboard)
 
+    @staticmethod
+    def _message_key(query):
+        if query.inline_message_id:
+            return query.inline_message_id
+        if query.message is not None:
+            return query.message.chat.id, query.message.message_id
+        return None
+
+    def _remember_message(self, key, text, reply_markup):
+        self.sent_messages.put(
+            key, (text, reply_markup), key, self.sent_messages.generation
+        )
+
     async def edit_message(self, query, text, reply_markup):
+        """Правка сообщения; если текст и разметка не изменились, запроса нет"""
+        key = self._message_key(query)
+        if key is not None and self.sent_messages.get(key) == (text, reply_markup):
+            SKIPPED_EDITS.inc()
+            return
         try:
-            await query.edit_message_text(text, reply_markup=reply_markup)
+            with TELEGRAM_SECONDS.time("edit_message_text"):
+                await query.edit_message_text(text, reply_markup=reply_markup)
         except Exception as e:
-            print(f"Error editing message: {e}")
-            await query.edit_message_reply_markup(reply_markup=reply_markup)
+            if isinstance(e, BadRequest) and "not modified" in e.message.lower():
+                # Сообщение уже такое: правка одной разметки тоже не пройдёт
+                NOT_MODIFIED.inc()
+            else:
+                ERRORS.inc("edit_message")
+                print(f"Error editing message: {e}")
+                with TELEGRAM_SECONDS.time("edit_message_reply_markup"):
+                    await query.edit_message_reply_markup(reply_markup=reply_markup)
+        if key is not None:
+            self._remember_message(key, text, reply_markup)
+
+    async def show(self, query, text, render):
+        """Показ экрана в сообщении query; render() строит его разметку.
+
+        Правки одного сообщения идут по очереди в фоне. Пока правка в пути,
+        новые экраны не рисуются, а заменяют друг друга, и после неё
+        отправляется только последний: серия быстрых "<<"/">>" стоит одной-двух
+        правок, а обработчик нажатия не ждёт ответа Telegram.
+        """
+        key = self._message_key(query)
+        if key is None:
+            await self.edit_message(query, text, await render())
+            return
+        if key in self._pending_edits:
+            COALESCED_EDITS.inc()
+        self._pending_edits[key] = (query, text, render)
+        if key not in self._edit_tasks:
+            self._edit_tasks[key] = asyncio.create_task(self._send_edits(key))
+
+    async def show_month(self, query, user_id, year, month):
+        await self.show(
+            query,
+            "Когда на завод?",
+            lambda: self.create_calendar(user_id, year, month),
+        )
+
+    async def _send_edits(self, key):
+        try:
+            while key in self._pending_edits:
+                query, text, render = self._pending_edits.pop(key)
+                try:
+                    await self.edit_message(query, text, await render())
+                except Exception as e:
+                    ERRORS.inc("edit_message")
+                    print(f"Error editing message: {e}")
+        finally:
+            del self._edit_tasks[key]
+
+    async def wait_edits(self):
+        """Ожидание отправки всех отложенных правок"""
+        while self._edit_tasks:
+            await asyncio.gather(*self._edit_tasks.values())
 
     async def calendar_command(
         self, update: Update, context: ContextTypes.DEFAULT_TYPE
     ):
         now = datetime.now()
         user_id = update.effective_user.id
-        await update.message.reply_text(
-            "Когда на завод?",
-            reply_markup=self.create_calendar(user_id, now.year, now.month),
+        reply_markup = await self.create_calendar(user_id, now.year, now.month)
+        message = await update.message.reply_text(
+            "Когда на завод?", reply_markup=reply_markup
+        )
+        self._remember_message(
+            (message.chat.id, message.message_id), "Когда на завод?", reply_markup
         )
 
     async def calendar_callback(self, update: Update, context):
         query = update.callback_query
-        user_id = query.from_user.id
-
-        if query.data.startswith("day"):
-            _, year, month, day = query.data.split("_")
-            year, month, day = int(year), int(month), int(day)
-            await self.edit_message(
-                query,
-                f"{day}.{month}.{year} смена в ",
-                self.create_day_night_keyboard(user_id, year, month, day),
-            )
-            return
-
-        if query.data.startswith("add_day") or query.data.startswith("add_night"):
-            _, is_day, year, month, day = query.data.split("_")
-            year, month, day = int(year), int(month), int(day)
-            date = f"{year}-{month:02d}-{day:02d}"
-            self.db.add_event(user_id, date, is_day == "day")
-            event_type = "Дневной" if is_day == "day" else "Ночной"
-            await query.answer(f"{event_type} завод будет {day}.{month}.{year}")
-            await self.edit_message(
-                query, "Когда на завод?", self.create_calendar(user_id, year, month)
-            )
-            return
-
-        if query.data.startswith("clear_events"):
-            parts = query.data.split("_")
-            if len(parts) == 4:
-                _, _, year, month = parts
-                year, month = int(year), int(month)
-                self.db.delete_events_for_month(user_id, year, month)
-                await query.answer(f"Удалено")
-                await self.edit_message(
-                    query, "Когда на завод?", self.create_calendar(user_id, year, month)
-                )
-                return
-            else:
-                await query.answer("Ошибка: неверный формат данных.")
-                return
-
-        if query.data.startswith("fill_month"):
-            parts = query.data.split("_")
-            if len(parts) == 4:
-                _, _, year, month = parts
-                year, month = int(year), int(month)
-
-                # Заполняем оставшиеся дни месяца по шаблону: 4 пропуска, 2 дня, 2 ночи
-                num_days = calendar.monthrange(year, month)[1]
-                last_event = self.db.get_last_event(user_id, year, month)
-                last_event_date = datetime.strptime(last_event[1], "%Y-%m-%d")
-                day_counter = last_event_date.day + 5
-                skip_counter = 4  # Изначально пропускаем 4 дня
-
-                while day_counter <= num_days:
-                    if skip_counter < 4:
-                        skip_counter += 1
-                    elif skip_counter < 6:
-                        date = f"{year}-{month:02d}-{day_counter:02d}"
-                        self.db.add_event(user_id, date, True)  # True - дневное событие
-                        skip_counter += 1
-                    elif skip_counter < 8:
-                        date = f"{year}-{month:02d}-{day_counter:02d}"
-                        self.db.add_event(user_id, date, False)
-                        skip_counter += 1
-                        if skip_counter == 8:
-                            skip_counter = 0
-                    else:
-                        skip_counter = 0
-
-                    day_counter += 1
-
-                await query.answer("Месяц заполнен по шаблону.")
-                await self.edit_message(
-                    query, "Когда на завод?", self.create_calendar(user_id, year, month)
-                )
-                return
-            else:
-                await query.answer("Ошибка: неверный формат данных.")
+        callback = decode_callback(query.data or "")
+        # Данные чужого формата попадают в метрики как "other"
+        with CALLBACK_SECONDS.time(callback[0] if callback else "other"):
+            if callback is None:
+                await query.answer("Кнопка устарела, откройте календарь заново")
                 return
+            action, year, month, day = callback
+            handler = self._handlers[action]
+            await handler(query, query.from_user.id, year, month, day)
+
+    async def _on_ignore(self, query, user_id, year, month, day):
+        await query.answer()
+
+    async def _on_day(self, query, user_id, year, month, day):
+        await self.show(
+            query,
+            f"{day}.{month}.{year} смена в ",
+            lambda: self.create_day_night_keyboard(user_id, year, month, day),
+        )
 
-        if query.data.startswith("delete_event"):
-            _, _, year, month, day = query.data.split("_")
-            year, month, day = int(year), int(month), int(day)
-            date = f"{year}-{month:02d}-{day:02d}"
-            if self.db.delete_event(user_id, date):
-                await query.answer(f"Завод на {day}.{month}.{year} удален.")
-            else:
-                await query.answer(f"Завода на {day}.{month}.{year} не найдено.")
-            await self.edit_message(
-                query, "Когда на завод?", self.create_calendar(user_id, year, month)
-            )
+    async def _on_add_shift(self, query, user_id, year, month, day, is_day):
+        date = f"{year}-{month:02d}-{day:02d}"
+        await self.db.add_event(user_id, date, is_day)
+        event_type = "Дневной" if is_day else "Ночной"
+        await query.answer(f"{event_type} завод будет {day}.{month}.{year}")
+        await self.show_month(query, user_id, year, month)
+
+    async def _on_clear_events(self, query, user_id, year, month, day):
+        await self.db.delete_events_for_month(user_id, year, month)
+        await query.answer(f"Удалено")
+        await self.show_month(query, user_id, year, month)
+
+    async def _on_fill(self, query, user_id, year, month, day, to_year_end):
+        # Продолжаем график с последней смены месяца до конца месяца или года
+        events = await self.db.shifts.get_month_events(user_id, year, month)
+        shifts = self._fill_shifts(events, year, month, to_year_end=to_year_end)
+        if shifts is None:
+            await query.answer("Нечего заполнять.")
             return
+        # Все смены пишутся одной транзакцией; уже отмеченные дни в
+        # следующих месяцах не перезаписываются
+        written = await self.db.add_events(user_id, shifts, replace=False)
 
-        if query.data.startswith("prev") or query.data.startswith("next"):
-            _, year, month = query.data.split("_")
-            year, month = int(year), int(month)
-            if query.data.startswith("prev"):
-                month -= 1
-                if month < 1:
-                    month = 12
-                    year -= 1
-            else:  # next
-                month += 1
-                if month > 12:
-                    month = 1
-                    year += 1
-        elif query.data.startswith("cancel"):
-            _, year, month = query.data.split("_")
-            year, month = int(year), int(month)
-        else:
-            await query.answer()
-            return
+        text = "Год заполнен по шаблону" if to_year_end else "Месяц заполнен по шаблону"
+        if written < len(shifts):
+            text += ", отмеченные раньше дни не изменены"
+        await query.answer(text + ".")
+        await self.show_month(query, user_id, year, month)
 
-        await self.edit_message(
-            query, "Когда на завод?", self.create_calendar(user_id, year, month)
-        )
+    async def _on_delete_event(self, query, user_id, year, month, day):
+        date = f"{year}-{month:02d}-{day:02d}"
+        if await self.db.delete_event(user_id, date):
+            await query.answer(f"Завод на {day}.{month}.{year} удален.")
+        else:
+            await query.answer(f"Завода на {day}.{month}.{year} не найдено.")
+        await self.show_month(query, user_id, year, month)
+
+    async def _on_cancel(self, query, user_id, year, month, day):
+        await self.show_month(query, user_id, year, month)
+
+    async def _on_navigate(self, query, user_id, year, month, day, step):
+        month += step
+        if month < 1:
+            month = 12
+            year -= 1
+        elif month > 12:
+            month = 1
+            year += 1
+        await self.show_month(query, user_id, year, month)
 
     @classmethod
     def setup(cls, application, db):
@@ -287,3 +412,4 @@ class Calendar:
         application.add_handler(
             CallbackQueryHandler(calendar_instance.calendar_callback)
         )
+        return calendar_instance
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+from collections import deque
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений разных пользователей.
+
+    Обновления одного пользователя выполняются строго по очереди в порядке
+    поступления, поэтому два нажатия (например, fill_month и clear_events)
+    не гоняются внутри calendar_callback. Обновление, ждущее своей очереди,
+    не занимает общий слот: одновременно выполняется не больше
+    max_concurrent_updates обработчиков, а ждущие лежат в очереди пользователя.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self._queues = {}  # ключ пользователя -> очередь корутин
+        self._workers = set()
+        self._running = None
+
+    @staticmethod
+    def _key(update):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(coroutine)
+            return
+
+        self._queues[key] = deque([coroutine])
+        worker = asyncio.create_task(self._drain(key))
+        self._workers.add(worker)
+        worker.add_done_callback(self._workers.discard)
+
+    async def _drain(self, key):
+        queue = self._queues[key]
+        try:
+            while queue:
+                coroutine = queue.popleft()
+                async with self._running:
+                    try:
+                        await coroutine
+                    except Exception as e:
+                        # Ошибка одного обновления не должна останавливать очередь
+                        logger.error(f"Ошибка обработки обновления: {e}")
+        finally:
+            del self._queues[key]
+
+    async def initialize(self):
+        self._running = asyncio.Semaphore(self.max_concurrent_updates)
+
+    async def join(self):
+        """Дожидается обработки всех уже принятых обновлений.
+
+        do_process_update только ставит обновление в очередь пользователя,
+        поэтому Application.stop() этих обновлений не ждёт, а shutdown()
+        вызывается уже после закрытия бота. Вызывать между app.stop() и
+        app.shutdown(), пока бот ещё может отвечать.
+        """
+        while self._workers:
+            await asyncio.gather(*self._workers)
+
+    async def shutdown(self):
+        await self.join()
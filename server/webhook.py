@@ -0,0 +1,204 @@
+import asyncio
+import hmac
+import json
+import logging
+
+from telegram import Update
+
+from server.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 1024 * 1024
+MAX_HEADERS = 100
+# Сколько ждать следующего запроса в keep-alive соединении и сколько -
+# заголовков и тела начатого запроса
+IDLE_TIMEOUT = 60
+READ_TIMEOUT = 10
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    408: "Request Timeout",
+    413: "Payload Too Large",
+}
+
+
+class WebhookServer:
+    """Приём обновлений Telegram по webhook вместо long polling.
+
+    Минимальный HTTP/1.1-сервер на asyncio: принимает POST с JSON обновления
+    на url_path, проверяет заголовок X-Telegram-Bot-Api-Secret-Token и кладёт
+    обновление прямо в очередь Application. Без секрета сервер не
+    запускается: права администратора определяются по from_user.id из
+    обновления, и поддельный POST выдал бы их кому угодно.
+
+    Одновременно обрабатывается не больше max_connections запросов на
+    url_path (столько же соединений просим у Telegram). Слот занимает
+    запрос, а не соединение: простаивающие keep-alive соединения его не
+    держат и закрываются через idle_timeout, недочитанный запрос
+    обрывается через read_timeout. Если задан metrics_path, по GET на него
+    отдаются метрики для Prometheus, эти запросы слоты Telegram не занимают.
+    Сервер слушает тот же публичный порт, что и Telegram, поэтому метрики
+    отдаются только с заголовком Authorization: Bearer <metrics_token>
+    (bearer_token в scrape_config Prometheus).
+    """
+
+    def __init__(
+        self,
+        application,
+        listen="127.0.0.1",
+        port=8080,
+        url_path="/telegram",
+        secret_token=None,
+        max_connections=40,
+        metrics_path=None,
+        metrics_token=None,
+        idle_timeout=IDLE_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+    ):
+        if not secret_token:
+            raise ValueError("Для webhook нужен secret_token")
+        if metrics_path is not None and not metrics_token:
+            raise ValueError("Для метрик в webhook нужен metrics_token")
+        self.app = application
+        self.listen = listen
+        self.port = port
+        self.url_path = url_path
+        self.secret_token = secret_token
+        self.max_connections = max_connections
+        self.metrics_path = metrics_path
+        self.metrics_token = metrics_token
+        self.idle_timeout = idle_timeout
+        self.read_timeout = read_timeout
+        self._slots = asyncio.Semaphore(max_connections)
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.listen, self.port
+        )
+        # При port=0 система выбирает свободный порт
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Webhook слушает {self.listen}:{self.port}{self.url_path}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            # Telegram держит соединение открытым и шлёт обновления подряд
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(
+                        reader.readline(), self.idle_timeout
+                    )
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                method, path, version = request_line.decode("latin-1").split()
+                if path == self.url_path:
+                    async with self._slots:
+                        keep_alive = await self._serve(
+                            reader, writer, method, path, version
+                        )
+                else:
+                    keep_alive = await self._serve(
+                        reader, writer, method, path, version
+                    )
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ValueError):
+            self._write_response(writer, 400, False)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _serve(self, reader, writer, method, path, version):
+        """Дочитывание и обработка одного запроса; возвращает keep-alive"""
+        try:
+            headers, body = await asyncio.wait_for(
+                self._read_request(reader), self.read_timeout
+            )
+        except asyncio.TimeoutError:
+            self._write_response(writer, 408, False)
+            return False
+        status, keep_alive, *body = await self._process(
+            method, path, version, headers, body
+        )
+        self._write_response(writer, status, keep_alive, *body)
+        await writer.drain()
+        return keep_alive
+
+    @staticmethod
+    async def _read_request(reader):
+        headers = {}
+        for _ in range(MAX_HEADERS):
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise ValueError("Слишком много заголовков")
+
+        length = int(headers.get("content-length", 0))
+        if length > MAX_BODY_SIZE:
+            return headers, None
+        body = await reader.readexactly(length)
+        return headers, body
+
+    async def _process(self, method, path, version, headers, body):
+        keep_alive = (
+            version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        )
+        if self.metrics_path is not None and path == self.metrics_path:
+            if method != "GET":
+                return 405, keep_alive
+            if not hmac.compare_digest(
+                headers.get("authorization", "").encode("latin-1"),
+                f"Bearer {self.metrics_token}".encode("utf-8"),
+            ):
+                return 403, keep_alive
+            return 200, keep_alive, metrics.render().encode("utf-8")
+        if path != self.url_path:
+            return 404, keep_alive
+        if method != "POST":
+            return 405, keep_alive
+        if not hmac.compare_digest(
+            headers.get("x-telegram-bot-api-secret-token", "").encode("latin-1"),
+            self.secret_token.encode("utf-8"),
+        ):
+            return 403, keep_alive
+        if body is None:
+            return 413, False
+
+        try:
+            update = Update.de_json(json.loads(body), self.app.bot)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Некорректное обновление в webhook: {e}")
+            return 400, keep_alive
+        await self.app.update_queue.put(update)
+        return 200, keep_alive
+
+    @staticmethod
+    def _write_response(writer, status, keep_alive, body=b""):
+        connection = "keep-alive" if keep_alive else "close"
+        content_type = (
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n" if body else ""
+        )
+        writer.write(
+            f"HTTP/1.1 {status} {REASONS[status]}\r\n{content_type}"
+            f"Content-Length: {len(body)}\r\nConnection: {connection}\r\n\r\n".encode(
+                "latin-1"
+            )
+            + body
+        )